@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Cart, CartItem
+from .serializers import cart_items_prefetch
 
 class CartItemInline(admin.TabularInline):
     model = CartItem
@@ -9,9 +10,16 @@ class CartItemInline(admin.TabularInline):
 class CartAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'session_key', 'total_items', 'total_amount', 'created_at']
     list_filter = ['created_at']
+    list_select_related = ['user']
     inlines = [CartItemInline]
 
+    def get_queryset(self, request):
+        # total_items and total_amount read every item and its product
+        return super().get_queryset(request).prefetch_related(cart_items_prefetch())
+
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ['cart', 'product', 'quantity', 'subtotal', 'added_at']
-    list_filter = ['added_at']
\ No newline at end of file
+    list_filter = ['added_at']
+    # The cart column shows the cart's user
+    list_select_related = ['cart__user', 'product']
\ No newline at end of file
@@ -1,7 +1,15 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from .models import Cart, CartItem
 from product_assistant.serializers import ProductSerializer
 
+def cart_items_prefetch():
+    """
+    Prefetch of carts' items with their products, so a cart and its totals
+    serialize with one query however many items it holds
+    """
+    return Prefetch('items', queryset=CartItem.objects.select_related('product__category'))
+
 class CartItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     subtotal = serializers.ReadOnlyField()
@@ -7,4 +7,5 @@ urlpatterns = [
     path('update/<int:item_id>/', views.update_cart_item, name='update-cart-item'),
     path('remove/<int:item_id>/', views.remove_from_cart, name='remove-from-cart'),
     path('clear/', views.clear_cart, name='clear-cart'),
+    path('recommendations/', views.cart_recommendations, name='cart-recommendations'),
 ]
\ No newline at end of file
@@ -1,9 +1,12 @@
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from django.db.models import prefetch_related_objects
 from django.shortcuts import get_object_or_404
 from .models import Cart, CartItem
-from .serializers import CartSerializer, CartItemSerializer
+from .serializers import CartSerializer, CartItemSerializer, cart_items_prefetch
+from product_assistant import bought_together, trending
+from product_assistant.fragments import product_cards_for_ids
 from product_assistant.models import Product
 
 def get_or_create_cart(request):
@@ -22,6 +25,7 @@ def get_or_create_cart(request):
 def get_cart(request):
     """Get current user's cart"""
     cart = get_or_create_cart(request)
+    prefetch_related_objects([cart], cart_items_prefetch())
     serializer = CartSerializer(cart)
     return Response(serializer.data)
 
@@ -57,6 +61,7 @@ def add_to_cart(request):
     if not created:
         cart_item.quantity += quantity
         cart_item.save()
+    trending.record('cart', product.id)
     
     serializer = CartItemSerializer(cart_item)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -80,7 +85,7 @@ def update_cart_item(request, item_id):
                        status=status.HTTP_400_BAD_REQUEST)
     
     cart = get_or_create_cart(request)
-    cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
+    cart_item = get_object_or_404(CartItem.objects.select_related('product__category'), id=item_id, cart=cart)
     
     if quantity == 0:
         cart_item.delete()
@@ -104,4 +109,17 @@ def clear_cart(request):
     """Clear all items from cart"""
     cart = get_or_create_cart(request)
     cart.items.all().delete()
-    return Response({'message': 'Cart cleared'})
\ No newline at end of file
+    return Response({'message': 'Cart cleared'})
+
+@api_view(['GET'])
+def cart_recommendations(request):
+    """Products often ordered together with the ones in the cart; ``?limit=`` sets how many"""
+    try:
+        limit = min(int(request.query_params.get('limit', bought_together.DEFAULT_LIMIT)),
+                    bought_together.list_size())
+    except ValueError:
+        limit = bought_together.DEFAULT_LIMIT
+    
+    cart = get_or_create_cart(request)
+    in_cart = list(cart.items.values_list('product_id', flat=True))
+    return Response(product_cards_for_ids(bought_together.basket_related_ids(in_cart, max(limit, 1))))
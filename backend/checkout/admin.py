@@ -1,9 +1,10 @@
 from django.contrib import admin
-from .models import Order, OrderItem, DeliveryTracking
+from .models import Order, OrderItem, DeliveryTracking, PurchasedProduct
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
+    raw_id_fields = ['product']
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
@@ -16,4 +17,10 @@ class OrderAdmin(admin.ModelAdmin):
 class DeliveryTrackingAdmin(admin.ModelAdmin):
     list_display = ['order', 'tracking_number', 'current_status', 'estimated_delivery']
     list_filter = ['current_status', 'estimated_delivery']
-    search_fields = ['tracking_number', 'order__order_id']
\ No newline at end of file
+    search_fields = ['tracking_number', 'order__order_id']
+
+@admin.register(PurchasedProduct)
+class PurchasedProductAdmin(admin.ModelAdmin):
+    list_display = ['user', 'product', 'order_count', 'last_purchased_at', 'interval_days', 'due_at']
+    search_fields = ['user__username', 'product__name']
+    raw_id_fields = ['user', 'product']
@@ -0,0 +1,130 @@
+"""
+"Buy again" lists: the products a shopper orders, and when they are due.
+
+``PurchasedProduct`` holds one row per shopper and product with the number
+of orders, the last purchase and its quantity, and the typical interval
+between orders. ``record_purchases`` updates the rows of an order's
+products when the order is placed (a couple of queries however long the
+history is). The interval is an exponentially weighted mean of the gaps
+between orders, so a changed dosage shows within a couple of orders;
+orders less than ``MIN_INTERVAL`` apart count as one purchase. The next
+purchase is due one interval after the last, and the list is sorted by it
+in the database. ``rebuild()`` recomputes every row from the order history
+(``manage.py rebuild_buy_again``, and the migration that added the table).
+"""
+from datetime import timedelta
+
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+
+# Weight of the newest gap in the typical interval
+INTERVAL_WEIGHT = 0.5
+
+# Orders closer together than this are one purchase (a forgotten item)
+MIN_INTERVAL = timedelta(days=1)
+
+# Products per response unless ?limit= says otherwise
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Rows written at a time by the rebuild
+BATCH_SIZE = 1000
+
+
+def add_purchase(row, quantity, purchased_at):
+    """Fold one more order of ``quantity`` at ``purchased_at`` into ``row``"""
+    gap = purchased_at - row.last_purchased_at
+    if gap >= MIN_INTERVAL:
+        row.order_count += 1
+        days = gap / timedelta(days=1)
+        if row.interval_days is None:
+            row.interval_days = days
+        else:
+            row.interval_days = INTERVAL_WEIGHT * days + (1 - INTERVAL_WEIGHT) * row.interval_days
+        row.last_quantity = quantity
+    else:
+        row.last_quantity += quantity
+    row.total_quantity += quantity
+    row.last_purchased_at = max(row.last_purchased_at, purchased_at)
+    row.due_at = (
+        row.last_purchased_at + timedelta(days=row.interval_days) if row.interval_days is not None else None
+    )
+
+
+def new_row(model, user_id, product_id, quantity, purchased_at):
+    return model(
+        user_id=user_id, product_id=product_id, order_count=1, total_quantity=quantity,
+        last_quantity=quantity, first_purchased_at=purchased_at, last_purchased_at=purchased_at,
+    )
+
+
+def record_purchases(user, quantities, purchased_at):
+    """Update a shopper's rows with an order; ``quantities`` maps product ids to quantities"""
+    try:
+        _record_purchases(user, quantities, purchased_at)
+    except IntegrityError:
+        # A concurrent order created one of the rows first; they exist now
+        _record_purchases(user, quantities, purchased_at)
+
+
+def _record_purchases(user, quantities, purchased_at):
+    from .models import PurchasedProduct
+
+    # A savepoint inside the order's transaction, so a conflict can be retried
+    with transaction.atomic():
+        rows = {
+            row.product_id: row
+            for row in PurchasedProduct.objects.select_for_update().filter(user=user, product_id__in=quantities)
+        }
+        for product_id, row in rows.items():
+            add_purchase(row, quantities[product_id], purchased_at)
+        PurchasedProduct.objects.bulk_update(
+            rows.values(),
+            ['order_count', 'total_quantity', 'last_quantity', 'last_purchased_at', 'interval_days', 'due_at'],
+        )
+        PurchasedProduct.objects.bulk_create(
+            new_row(PurchasedProduct, user.pk, product_id, quantity, purchased_at)
+            for product_id, quantity in quantities.items() if product_id not in rows
+        )
+
+
+def history_rows(apps=global_apps):
+    """Rows computed from every shopper's order history, one (user, product) at a time"""
+    OrderItem = apps.get_model('checkout', 'OrderItem')
+    PurchasedProduct = apps.get_model('checkout', 'PurchasedProduct')
+    items = (
+        OrderItem.objects.filter(order__user__isnull=False, product__isnull=False)
+        .order_by('order__user_id', 'product_id', 'order__created_at', 'order_id')
+        .values_list('order__user_id', 'product_id', 'order__created_at', 'quantity')
+    )
+    row = None
+    for user_id, product_id, created_at, quantity in items.iterator():
+        if row is not None and (row.user_id, row.product_id) == (user_id, product_id):
+            add_purchase(row, quantity, created_at)
+            continue
+        if row is not None:
+            yield row
+        row = new_row(PurchasedProduct, user_id, product_id, quantity, created_at)
+    if row is not None:
+        yield row
+
+
+def rebuild(apps=global_apps):
+    """
+    Replace every row with one computed from the order history; returns the
+    row count. Migrations pass their historical ``apps``.
+    """
+    PurchasedProduct = apps.get_model('checkout', 'PurchasedProduct')
+    count = 0
+    with transaction.atomic():
+        PurchasedProduct.objects.all().delete()
+        batch = []
+        for row in history_rows(apps):
+            batch.append(row)
+            if len(batch) == BATCH_SIZE:
+                PurchasedProduct.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        PurchasedProduct.objects.bulk_create(batch)
+        count += len(batch)
+    return count
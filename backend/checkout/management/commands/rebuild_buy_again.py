@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from checkout import buy_again
+
+
+class Command(BaseCommand):
+    help = 'Recompute every shopper\'s "buy again" list from the order history'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = buy_again.rebuild()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {count} purchased products in {elapsed:.1f} s'
+        ))
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 08:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_order_items(apps, schema_editor):
+    # Match the snapshotted names; items of renamed or deleted products, and
+    # names shared by several products, stay unlinked
+    OrderItem = apps.get_model('checkout', 'OrderItem')
+    Product = apps.get_model('product_assistant', 'Product')
+    product_ids = {}
+    for product_id, name in Product.objects.values_list('id', 'name'):
+        product_ids[name] = None if name in product_ids else product_id
+    names = list(OrderItem.objects.filter(product__isnull=True).values_list('product_name', flat=True).distinct())
+    for name in names:
+        if product_ids.get(name) is not None:
+            OrderItem.objects.filter(product__isnull=True, product_name=name).update(product_id=product_ids[name])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_assistant', '0007_bought_together'),
+        ('checkout', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='product_assistant.product'),
+        ),
+        migrations.RunPython(link_order_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from checkout import buy_again
+
+
+def fill_purchased_products(apps, schema_editor):
+    buy_again.rebuild(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('product_assistant', '0008_userpreference_segment'),
+        ('checkout', '0002_orderitem_product'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchasedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_count', models.PositiveIntegerField()),
+                ('total_quantity', models.PositiveIntegerField()),
+                ('last_quantity', models.PositiveIntegerField()),
+                ('first_purchased_at', models.DateTimeField()),
+                ('last_purchased_at', models.DateTimeField()),
+                ('interval_days', models.FloatField(blank=True, null=True)),
+                ('due_at', models.DateTimeField(blank=True, null=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='product_assistant.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='purchased_products', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'due_at'], name='checkout_pu_user_id_e8ea7b_idx')],
+                'unique_together': {('user', 'product')},
+            },
+        ),
+        migrations.RunPython(fill_purchased_products, migrations.RunPython.noop),
+    ]
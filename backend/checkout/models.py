@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
 from cart.models import Cart
+from product_assistant.models import Product
 
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -49,6 +50,10 @@ class Order(models.Model):
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    # Kept for order history analysis (bought-together recommendations);
+    # the name and price below are the snapshot shown to the customer
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='order_items')
     product_name = models.CharField(max_length=200)
     product_price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.PositiveIntegerField()
@@ -57,6 +62,26 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.quantity}x {self.product_name}"
 
+class PurchasedProduct(models.Model):
+    """A product a shopper has ordered, kept current by ``buy_again.record_purchases``"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='purchased_products')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    order_count = models.PositiveIntegerField()
+    total_quantity = models.PositiveIntegerField()
+    last_quantity = models.PositiveIntegerField()
+    first_purchased_at = models.DateTimeField()
+    last_purchased_at = models.DateTimeField()
+    # Typical days between orders; null until the product is ordered again
+    interval_days = models.FloatField(null=True, blank=True)
+    due_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        unique_together = ['user', 'product']
+        indexes = [models.Index(fields=['user', 'due_at'])]
+    
+    def __str__(self):
+        return f"{self.user} - {self.product}"
+
 class DeliveryTracking(models.Model):
     TRACKING_STATUS_CHOICES = [
         ('order_placed', 'Order Placed'),
@@ -1,5 +1,7 @@
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Order, OrderItem, DeliveryTracking
+from .models import Order, OrderItem, DeliveryTracking, PurchasedProduct
+from product_assistant.serializers import ProductSerializer
 
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
@@ -29,4 +31,18 @@ class OrderDetailSerializer(serializers.ModelSerializer):
             'order_id', 'full_name', 'phone', 'email', 'address', 
             'city', 'pincode', 'status', 'payment_method', 
             'total_amount', 'items', 'tracking', 'created_at', 'updated_at'
-        ]
\ No newline at end of file
+        ]
+
+class PurchasedProductSerializer(serializers.ModelSerializer):
+    product = ProductSerializer(read_only=True)
+    is_due = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = PurchasedProduct
+        fields = [
+            'product', 'order_count', 'last_quantity', 'last_purchased_at',
+            'interval_days', 'due_at', 'is_due'
+        ]
+    
+    def get_is_due(self, obj):
+        return obj.due_at is not None and obj.due_at <= timezone.now()
@@ -4,6 +4,8 @@ from . import views
 urlpatterns = [
     path('create/', views.create_order, name='create-order'),
     path('order/<str:order_id>/', views.get_order, name='get-order'),
+    path('order/<str:order_id>/reorder/', views.reorder, name='reorder'),
     path('orders/', views.user_orders, name='user-orders'),
+    path('buy-again/', views.buy_again, name='buy-again'),
     path('track/<str:order_id>/', views.track_order, name='track-order'),
 ]
\ No newline at end of file
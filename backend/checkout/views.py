@@ -1,13 +1,40 @@
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from django.db import transaction
+from django.db.models import Count, F, Max, prefetch_related_objects
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from datetime import timedelta
 import uuid
-from .models import Order, OrderItem, DeliveryTracking
-from .serializers import OrderSerializer, OrderDetailSerializer
+from . import buy_again as buy_again_list
+from .models import Order, OrderItem, DeliveryTracking, PurchasedProduct
+from .serializers import OrderSerializer, OrderDetailSerializer, PurchasedProductSerializer
+from cart.models import CartItem
+from cart.serializers import CartSerializer, cart_items_prefetch
 from cart.views import get_or_create_cart
+from product_assistant import trending
+from product_assistant.conditional import make_etag, not_modified, set_validators, timestamp
+
+def order_validators(order):
+    """ETag and Last-Modified of an order annotated by ``get_order``"""
+    last_modified = max(filter(None, (order.updated_at, order.tracking_updated_at)))
+    etag = make_etag(order.order_id, last_modified.isoformat(), order.item_count)
+    return etag, timestamp(last_modified)
+
+def permission_error(request, order):
+    """403 response unless the order belongs to the user or session"""
+    if request.user.is_authenticated:
+        allowed = order.user_id == request.user.id
+    else:
+        # Signed-in shoppers' orders have no session key, and neither has
+        # a caller without a session
+        allowed = order.session_key is not None and order.session_key == request.session.session_key
+    if allowed:
+        return None
+    return Response({
+        'error': 'Permission denied'
+    }, status=status.HTTP_403_FORBIDDEN)
 
 def generate_order_id():
     """Generate unique order ID"""
@@ -35,72 +62,91 @@ def create_order(request):
     
     # Get cart
     cart = get_or_create_cart(request)
+    cart_items = list(cart.items.select_related('product'))
     
-    if not cart.items.exists():
+    if not cart_items:
         return Response({
             'error': 'Cart is empty'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    # Create order
-    order = Order.objects.create(
-        user=request.user if request.user.is_authenticated else None,
-        session_key=request.session.session_key if not request.user.is_authenticated else None,
-        order_id=generate_order_id(),
-        full_name=full_name,
-        phone=phone,
-        email=email,
-        address=address,
-        city=city,
-        pincode=pincode,
-        payment_method=payment_method,
-        total_amount=cart.total_amount
-    )
-    
-    # Create order items
-    for cart_item in cart.items.all():
-        OrderItem.objects.create(
+    # The order, its items, the buy-again rows, tracking and the emptied
+    # cart are written together
+    with transaction.atomic():
+        # Create order
+        order = Order.objects.create(
+            user=request.user if request.user.is_authenticated else None,
+            session_key=request.session.session_key if not request.user.is_authenticated else None,
+            order_id=generate_order_id(),
+            full_name=full_name,
+            phone=phone,
+            email=email,
+            address=address,
+            city=city,
+            pincode=pincode,
+            payment_method=payment_method,
+            total_amount=sum(cart_item.subtotal for cart_item in cart_items)
+        )
+
+        # Create order items
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=cart_item.product,
+                product_name=cart_item.product.name,
+                product_price=cart_item.product.price,
+                quantity=cart_item.quantity,
+                subtotal=cart_item.subtotal
+            )
+            for cart_item in cart_items
+        ])
+        if order.user is not None:
+            buy_again_list.record_purchases(
+                order.user, {cart_item.product_id: cart_item.quantity for cart_item in cart_items}, order.created_at
+            )
+
+        # Create delivery tracking
+        tracking_number = f"TRK{order.order_id}"
+        estimated_delivery = timezone.now() + timedelta(days=5)  # 5 days from now
+
+        DeliveryTracking.objects.create(
             order=order,
-            product_name=cart_item.product.name,
-            product_price=cart_item.product.price,
-            quantity=cart_item.quantity,
-            subtotal=cart_item.subtotal
+            tracking_number=tracking_number,
+            estimated_delivery=estimated_delivery
         )
-    
-    # Create delivery tracking
-    tracking_number = f"TRK{order.order_id}"
-    estimated_delivery = timezone.now() + timedelta(days=5)  # 5 days from now
-    
-    DeliveryTracking.objects.create(
-        order=order,
-        tracking_number=tracking_number,
-        estimated_delivery=estimated_delivery
-    )
-    
-    # Clear cart after successful order
-    cart.items.all().delete()
-    
+
+        # Clear cart after successful order
+        cart.items.all().delete()
+
+    for cart_item in cart_items:
+        trending.record('order', cart_item.product_id)
+
     serializer = OrderDetailSerializer(order)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 @api_view(['GET'])
 def get_order(request, order_id):
     """Get order details"""
-    order = get_object_or_404(Order, order_id=order_id)
+    # Validators come from the same query as the order, so an unchanged
+    # order is answered with a 304 before it is serialized
+    order = get_object_or_404(
+        Order.objects.annotate(
+            item_count=Count('items'), tracking_updated_at=Max('tracking__updated_at')
+        ),
+        order_id=order_id
+    )
     
     # Check if user has permission to view this order
-    if request.user.is_authenticated:
-        if order.user != request.user:
-            return Response({
-                'error': 'Permission denied'
-            }, status=status.HTTP_403_FORBIDDEN)
-    else:
-        if order.session_key != request.session.session_key:
-            return Response({
-                'error': 'Permission denied'
-            }, status=status.HTTP_403_FORBIDDEN)
+    response = permission_error(request, order)
+    if response is not None:
+        return response
+    
+    etag, last_modified = order_validators(order)
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
     
     serializer = OrderDetailSerializer(order)
-    return Response(serializer.data)
+    return set_validators(Response(serializer.data), etag, last_modified, private=True)
 
 @api_view(['GET'])
 def user_orders(request):
@@ -114,33 +160,90 @@ def user_orders(request):
     serializer = OrderSerializer(orders, many=True)
     return Response(serializer.data)
 
+@api_view(['POST'])
+def reorder(request, order_id):
+    """Add an order's items to the cart again; products no longer available are skipped"""
+    order = get_object_or_404(Order, order_id=order_id)
+    response = permission_error(request, order)
+    if response is not None:
+        return response
+    
+    quantities = {}
+    skipped = []
+    for item in order.items.select_related('product'):
+        if item.product is None or not item.product.in_stock:
+            skipped.append(item.product_name)
+        else:
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    
+    cart = get_or_create_cart(request)
+    in_cart = list(cart.items.filter(product_id__in=quantities))
+    for cart_item in in_cart:
+        cart_item.quantity += quantities[cart_item.product_id]
+    CartItem.objects.bulk_update(in_cart, ['quantity'])
+    in_cart_ids = {cart_item.product_id for cart_item in in_cart}
+    CartItem.objects.bulk_create(
+        CartItem(cart=cart, product_id=product_id, quantity=quantity)
+        for product_id, quantity in quantities.items() if product_id not in in_cart_ids
+    )
+    for product_id in quantities:
+        trending.record('cart', product_id)
+    
+    prefetch_related_objects([cart], cart_items_prefetch())
+    return Response({
+        'cart': CartSerializer(cart).data,
+        'skipped': skipped
+    })
+
+@api_view(['GET'])
+def buy_again(request):
+    """
+    Products the user has ordered, the ones due for a reorder first, then
+    the ones bought once, latest first; ``?limit=`` sets how many
+    """
+    if not request.user.is_authenticated:
+        return Response({
+            'error': 'Authentication required'
+        }, status=status.HTTP_401_UNAUTHORIZED)
+    
+    try:
+        limit = min(int(request.query_params.get('limit', buy_again_list.DEFAULT_LIMIT)), buy_again_list.MAX_LIMIT)
+    except ValueError:
+        limit = buy_again_list.DEFAULT_LIMIT
+    
+    purchases = (
+        PurchasedProduct.objects.filter(user=request.user)
+        .select_related('product__category')
+        .order_by(F('due_at').asc(nulls_last=True), '-last_purchased_at', 'id')[:max(limit, 1)]
+    )
+    serializer = PurchasedProductSerializer(purchases, many=True)
+    return Response(serializer.data)
+
 @api_view(['GET'])
 def track_order(request, order_id):
     """Track order delivery status"""
-    order = get_object_or_404(Order, order_id=order_id)
+    order = get_object_or_404(Order.objects.select_related('tracking'), order_id=order_id)
     
     # Check permissions
-    if request.user.is_authenticated:
-        if order.user != request.user:
-            return Response({
-                'error': 'Permission denied'
-            }, status=status.HTTP_403_FORBIDDEN)
-    else:
-        if order.session_key != request.session.session_key:
-            return Response({
-                'error': 'Permission denied'
-            }, status=status.HTTP_403_FORBIDDEN)
+    response = permission_error(request, order)
+    if response is not None:
+        return response
     
     try:
         tracking = order.tracking
-        return Response({
+        etag = make_etag(order.order_id, 'tracking', tracking.updated_at.isoformat())
+        last_modified = timestamp(tracking.updated_at)
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        return set_validators(Response({
             'order_id': order.order_id,
             'tracking_number': tracking.tracking_number,
             'current_status': tracking.current_status,
             'estimated_delivery': tracking.estimated_delivery,
             'actual_delivery': tracking.actual_delivery,
             'delivery_notes': tracking.delivery_notes
-        })
+        }), etag, last_modified, private=True)
     except DeliveryTracking.DoesNotExist:
         return Response({
             'error': 'Tracking information not available'
@@ -118,7 +118,7 @@ def process_payment(request):
 @api_view(['GET'])
 def payment_status(request, payment_id):
     """Get payment status"""
-    payment = get_object_or_404(Payment, payment_id=payment_id)
+    payment = get_object_or_404(Payment.objects.select_related('order'), payment_id=payment_id)
     
     return Response({
         'payment_id': payment.payment_id,
@@ -1,9 +1,9 @@
 from django.contrib import admin
-from .models import Category, Product, ProductReview, UserPreference
+from .models import Category, Product, ProductReview, UserPreference, SearchSynonym
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'description', 'icon', 'created_at']
+    list_display = ['name', 'description', 'icon', 'in_stock_count', 'created_at']
     search_fields = ['name']
 
 @admin.register(Product)
@@ -21,4 +21,11 @@ class ProductReviewAdmin(admin.ModelAdmin):
 @admin.register(UserPreference)
 class UserPreferenceAdmin(admin.ModelAdmin):
     list_display = ['user', 'age_group', 'created_at']
-    filter_horizontal = ['preferred_categories']
\ No newline at end of file
+    filter_horizontal = ['preferred_categories']
+
+@admin.register(SearchSynonym)
+class SearchSynonymAdmin(admin.ModelAdmin):
+    list_display = ['phrase', 'replacement', 'is_active', 'updated_at']
+    list_filter = ['is_active']
+    search_fields = ['phrase', 'replacement']
+    list_editable = ['replacement', 'is_active']
@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class ProductAssistantConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'product_assistant'
\ No newline at end of file
+    name = 'product_assistant'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,179 @@
+"""
+"Bought together" recommendations from order history.
+
+``manage.py build_bought_together`` streams the order items that reference
+a product in order id order and, one batch of complete orders at a time,
+builds a sparse order x product CSR matrix ``X`` and adds ``X.T @ X`` to a
+product x product co-occurrence matrix; memory is bounded by the batch and
+the number of product pairs, not by the number of orders. The diagonal
+counts the orders containing each product. Every product's co-purchased
+products are scored by cosine similarity, ``together / sqrt(a * b)``, or
+lift, ``together * orders / (a * b)``, pairs seen in fewer than
+``BOUGHT_TOGETHER_MIN_ORDERS`` orders are dropped, and the best
+``BOUGHT_TOGETHER_SIZE`` are stored as ``BoughtTogether`` rows by rank.
+The product and cart endpoints read them with one indexed query.
+"""
+from collections import defaultdict
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from scipy import sparse
+
+SCORES = ('cosine', 'lift')
+
+# Products per response unless ?limit= says otherwise
+DEFAULT_LIMIT = 6
+
+# Order items per streamed batch; batches end on an order boundary
+BATCH_ITEMS = 200000
+
+# Rows per INSERT when storing the results
+INSERT_BATCH = 5000
+
+
+def list_size():
+    return getattr(settings, 'BOUGHT_TOGETHER_SIZE', 20)
+
+
+def scoring():
+    return getattr(settings, 'BOUGHT_TOGETHER_SCORE', 'cosine')
+
+
+def min_orders():
+    return getattr(settings, 'BOUGHT_TOGETHER_MIN_ORDERS', 2)
+
+
+def order_batches(batch_items=BATCH_ITEMS):
+    """``(order ids, product ids)`` arrays of complete orders, streamed from the database"""
+    from checkout.models import OrderItem
+
+    rows = (
+        OrderItem.objects.filter(product__isnull=False).order_by('order_id')
+        .values_list('order_id', 'product_id').iterator(chunk_size=10000)
+    )
+    orders, products = [], []
+    for order_id, product_id in rows:
+        if len(orders) >= batch_items and order_id != orders[-1]:
+            yield np.array(orders, dtype=np.int64), np.array(products, dtype=np.int64)
+            orders, products = [], []
+        orders.append(order_id)
+        products.append(product_id)
+    if orders:
+        yield np.array(orders, dtype=np.int64), np.array(products, dtype=np.int64)
+
+
+def cooccurrence(batches, product_ids):
+    """
+    ``(counts, orders)``: the product x product matrix of how many orders
+    contain both products (columns follow the sorted ``product_ids``; the
+    diagonal counts the orders containing the product) and the number of
+    orders counted. Items of products not in ``product_ids`` are skipped.
+    """
+    size = len(product_ids)
+    counts = sparse.csr_matrix((size, size), dtype=np.int32)
+    total = 0
+    for orders, products in batches:
+        columns = np.searchsorted(product_ids, products)
+        known = columns < size
+        known[known] = product_ids[columns[known]] == products[known]
+        keys, rows = np.unique(orders[known], return_inverse=True)
+        baskets = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int32), (rows.ravel(), columns[known])), shape=(len(keys), size)
+        )
+        # A product ordered twice in one order counts once
+        baskets.data[:] = 1
+        counts = counts + (baskets.T @ baskets).tocsr()
+        total += len(keys)
+    return counts, total
+
+
+def top_related(counts, orders, size, score='cosine', minimum=2):
+    """Yield ``(column, related columns, scores)`` for every column with co-purchases, best first"""
+    counts = counts.tocsr(copy=True)
+    ordered = counts.diagonal().astype(np.float64)
+    counts.setdiag(0)
+    counts.data[counts.data < minimum] = 0
+    counts.eliminate_zeros()
+
+    rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+    together = counts.data.astype(np.float64)
+    if score == 'lift':
+        scores = together * orders / (ordered[rows] * ordered[counts.indices])
+    else:
+        scores = together / np.sqrt(ordered[rows] * ordered[counts.indices])
+
+    for row in np.flatnonzero(np.diff(counts.indptr)):
+        start, end = counts.indptr[row], counts.indptr[row + 1]
+        columns = counts.indices[start:end]
+        # Best score, then most orders together, then lowest id
+        best = np.lexsort((columns, -together[start:end], -scores[start:end]))[:size]
+        yield row, columns[best], scores[start:end][best]
+
+
+def build(batches=None, size=None, score=None, minimum=None):
+    """
+    Recompute the stored recommendations from the order history (or from
+    ``batches`` of ``(order ids, product ids)``); returns
+    ``{'orders': ..., 'products': ..., 'pairs': ...}``
+    """
+    from .models import BoughtTogether, Product
+
+    size = list_size() if size is None else size
+    score = scoring() if score is None else score
+    minimum = min_orders() if minimum is None else minimum
+    if score not in SCORES:
+        raise ValueError(f'Unknown score {score!r}, expected one of {", ".join(SCORES)}')
+
+    product_ids = np.array(Product.objects.order_by('id').values_list('id', flat=True), dtype=np.int64)
+    counts, orders = cooccurrence(order_batches() if batches is None else batches, product_ids)
+
+    stats = {'orders': orders, 'products': 0, 'pairs': 0}
+
+    def recommendations():
+        for column, related, scores in top_related(counts, orders, size, score, minimum):
+            stats['products'] += 1
+            product_id = int(product_ids[column])
+            for rank, (related_column, value) in enumerate(zip(related, scores), 1):
+                yield BoughtTogether(
+                    product_id=product_id, related_id=int(product_ids[related_column]),
+                    score=float(value), rank=rank,
+                )
+
+    rows = recommendations()
+    with transaction.atomic():
+        BoughtTogether.objects.all().delete()
+        while batch := list(islice(rows, INSERT_BATCH)):
+            BoughtTogether.objects.bulk_create(batch)
+            stats['pairs'] += len(batch)
+    return stats
+
+
+def related_ids(product_id, limit=DEFAULT_LIMIT):
+    """Ids of the in-stock products most often bought with a product, best first"""
+    from .models import BoughtTogether
+
+    return list(
+        BoughtTogether.objects.filter(product_id=product_id, related__in_stock=True)
+        .order_by('rank').values_list('related_id', flat=True)[:limit]
+    )
+
+
+def basket_related_ids(product_ids, limit=DEFAULT_LIMIT):
+    """
+    Ids of the in-stock products most often bought with the products of a
+    basket (not in it), by their scores summed over the basket
+    """
+    from .models import BoughtTogether
+
+    if not product_ids:
+        return []
+    scores = defaultdict(float)
+    rows = (
+        BoughtTogether.objects.filter(product_id__in=product_ids, related__in_stock=True)
+        .exclude(related_id__in=product_ids).values_list('related_id', 'score')
+    )
+    for related_id, value in rows:
+        scores[related_id] += value
+    return sorted(scores, key=lambda related_id: (-scores[related_id], related_id))[:limit]
@@ -0,0 +1,29 @@
+"""
+Direct access to the Redis server behind ``CACHES['default']``, for the
+data structures the Django cache API does not offer (sorted sets, hashes,
+pub/sub).
+"""
+import threading
+
+from django.conf import settings
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def redis_client():
+    """Redis client for the default cache, or None if it is not Redis"""
+    global _client
+    config = settings.CACHES['default']
+    if not config['BACKEND'].endswith('RedisCache'):
+        return None
+    if _client is None:
+        import redis
+
+        location = config['LOCATION']
+        if isinstance(location, (list, tuple)):
+            location = location[0]
+        with _client_lock:
+            if _client is None:
+                _client = redis.Redis.from_url(location)
+    return _client
@@ -0,0 +1,150 @@
+"""
+Catalog delta sync.
+
+Clients keep a local copy of the catalog and ask for what changed since an
+opaque cursor (``GET /api/products/changes/?since=<cursor>``). The cursor
+holds one ``(timestamp, id)`` position per stream: products and categories
+by ``updated_at``, deletions by ``CatalogTombstone.deleted_at``. Each
+stream is read as a keyset range scan on its ``(timestamp, id)`` index, so
+a sync with nothing new costs three empty index probes.
+
+Rows are only served once they are ``CATALOG_CHANGES_SETTLE_SECONDS`` old:
+``updated_at`` is set before the transaction commits, and a row committed
+after a client had moved past its timestamp would otherwise be skipped.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+
+from .fragments import product_cards
+from .models import CatalogTombstone, Category, Product
+from .pagination import decode_cursor, encode_cursor
+from .serializers import CategorySerializer
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+
+
+class CursorExpired(Exception):
+    """The cursor predates the deletion log; the client must resync"""
+
+
+def settle_seconds():
+    return getattr(settings, 'CATALOG_CHANGES_SETTLE_SECONDS', 2)
+
+
+def tombstone_retention():
+    return timedelta(days=getattr(settings, 'CATALOG_TOMBSTONE_RETENTION_DAYS', 30))
+
+
+def _parse_position(position):
+    if position is None:
+        return None
+    try:
+        stamp, last_id = position
+        parsed = parse_datetime(stamp)
+        if parsed is None:
+            raise ValueError(stamp)
+        return parsed, int(last_id)
+    except (TypeError, ValueError):
+        raise NotFound('Invalid cursor')
+
+
+def _format_position(position):
+    stamp, last_id = position
+    return [stamp.isoformat(), last_id]
+
+
+def _batch(queryset, field, position, horizon, limit):
+    """
+    Up to ``limit`` rows with ``(field, id)`` past ``position`` and
+    ``field`` before ``horizon``; returns ``(rows, next position, more)``.
+    Once a stream is drained its position moves up to the horizon, so the
+    cursor of an idle client does not age out of the deletion log.
+    """
+    queryset = queryset.filter(**{f'{field}__lt': horizon}).order_by(field, 'id')
+    if position is not None:
+        stamp, last_id = position
+        queryset = queryset.filter(
+            Q(**{f'{field}__gte': stamp}),
+            Q(**{f'{field}__gt': stamp}) | Q(id__gt=last_id),
+        )
+    rows = list(queryset[:limit + 1])
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (getattr(rows[-1], field), rows[-1].id), True
+    # Everything before the horizon has been seen
+    return rows, (horizon, 0), False
+
+
+def changes_since(cursor, limit=DEFAULT_LIMIT):
+    """
+    Changes after ``cursor`` (None for a full initial sync) as the response
+    body: changed products and categories, ids of deleted ones, the cursor
+    for the next call and whether more changes are already waiting.
+    """
+    now = timezone.now()
+    horizon = now - timedelta(seconds=settle_seconds())
+    if cursor:
+        position = decode_cursor(cursor)
+        products_at = _parse_position(position.get('p'))
+        categories_at = _parse_position(position.get('c'))
+        deleted_at = _parse_position(position.get('d'))
+        if deleted_at is None or deleted_at[0] < now - tombstone_retention():
+            raise CursorExpired()
+    else:
+        # A full copy needs no deletions from before it was taken
+        products_at = categories_at = None
+        deleted_at = (horizon, 0)
+
+    products, products_at, more_products = _batch(
+        Product.objects.select_related('category'), 'updated_at', products_at, horizon, limit
+    )
+    categories, categories_at, more_categories = _batch(
+        Category.objects.all(), 'updated_at', categories_at, horizon, limit
+    )
+    tombstones, deleted_at, more_deleted = _batch(
+        CatalogTombstone.objects.all(), 'deleted_at', deleted_at, horizon, limit
+    )
+
+    # An id that exists again (SQLite can reuse the highest rowid) must not
+    # be deleted: its current row is served by the updated_at stream
+    deleted = {CatalogTombstone.PRODUCT: set(), CatalogTombstone.CATEGORY: set()}
+    for tombstone in tombstones:
+        deleted[tombstone.kind].add(tombstone.object_id)
+    deleted[CatalogTombstone.PRODUCT].difference_update(
+        Product.objects.filter(pk__in=deleted[CatalogTombstone.PRODUCT]).values_list('pk', flat=True)
+    )
+    deleted[CatalogTombstone.CATEGORY].difference_update(
+        Category.objects.filter(pk__in=deleted[CatalogTombstone.CATEGORY]).values_list('pk', flat=True)
+    )
+
+    return {
+        'cursor': encode_cursor({
+            'p': _format_position(products_at),
+            'c': _format_position(categories_at),
+            'd': _format_position(deleted_at),
+        }),
+        'has_more': more_products or more_categories or more_deleted,
+        'products': product_cards(products),
+        'categories': CategorySerializer(categories, many=True).data,
+        'deleted': {
+            'products': sorted(deleted[CatalogTombstone.PRODUCT]),
+            'categories': sorted(deleted[CatalogTombstone.CATEGORY]),
+        },
+    }
+
+
+def record_deletion(kind, object_id):
+    CatalogTombstone.objects.create(kind=kind, object_id=object_id)
+
+
+def prune_tombstones():
+    """Forget deletions older than the retention window; returns the count"""
+    cutoff = timezone.now() - tombstone_retention()
+    deleted, _ = CatalogTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,59 @@
+"""
+Conditional GET (ETag / Last-Modified) for read endpoints.
+
+Validators are computed from cheap aggregates of the data behind a
+response, ``max(updated_at)`` and a row count, never from the rendered
+body, so a client revalidating with ``If-None-Match`` gets a 304 before
+anything is serialized. Responses also carry ``Cache-Control: no-cache``
+so clients always revalidate instead of guessing a freshness lifetime from
+``Last-Modified``.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """Strong (quoted) ETag over the given validator parts"""
+    digest = hashlib.md5('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'"{digest}"'
+
+
+def timestamp(value):
+    """Whole seconds of a datetime, as HTTP dates carry, or None"""
+    return int(value.timestamp()) if value is not None else None
+
+
+def queryset_validators(queryset, *parts):
+    """
+    ``(etag, last_modified)`` of a queryset from ``Max('updated_at')`` and
+    ``Count('id')`` in one aggregate query. ``parts`` (endpoint, params...)
+    keep ETags of different responses over the same rows apart.
+    """
+    aggregate = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    last_modified = aggregate['last_modified']
+    etag = make_etag(*parts, last_modified.isoformat() if last_modified else '', aggregate['count'])
+    return etag, timestamp(last_modified)
+
+
+def not_modified(request, etag, last_modified):
+    """A 304 response if the client's copy is current, else None"""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified, private=False):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    if private:
+        patch_cache_control(response, no_cache=True, private=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
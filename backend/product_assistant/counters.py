@@ -0,0 +1,62 @@
+"""
+Denormalized per-category in-stock product counts.
+
+``Category.in_stock_count`` is adjusted with ``F()`` updates in the same
+transaction as the product change that moves it (see ``Product.save`` and
+the delete signal), so the category list no longer runs one COUNT query per
+category. Bulk updates bypass model saves; ``manage.py repair_category_counts``
+recomputes every counter with a single GROUP BY.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from . import response_cache
+
+
+def product_moved(before, after):
+    """
+    Apply a product's change of ``(category_id, in_stock)`` to the counters.
+    ``before`` is None for a new product, ``after`` None for a deleted one.
+    """
+    from .models import Category
+
+    deltas = Counter()
+    if before is not None and before[1]:
+        deltas[before[0]] -= 1
+    if after is not None and after[1]:
+        deltas[after[0]] += 1
+
+    changed = False
+    for category_id, delta in sorted(deltas.items()):
+        if delta:
+            Category.objects.filter(pk=category_id).update(
+                in_stock_count=F('in_stock_count') + delta, updated_at=timezone.now()
+            )
+            changed = True
+    if changed:
+        transaction.on_commit(response_cache.invalidate)
+
+
+def recount():
+    """
+    Recompute every category's in-stock count with one GROUP BY and fix
+    the ones that drifted. Returns ``[(category, stored, actual), ...]``.
+    """
+    from .models import Category, Product
+
+    actual = dict(
+        Product.objects.filter(in_stock=True).values_list('category').annotate(count=Count('id'))
+    )
+    fixed = []
+    with transaction.atomic():
+        for category in Category.objects.select_for_update().only('id', 'name', 'in_stock_count'):
+            count = actual.get(category.id, 0)
+            if category.in_stock_count != count:
+                fixed.append((category, category.in_stock_count, count))
+                Category.objects.filter(pk=category.id).update(in_stock_count=count, updated_at=timezone.now())
+        if fixed:
+            transaction.on_commit(response_cache.invalidate)
+    return fixed
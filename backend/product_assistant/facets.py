@@ -0,0 +1,382 @@
+"""
+Bitmap indexes for faceted product filtering.
+
+Every product owns a slot (bit position). For each facet value we keep a
+Python int used as a bitset of the products having that value, so a filter
+is a handful of ``&``/``|`` operations and a facet count is a popcount,
+instead of extra ORM predicates and one COUNT query per facet value.
+"""
+import threading
+from bisect import bisect_right, insort
+
+from . import index_sync
+
+PRICE_BANDS = [
+    ('under_500', 'Under ₹500', 0, 500),
+    ('500_1000', '₹500 - ₹1000', 500, 1000),
+    ('1000_2000', '₹1000 - ₹2000', 1000, 2000),
+    ('2000_5000', '₹2000 - ₹5000', 2000, 5000),
+    ('5000_plus', 'Above ₹5000', 5000, None),
+]
+
+RATING_THRESHOLDS = [4, 3, 2, 1]
+
+# Query parameters handled by the facet index
+FILTER_PARAMS = ('category', 'max_price', 'price', 'min_rating', 'in_stock', 'featured')
+
+# Bit offsets set in each possible byte, for decoding bitsets
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+def popcount(bits):
+    return bin(bits).count('1')
+
+
+def slots_to_bits(slots):
+    """Build a bitset from slot numbers"""
+    slots = list(slots)
+    if not slots:
+        return 0
+    buffer = bytearray(max(slots) // 8 + 1)
+    for slot in slots:
+        buffer[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def bits_to_slots(bits):
+    """Slot numbers set in a bitset, ascending"""
+    slots = []
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for index, byte in enumerate(data):
+        if byte:
+            base = index * 8
+            slots.extend(base + bit for bit in _BYTE_BITS[byte])
+    return slots
+
+
+def price_band(price):
+    for key, _, low, high in PRICE_BANDS:
+        if price >= low and (high is None or price < high):
+            return key
+    return PRICE_BANDS[0][0]
+
+
+def parse_bool(value):
+    if value is None or value == '':
+        return None
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def filters_from_params(params, in_stock_default=True):
+    """Read facet filters from request query parameters"""
+    filters = {}
+
+    category = params.get('category')
+    if category:
+        filters['category'] = [name.strip() for name in category.split(',') if name.strip()]
+
+    max_price = params.get('max_price')
+    if max_price:
+        try:
+            filters['max_price'] = float(max_price)
+        except ValueError:
+            pass
+
+    price = params.get('price')
+    if price:
+        valid = {band[0] for band in PRICE_BANDS}
+        filters['price'] = [band for band in price.split(',') if band in valid]
+
+    min_rating = params.get('min_rating')
+    if min_rating:
+        try:
+            filters['min_rating'] = float(min_rating)
+        except ValueError:
+            pass
+
+    in_stock = parse_bool(params.get('in_stock'))
+    if in_stock is None:
+        in_stock = in_stock_default
+    if in_stock is not None:
+        filters['in_stock'] = in_stock
+
+    featured = parse_bool(params.get('featured'))
+    if featured is not None:
+        filters['featured'] = featured
+
+    return filters
+
+
+class FacetIndex:
+    """Per-facet bitsets over the product catalog"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._reset()
+
+    def _reset(self):
+        self.slot_of = {}          # product_id -> slot
+        self.product_at = []       # slot -> product_id (None if free)
+        self.free_slots = []
+        self.values = {}           # product_id -> facet values of the product
+        self.all_bits = 0
+        self.category_bits = {}    # category_id -> bitset
+        self.category_names = {}   # category_id -> name
+        self.price_bits = {band[0]: 0 for band in PRICE_BANDS}
+        self.rating_bits = {threshold: 0 for threshold in RATING_THRESHOLDS}
+        self.in_stock_bits = 0
+        self.featured_bits = 0
+        self.prices = []           # sorted (price, slot) for max_price
+
+    def build(self):
+        index_sync.start()
+        from .models import Category
+        from .snapshot import catalog_products
+
+        with self._lock:
+            self._reset()
+            for category in Category.objects.only('id', 'name'):
+                self.category_names[category.id] = category.name
+            # Collect slots first and create each bitset once: OR-ing bits into
+            # an ever larger int one product at a time is quadratic
+            pending = {}
+            for product in catalog_products():
+                slot, values = self._assign(product)
+                for target in self._targets(values):
+                    pending.setdefault(target, []).append(slot)
+                self.prices.append((values['price'], slot))
+            for target, slots in pending.items():
+                self._set_bits(target, slots_to_bits(slots))
+            self.prices.sort()
+            self._built = True
+
+    @property
+    def is_built(self):
+        return self._built
+
+    def ensure_built(self):
+        # Changes committed elsewhere since this process last looked
+        index_sync.catch_up()
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self.build()
+        return self
+
+    def add_product(self, product):
+        if not self._built:
+            return
+        with self._lock:
+            self._remove(product.id)
+            self._add(product)
+
+    def remove_product(self, product_id):
+        if not self._built:
+            return
+        with self._lock:
+            self._remove(product_id)
+
+    def add_category(self, category):
+        if not self._built:
+            return
+        with self._lock:
+            self.category_names[category.id] = category.name
+
+    def remove_category(self, category_id):
+        if not self._built:
+            return
+        with self._lock:
+            self.category_names.pop(category_id, None)
+            self.category_bits.pop(category_id, None)
+
+    def _product_values(self, product):
+        price = float(product.price)
+        rating = float(product.rating)
+        return {
+            'category': product.category_id,
+            'price': price,
+            'price_band': price_band(price),
+            'rating': rating,
+            'ratings': [threshold for threshold in RATING_THRESHOLDS if rating >= threshold],
+            'in_stock': product.in_stock,
+            'featured': product.is_featured,
+        }
+
+    def _assign(self, product):
+        """Give a product a slot and record its facet values"""
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.product_at[slot] = product.id
+        else:
+            slot = len(self.product_at)
+            self.product_at.append(product.id)
+        self.slot_of[product.id] = slot
+        values = self.values[product.id] = self._product_values(product)
+        return slot, values
+
+    def _targets(self, values):
+        """Bitsets a product with these facet values belongs to"""
+        targets = [('all', None), ('category', values['category']), ('price', values['price_band'])]
+        targets.extend(('rating', threshold) for threshold in values['ratings'])
+        if values['in_stock']:
+            targets.append(('in_stock', None))
+        if values['featured']:
+            targets.append(('featured', None))
+        return targets
+
+    def _set_bits(self, target, bits):
+        facet, value = target
+        if facet == 'all':
+            self.all_bits |= bits
+        elif facet == 'category':
+            self.category_bits[value] = self.category_bits.get(value, 0) | bits
+        elif facet == 'price':
+            self.price_bits[value] |= bits
+        elif facet == 'rating':
+            self.rating_bits[value] |= bits
+        elif facet == 'in_stock':
+            self.in_stock_bits |= bits
+        elif facet == 'featured':
+            self.featured_bits |= bits
+
+    def _add(self, product):
+        slot, values = self._assign(product)
+        bit = 1 << slot
+        for target in self._targets(values):
+            self._set_bits(target, bit)
+        insort(self.prices, (values['price'], slot))
+
+    def _remove(self, product_id):
+        slot = self.slot_of.pop(product_id, None)
+        if slot is None:
+            return
+        values = self.values.pop(product_id)
+        mask = ~(1 << slot)
+        self.all_bits &= mask
+        if values['category'] in self.category_bits:
+            self.category_bits[values['category']] &= mask
+        self.price_bits[values['price_band']] &= mask
+        for threshold in values['ratings']:
+            self.rating_bits[threshold] &= mask
+        self.in_stock_bits &= mask
+        self.featured_bits &= mask
+        index = bisect_right(self.prices, (values['price'], slot)) - 1
+        if index >= 0 and self.prices[index] == (values['price'], slot):
+            del self.prices[index]
+        self.product_at[slot] = None
+        self.free_slots.append(slot)
+
+    # Querying
+
+    def _category_ids(self, names):
+        wanted = {name.lower() for name in names}
+        return [
+            category_id for category_id, name in self.category_names.items()
+            if name.lower() in wanted
+        ]
+
+    def _facet_masks(self, filters):
+        """Bitset for each active facet filter"""
+        masks = {}
+        if 'category' in filters:
+            bits = 0
+            for category_id in self._category_ids(filters['category']):
+                bits |= self.category_bits.get(category_id, 0)
+            masks['category'] = bits
+        if 'price' in filters:
+            bits = 0
+            for band in filters['price']:
+                bits |= self.price_bits[band]
+            masks['price'] = bits
+        if 'max_price' in filters:
+            end = bisect_right(self.prices, (filters['max_price'], len(self.product_at)))
+            masks['max_price'] = slots_to_bits(slot for _, slot in self.prices[:end])
+        if 'min_rating' in filters:
+            threshold = filters['min_rating']
+            if threshold in self.rating_bits:
+                masks['min_rating'] = self.rating_bits[threshold]
+            else:
+                # Not a precomputed threshold (e.g. 4.5): compare the ratings
+                masks['min_rating'] = slots_to_bits(
+                    self.slot_of[pk] for pk, values in self.values.items()
+                    if values['rating'] >= threshold
+                )
+        if 'in_stock' in filters:
+            bits = self.in_stock_bits
+            masks['in_stock'] = bits if filters['in_stock'] else self.all_bits & ~bits
+        if 'featured' in filters:
+            bits = self.featured_bits
+            masks['featured'] = bits if filters['featured'] else self.all_bits & ~bits
+        return masks
+
+    def _combine(self, masks, base, exclude=()):
+        bits = base
+        for facet, mask in masks.items():
+            if facet not in exclude:
+                bits &= mask
+        return bits
+
+    def select(self, filters, product_ids=None, with_counts=False):
+        """
+        Apply facet filters. ``product_ids`` (e.g. ranked search hits)
+        restricts the candidates and its order is kept.
+
+        Returns ``(product_ids, facet_counts)``; counts are None unless
+        requested. Each facet is counted against every other active filter
+        but not its own, so alternative values keep their counts.
+        """
+        self.ensure_built()
+        with self._lock:
+            if product_ids is None:
+                base = self.all_bits
+            else:
+                base = slots_to_bits(
+                    self.slot_of[pk] for pk in product_ids if pk in self.slot_of
+                )
+            masks = self._facet_masks(filters)
+            bits = self._combine(masks, base)
+
+            if product_ids is None:
+                selected = [self.product_at[slot] for slot in bits_to_slots(bits)]
+            else:
+                selected_slots = set(bits_to_slots(bits))
+                slot_of = self.slot_of
+                selected = [pk for pk in product_ids if slot_of.get(pk) in selected_slots]
+
+            counts = self._counts(masks, base) if with_counts else None
+        return selected, counts
+
+    def _counts(self, masks, base):
+        category_scope = self._combine(masks, base, ('category',))
+        price_scope = self._combine(masks, base, ('price', 'max_price'))
+        rating_scope = self._combine(masks, base, ('min_rating',))
+        stock_scope = self._combine(masks, base, ('in_stock',))
+        featured_scope = self._combine(masks, base, ('featured',))
+
+        return {
+            'category': [
+                {'value': name, 'count': popcount(category_scope & self.category_bits.get(category_id, 0))}
+                for category_id, name in sorted(self.category_names.items(), key=lambda item: item[1])
+            ],
+            'price': [
+                {'value': key, 'label': label, 'count': popcount(price_scope & self.price_bits[key])}
+                for key, label, _, _ in PRICE_BANDS
+            ],
+            'rating': [
+                {'value': threshold, 'label': f'{threshold}★ & up',
+                 'count': popcount(rating_scope & self.rating_bits[threshold])}
+                for threshold in RATING_THRESHOLDS
+            ],
+            'in_stock': [
+                {'value': True, 'count': popcount(stock_scope & self.in_stock_bits)},
+                {'value': False, 'count': popcount(stock_scope & ~self.in_stock_bits)},
+            ],
+            'featured': [
+                {'value': True, 'count': popcount(featured_scope & self.featured_bits)},
+                {'value': False, 'count': popcount(featured_scope & ~self.featured_bits)},
+            ],
+        }
+
+
+facet_index = FacetIndex()
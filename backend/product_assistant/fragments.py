@@ -0,0 +1,143 @@
+"""
+Pre-rendered product cards for list responses.
+
+Each product's ``ProductSerializer`` representation is rendered to JSON
+once and kept in the shared cache under its id and ``updated_at``, so any
+change to the product (or to its category, which touches the products'
+``updated_at``) retires the old card without explicit invalidation. Saved
+products are rendered again right after commit.
+
+List views fetch a page of cards with one ``get_many`` and hand them to
+the response as ``JSONFragments``, which ``FragmentJSONRenderer`` splices
+into the body as-is instead of serializing every row field by field.
+Only missing cards are serialized, from one query for all of them.
+"""
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from redis.exceptions import RedisError
+from rest_framework.renderers import JSONRenderer
+
+from .models import Product
+from .search import fetch_in_order
+from .serializers import ProductSerializer
+
+logger = logging.getLogger(__name__)
+
+CARD_KEY_PREFIX = 'product:card'
+
+
+class JSONFragments(list):
+    """Already rendered JSON values, written out as one JSON array"""
+
+
+class FragmentJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` that splices ``JSONFragments`` (the whole body or a
+    top-level value of it) into the output without re-encoding them
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, JSONFragments):
+            return self._array(data)
+        if not isinstance(data, dict) or not any(isinstance(value, JSONFragments) for value in data.values()):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Render the rest of the body around placeholders, then swap them out
+        arrays = {}
+        shell = {}
+        for name, value in data.items():
+            if isinstance(value, JSONFragments):
+                placeholder = uuid.uuid4().hex
+                arrays[f'"{placeholder}"'.encode('ascii')] = self._array(value)
+                value = placeholder
+            shell[name] = value
+        body = super().render(shell, accepted_media_type, renderer_context)
+        for placeholder, array in arrays.items():
+            body = body.replace(placeholder, array, 1)
+        return body
+
+    def _array(self, fragments):
+        return b'[' + ','.join(fragments).encode('utf-8') + b']'
+
+
+def enabled():
+    return getattr(settings, 'PRODUCT_CARD_FRAGMENTS', True)
+
+
+def card_ttl():
+    return getattr(settings, 'PRODUCT_CARD_TTL', 86400)
+
+
+def card_key(product_id, updated_at):
+    return f'{CARD_KEY_PREFIX}:{product_id}:{updated_at.timestamp():.6f}'
+
+
+def render_card(product):
+    """JSON of a product exactly as ``JSONRenderer`` writes it in a list"""
+    return JSONRenderer().render(ProductSerializer(product).data).decode('utf-8')
+
+
+def _cards(rows):
+    """
+    Cards for ``[(product_id, updated_at), ...]`` in that order; products
+    that no longer exist are left out
+    """
+    keys = [card_key(product_id, updated_at) for product_id, updated_at in rows]
+    try:
+        found = cache.get_many(keys)
+    except RedisError as error:
+        logger.warning('Product card cache unavailable: %s', error)
+        found = {}
+
+    missing = [product_id for (product_id, _), key in zip(rows, keys) if key not in found]
+    rendered = {}
+    if missing:
+        # Cards are stored under the updated_at just read, which may be newer
+        for product in Product.objects.select_related('category').filter(pk__in=missing):
+            rendered[product.id] = (card_key(product.id, product.updated_at), render_card(product))
+        try:
+            cache.set_many(dict(rendered.values()), card_ttl())
+        except RedisError as error:
+            logger.warning('Product card cache unavailable: %s', error)
+
+    cards = JSONFragments()
+    for (product_id, _), key in zip(rows, keys):
+        if key in found:
+            cards.append(found[key])
+        elif product_id in rendered:
+            cards.append(rendered[product_id][1])
+    return cards
+
+
+def product_cards(products):
+    """
+    List representation of loaded products: pre-rendered cards, or
+    serializer data when fragments are disabled
+    """
+    if not enabled():
+        return list(ProductSerializer(products, many=True).data)
+    return _cards([(product.id, product.updated_at) for product in products])
+
+
+def product_cards_for_ids(product_ids):
+    """``product_cards`` of products by id, kept in the order given"""
+    if not enabled():
+        return list(ProductSerializer(fetch_in_order(product_ids), many=True).data)
+    updated = dict(Product.objects.filter(pk__in=product_ids).values_list('id', 'updated_at'))
+    return _cards([(product_id, updated[product_id]) for product_id in product_ids if product_id in updated])
+
+
+def store_card(product):
+    """Render a saved product's card once its transaction has committed"""
+    def store():
+        try:
+            cache.set(card_key(product.id, product.updated_at), render_card(product), card_ttl())
+        except RedisError as error:
+            logger.warning('Product card cache unavailable: %s', error)
+
+    if enabled():
+        transaction.on_commit(store)
@@ -0,0 +1,247 @@
+"""
+Fuzzy matching for speech-recognized queries.
+
+Voice queries often arrive slightly wrong ("glucos monitor", "blood presure").
+The words of product and category names are indexed by character trigrams
+and by a phonetic key so that misheard words can be mapped back to words
+that really occur in the catalog. Close product/category names are then
+suggested by re-scoring search hits, without scanning the database.
+"""
+import re
+import threading
+from collections import Counter
+
+from . import index_sync
+from .search import product_index, stem
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+
+# Minimum similarity for a word correction or a suggested name
+WORD_THRESHOLD = 0.45
+ENTRY_THRESHOLD = 0.3
+
+# Search hits re-scored by name similarity when suggesting products
+LOOKUP_CANDIDATES = 20
+
+_PHONETIC_RULES = [
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'gh'), 'g'),
+    (re.compile(r'^kn'), 'n'),
+    (re.compile(r'^wr'), 'r'),
+    (re.compile(r'ck'), 'k'),
+    (re.compile(r'sch'), 'sk'),
+    (re.compile(r'qu'), 'kw'),
+    (re.compile(r'x'), 'ks'),
+    (re.compile(r'c(?=[eiy])'), 's'),
+    (re.compile(r'c'), 'k'),
+    (re.compile(r'q'), 'k'),
+    (re.compile(r'z'), 's'),
+    (re.compile(r'v'), 'f'),
+    (re.compile(r'dg'), 'j'),
+    (re.compile(r'th'), 't'),
+]
+
+
+def phonetic_key(word):
+    """
+    Metaphone-style key: normalize common spelling variants of the same
+    sound, then keep the first letter and the following consonants with
+    repeats collapsed ("pressure" and "presure" both become "prsr").
+    """
+    word = ''.join(ch for ch in word.lower() if ch.isalpha())
+    if not word:
+        return ''
+    for pattern, replacement in _PHONETIC_RULES:
+        word = pattern.sub(replacement, word)
+    key = [word[0]]
+    for ch in word[1:]:
+        if ch in 'aeiouyhw':
+            continue
+        if ch != key[-1]:
+            key.append(ch)
+    return ''.join(key)
+
+
+def trigrams(text):
+    """Character trigrams of a word or phrase, padded at word boundaries"""
+    grams = set()
+    for word in WORD_RE.findall(text.lower()):
+        padded = f'  {word} '
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def similarity(grams_a, grams_b):
+    """Dice coefficient between two trigram sets"""
+    if not grams_a or not grams_b:
+        return 0.0
+    return 2.0 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+
+class FuzzyIndex:
+    """Trigram and phonetic indexes over product and category names"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._reset()
+
+    def _reset(self):
+        self.entries = {}              # (kind, id) -> name
+        self.word_counts = Counter()   # word -> number of names using it
+        self.word_trigrams = {}        # trigram -> set of words
+        self.word_phonetic = {}        # phonetic key -> set of words
+
+    def build(self):
+        index_sync.start()
+        from .models import Category
+        from .snapshot import catalog_products
+
+        with self._lock:
+            self._reset()
+            for category in Category.objects.only('id', 'name'):
+                self._add(('category', category.id), category.name)
+            for product in catalog_products():
+                self._add(('product', product.id), product.name)
+            self._built = True
+
+    @property
+    def is_built(self):
+        return self._built
+
+    def ensure_built(self):
+        # Changes committed elsewhere since this process last looked
+        index_sync.catch_up()
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self.build()
+        return self
+
+    def add_product(self, product):
+        self._update(('product', product.id), product.name)
+
+    def remove_product(self, product_id):
+        self._update(('product', product_id), None)
+
+    def add_category(self, category):
+        self._update(('category', category.id), category.name)
+
+    def remove_category(self, category_id):
+        self._update(('category', category_id), None)
+
+    def _update(self, key, name):
+        if not self._built:
+            return
+        with self._lock:
+            self._remove(key)
+            if name is not None:
+                self._add(key, name)
+
+    def _add(self, key, name):
+        self.entries[key] = name
+        for word in set(WORD_RE.findall(name.lower())):
+            self.word_counts[word] += 1
+            if self.word_counts[word] == 1:
+                for gram in trigrams(word):
+                    self.word_trigrams.setdefault(gram, set()).add(word)
+                self.word_phonetic.setdefault(phonetic_key(word), set()).add(word)
+
+    def _remove(self, key):
+        name = self.entries.pop(key, None)
+        if name is None:
+            return
+        for word in set(WORD_RE.findall(name.lower())):
+            self.word_counts[word] -= 1
+            if self.word_counts[word] > 0:
+                continue
+            del self.word_counts[word]
+            for gram in trigrams(word):
+                words = self.word_trigrams.get(gram)
+                if words is not None:
+                    words.discard(word)
+                    if not words:
+                        del self.word_trigrams[gram]
+            words = self.word_phonetic.get(phonetic_key(word))
+            if words is not None:
+                words.discard(word)
+                if not words:
+                    del self.word_phonetic[phonetic_key(word)]
+
+    # Lookups
+
+    def is_known(self, word):
+        """True if the word occurs in the catalog as typed"""
+        return word in self.word_counts or product_index.has_term(stem(word))
+
+    def correct_word(self, word):
+        """Best catalog word for a misheard word, as ``(word, score)``"""
+        self.ensure_built()
+        with self._lock:
+            grams = trigrams(word)
+            candidates = set(self.word_phonetic.get(phonetic_key(word), ()))
+            for gram in grams:
+                candidates.update(self.word_trigrams.get(gram, ()))
+
+            key = phonetic_key(word)
+            best, best_score = None, 0.0
+            for candidate in candidates:
+                score = similarity(grams, trigrams(candidate))
+                if phonetic_key(candidate) == key:
+                    # Sounds the same: what ASR errors usually look like
+                    score = 0.5 + score / 2
+                if score > best_score or (score == best_score and best is not None
+                                          and self.word_counts[candidate] > self.word_counts[best]):
+                    best, best_score = candidate, score
+        if best_score < WORD_THRESHOLD:
+            return None, 0.0
+        return best, best_score
+
+    def did_you_mean(self, query):
+        """
+        Rewrite unknown words of the query to their closest catalog words.
+        Returns None when nothing needed correcting.
+        """
+        self.ensure_built()
+        product_index.ensure_built()
+        words = WORD_RE.findall(query.lower())
+        corrected = []
+        changed = False
+        for word in words:
+            if len(word) > 2 and not word.isdigit() and not self.is_known(word):
+                replacement, _ = self.correct_word(word)
+                if replacement and replacement != word:
+                    corrected.append(replacement)
+                    changed = True
+                    continue
+            corrected.append(word)
+        return ' '.join(corrected) if changed else None
+
+    def lookup(self, query, limit=5, kinds=('product', 'category')):
+        """
+        Top product/category names resembling the query, as dicts with
+        ``type``, ``id``, ``name`` and ``score``.
+        """
+        self.ensure_built()
+        grams = trigrams(query)
+        scored = []
+        with self._lock:
+            if 'category' in kinds:
+                for (kind, pk), name in self.entries.items():
+                    if kind == 'category':
+                        scored.append((similarity(grams, trigrams(name)), kind, pk, name))
+        if 'product' in kinds:
+            for pk, _ in product_index.search(query, limit=LOOKUP_CANDIDATES):
+                name = product_index.doc(pk).name
+                scored.append((similarity(grams, trigrams(name)), 'product', pk, name))
+
+        scored = [item for item in scored if item[0] >= ENTRY_THRESHOLD]
+        scored.sort(key=lambda item: (-item[0], item[1], item[2]))
+        return [
+            {'type': kind, 'id': pk, 'name': name, 'score': round(score, 3)}
+            for score, kind, pk, name in scored[:limit]
+        ]
+
+
+fuzzy_index = FuzzyIndex()
@@ -0,0 +1,210 @@
+"""
+Keeping every worker's in-memory catalog indexes in step with the database.
+
+The search, fuzzy, suggest and facet indexes live in each process. Catalog
+signals only note which products and categories changed; once the
+transaction commits, ``flush`` reads them back and updates this process's
+indexes, so a rolled-back save changes nothing. The same ids are appended
+to a numbered change log in Redis before the catalog version is bumped
+(signals register the flush ahead of the invalidation), and every index
+checks the log's sequence number before it is read (``catch_up``, one
+GET): entries not applied yet are replayed from the database. Other
+workers, and changes committed by management commands and imports, are
+therefore picked up before any response is built from an index. A worker
+that fell further behind than the ``LOG_SIZE`` entries kept rebuilds its
+indexes. Without Redis (tests, locmem cache) changes are only applied in
+the process that made them.
+"""
+import json
+import logging
+import threading
+
+from django.db import transaction
+from redis.exceptions import RedisError
+
+from .cache_backend import redis_client
+
+logger = logging.getLogger(__name__)
+
+SEQUENCE_KEY = 'catalog:index:sequence'
+LOG_KEY = 'catalog:index:log'
+
+# Change log entries kept; workers further behind rebuild their indexes
+LOG_SIZE = 1000
+
+# An entry missing this far behind the sequence was lost (evicted), not
+# still being written
+MISSING_ENTRY_GRACE = 100
+
+# Products read from the database at a time
+READ_BATCH = 1000
+
+_pending = threading.local()    # ids changed in this thread's transaction
+_applied = None                 # last log entry applied in this process
+_sync_lock = threading.RLock()
+
+
+def _indexes():
+    from .facets import facet_index
+    from .fuzzy import fuzzy_index
+    from .search import product_index
+    from .suggest import suggest_index
+
+    return product_index, fuzzy_index, suggest_index, facet_index
+
+
+def _pending_ids():
+    if not hasattr(_pending, 'products'):
+        _pending.products = set()
+        _pending.categories = set()
+    return _pending.products, _pending.categories
+
+
+def product_changed(product_id):
+    """Called by signals when a product is saved or deleted"""
+    _pending_ids()[0].add(product_id)
+    transaction.on_commit(flush)
+
+
+def category_changed(category_id):
+    """Called by signals when a category is saved or deleted"""
+    _pending_ids()[1].add(category_id)
+    transaction.on_commit(flush)
+
+
+def flush():
+    """Apply and publish the committed changes (the first callback takes them all)"""
+    products, categories = _pending_ids()
+    if not products and not categories:
+        return
+    product_ids, category_ids = sorted(products), sorted(categories)
+    products.clear()
+    categories.clear()
+    apply(product_ids, category_ids)
+    publish(product_ids, category_ids)
+
+
+def apply(product_ids, category_ids):
+    """Update this process's indexes from the current rows (missing rows were deleted)"""
+    from .models import Category, Product
+
+    product_index, fuzzy_index, suggest_index, facet_index = _indexes()
+    if category_ids:
+        found = Category.objects.in_bulk(category_ids)
+        for category_id in category_ids:
+            category = found.get(category_id)
+            if category is None:
+                for index in (product_index, fuzzy_index, suggest_index, facet_index):
+                    index.remove_category(category_id)
+                continue
+            product_index.update_category(category)
+            for index in (fuzzy_index, suggest_index, facet_index):
+                index.add_category(category)
+
+    for start in range(0, len(product_ids), READ_BATCH):
+        batch = product_ids[start:start + READ_BATCH]
+        found = Product.objects.select_related('category').in_bulk(batch)
+        for product_id in batch:
+            product = found.get(product_id)
+            for index in (product_index, fuzzy_index, suggest_index, facet_index):
+                if product is None:
+                    index.remove_product(product_id)
+                else:
+                    index.add_product(product)
+
+
+def publish(product_ids, category_ids):
+    """Append a change to the shared log for the other processes"""
+    global _applied
+    client = redis_client()
+    if client is None:
+        return
+    try:
+        sequence = client.incr(SEQUENCE_KEY)
+        with client.pipeline(transaction=False) as pipe:
+            pipe.hset(LOG_KEY, sequence, json.dumps({'products': product_ids, 'categories': category_ids}))
+            if sequence > LOG_SIZE:
+                pipe.hdel(LOG_KEY, sequence - LOG_SIZE)
+            pipe.execute()
+    except RedisError as error:
+        logger.warning('Could not publish catalog index change: %s', error)
+        return
+    with _sync_lock:
+        # Already applied here; skip it unless earlier entries are pending
+        if _applied == sequence - 1:
+            _applied = sequence
+
+
+def start():
+    """Called before an index is built: later log entries are to be replayed"""
+    global _applied
+    if _applied is not None:
+        return
+    client = redis_client()
+    if client is None:
+        return
+    try:
+        sequence = int(client.get(SEQUENCE_KEY) or 0)
+    except RedisError as error:
+        logger.warning('Catalog index log unavailable: %s', error)
+        return
+    with _sync_lock:
+        if _applied is None:
+            _applied = sequence
+
+
+def catch_up():
+    """Replay the log entries this process has not applied (called before index reads)"""
+    global _applied
+    client = redis_client()
+    if client is None:
+        return
+    try:
+        sequence = int(client.get(SEQUENCE_KEY) or 0)
+    except RedisError as error:
+        logger.warning('Catalog index log unavailable: %s', error)
+        return
+    if _applied is not None and sequence <= _applied:
+        return
+
+    with _sync_lock:
+        if _applied is None:
+            # No index built yet: they will read the current catalog
+            _applied = sequence
+            return
+        if sequence <= _applied:
+            return
+        if sequence - _applied > LOG_SIZE:
+            _rebuild(sequence)
+            return
+        numbers = list(range(_applied + 1, sequence + 1))
+        try:
+            entries = client.hmget(LOG_KEY, numbers)
+        except RedisError as error:
+            logger.warning('Catalog index log unavailable: %s', error)
+            return
+        product_ids, category_ids = set(), set()
+        applied = _applied
+        for number, entry in zip(numbers, entries):
+            if entry is None:
+                if sequence - number >= MISSING_ENTRY_GRACE:
+                    _rebuild(sequence)
+                    return
+                # Still being written: applied on a later read
+                break
+            change = json.loads(entry)
+            product_ids.update(change['products'])
+            category_ids.update(change['categories'])
+            applied = number
+        apply(sorted(product_ids), sorted(category_ids))
+        _applied = applied
+
+
+def _rebuild(sequence):
+    global _applied
+    logger.warning('Catalog index log out of reach; rebuilding the in-memory indexes')
+    for index in _indexes():
+        if index.is_built:
+            index.build()
+    # Only once rebuilt, so a failed rebuild is retried on the next read
+    _applied = sequence
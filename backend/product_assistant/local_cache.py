@@ -0,0 +1,176 @@
+"""
+In-process L1 cache for near-static reference data.
+
+Categories, featured products and the compiled synonym dictionary change a
+few times a day but are read on almost every request. ``reference_cache``
+keeps them in each worker's memory (LRU, bounded in size and age) in front
+of the shared Redis cache, so a hot read does no I/O at all.
+
+Entries are grouped by namespace (the first element of the key tuple).
+``invalidate(namespace)`` clears it locally and publishes the namespace on
+a Redis pub/sub channel; every worker runs a listener thread that clears
+the same namespace. Without Redis (tests, locmem cache) invalidation is
+local to the process. The TTL bounds staleness if a message is ever lost;
+entries that are costly to rebuild and only change through an
+invalidation (the synonym automaton) are stored with ``ttl=None`` and kept
+until then. The listener clears everything whenever it (re)subscribes, so
+messages missed while disconnected do not leave them stale.
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from .cache_backend import redis_client
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'voicecart:invalidate'
+
+# Seconds to wait before resubscribing after the pub/sub connection fails
+RECONNECT_DELAY = 5
+
+# ``ttl`` argument meaning the cache's own TTL
+DEFAULT_TTL = object()
+
+
+class LocalCache:
+    """Thread-safe LRU with per-entry expiry and per-namespace generations"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()       # key -> (expires_at, value)
+        self._generations = Counter()       # namespace -> invalidation count
+        self.stats = Counter()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats['miss'] += 1
+                return default
+            self._entries.move_to_end(key)
+            self.stats['hit'] += 1
+            return entry[1]
+
+    def generation(self, namespace):
+        return self._generations[namespace]
+
+    def set(self, key, value, generation=None, ttl=DEFAULT_TTL):
+        """
+        Store a value. If ``generation`` (taken before loading the value) is
+        stale, the namespace was invalidated meanwhile and the value is dropped.
+        ``ttl=None`` keeps the value until it is invalidated or evicted.
+        """
+        if ttl is DEFAULT_TTL:
+            ttl = self.ttl
+        expires_at = math.inf if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            if generation is not None and generation != self._generations[key[0]]:
+                return
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key, loader, ttl=DEFAULT_TTL):
+        """Cached value, or ``loader()`` stored unless invalidated meanwhile"""
+        value = self.get(key)
+        if value is None:
+            generation = self.generation(key[0])
+            value = loader()
+            if value is not None:
+                self.set(key, value, generation, ttl)
+        return value
+
+    def clear(self, namespace=None):
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+                for name in list(self._generations):
+                    self._generations[name] += 1
+                return
+            self._generations[namespace] += 1
+            for key in [key for key in self._entries if key[0] == namespace]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+reference_cache = LocalCache(
+    maxsize=getattr(settings, 'REFERENCE_CACHE_SIZE', 512),
+    ttl=getattr(settings, 'REFERENCE_CACHE_TTL', 300),
+)
+
+
+# Cross-worker invalidation
+
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def _listen(client):
+    while True:
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Messages may have been missed while (re)connecting
+            reference_cache.clear()
+            for message in pubsub.listen():
+                if message['type'] != 'message':
+                    continue
+                try:
+                    namespace = json.loads(message['data'])['namespace']
+                except (ValueError, KeyError, TypeError):
+                    continue
+                reference_cache.clear(namespace)
+        except RedisError as error:
+            logger.warning('Cache invalidation listener disconnected: %s', error)
+            time.sleep(RECONNECT_DELAY)
+
+
+def ensure_listener():
+    """Start this process's invalidation listener (once per worker, after fork)"""
+    global _listener, _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    client = redis_client()
+    if client is None:
+        return
+    with _listener_lock:
+        if _listener_pid != os.getpid():
+            _listener = threading.Thread(
+                target=_listen, args=(client,), name='cache-invalidation', daemon=True
+            )
+            _listener.start()
+            _listener_pid = os.getpid()
+
+
+def invalidate(namespace):
+    """Clear a namespace here and in every other worker"""
+    reference_cache.clear(namespace)
+    client = redis_client()
+    if client is None:
+        return
+    try:
+        client.publish(INVALIDATION_CHANNEL, json.dumps({'namespace': namespace}))
+    except RedisError as error:
+        logger.warning('Could not broadcast cache invalidation: %s', error)
+
+
+def cached(key, loader, ttl=DEFAULT_TTL):
+    """Read-through from the L1 cache; ``key[0]`` is the namespace"""
+    ensure_listener()
+    return reference_cache.get_or_load(key, loader, ttl)
@@ -0,0 +1,122 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from product_assistant.fuzzy import fuzzy_index
+from product_assistant.models import Product
+from product_assistant.search import product_index, search_products
+
+# Typical speech-recognition slips for products in enhanced_products.json
+MISHEARD_QUERIES = [
+    ('glucos monitor', 'Glucose Monitor Kit'),
+    ('blood presure', 'Blood Pressure Monitor'),
+    ('blud pressure monitor', 'Blood Pressure Monitor'),
+    ('thermomiter', 'Digital Thermometer'),
+    ('pulse oxymeter', 'Pulse Oximeter'),
+    ('nebuliser machine', 'Nebulizer Machine'),
+    ('heering aid', 'Hearing Aid'),
+    ('vitamen d3', 'Vitamin D3 Tablets'),
+    ('calcium vitamine d', 'Calcium + Vitamin D'),
+    ('omega fish oyl', 'Omega-3 Fish Oil'),
+    ('multi vitamin tablets', 'Multivitamin Tablets'),
+    ('glucosamin', 'Glucosamine Chondroitin'),
+    ('probiotik capsules', 'Probiotic Capsules'),
+    ('walking stik', 'Walking Stick'),
+    ('wheelchare', 'Wheelchair'),
+    ('quad cain', 'Quad Cane'),
+    ('compresion socks', 'Compression Socks'),
+    ('adult diapper', 'Adult Diapers'),
+    ('electric tooth brush', 'Electric Toothbrush'),
+    ('nee brace', 'Knee Brace'),
+    ('heeting pad', 'Heating Pad'),
+    ('shower chare', 'Shower Chair'),
+    ('memory fome pillow', 'Memory Foam Pillow'),
+    ('reeding glasses', 'Reading Glasses'),
+    ('pil organiser', 'Pill Organizer'),
+    ('magnifying glas', 'Magnifying Glass'),
+    ('magnesium tablits', 'Magnesium Tablets'),
+    ('tumeric', 'Turmeric Curcumin'),
+    ('colagen peptides', 'Collagen Peptides'),
+    ('melatonine', 'Melatonin Tablets'),
+    ('stethoscop', 'Stethoscope'),
+    ('medical alert braslet', 'Medical Alert Bracelet'),
+]
+
+
+def misspell(word, rng):
+    """Apply one random ASR-like edit: drop, double, swap or substitute"""
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    edit = rng.choice(['drop', 'double', 'swap', 'vowel'])
+    if edit == 'drop':
+        return word[:i] + word[i + 1:]
+    if edit == 'double':
+        return word[:i] + word[i] + word[i:]
+    if edit == 'swap':
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    vowels = 'aeiou'
+    replacement = rng.choice(vowels) if word[i] in vowels else word[i]
+    return word[:i] + replacement + word[i + 1:]
+
+
+class Command(BaseCommand):
+    help = 'Measure recall and latency of voice search on misheard queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--generated', type=int, default=200,
+                            help='Number of synthetic misspellings of catalog names to add')
+        parser.add_argument('--top-k', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        top_k = options['top_k']
+
+        self.names_by_id = dict(Product.objects.values_list('id', 'name'))
+        names = list(self.names_by_id.values())
+        name_set = set(names)
+        corpus = [(query, name) for query, name in MISHEARD_QUERIES if name in name_set]
+        for _ in range(options['generated'] if names else 0):
+            name = rng.choice(names)
+            words = name.lower().split()
+            target = rng.randrange(len(words))
+            words[target] = misspell(words[target], rng)
+            corpus.append((' '.join(words), name))
+
+        if not corpus:
+            self.stdout.write(self.style.WARNING('No products in the catalog to benchmark against.'))
+            return
+
+        started = time.perf_counter()
+        product_index.ensure_built()
+        fuzzy_index.ensure_built()
+        self.stdout.write(f'Indexes built in {(time.perf_counter() - started) * 1000:.1f} ms')
+
+        for mode, run in (('exact', self._exact), ('fuzzy', self._fuzzy)):
+            hits = 0
+            latencies = []
+            for query, expected in corpus:
+                started = time.perf_counter()
+                product_ids = run(query, top_k)
+                latencies.append((time.perf_counter() - started) * 1000)
+                hits += expected in {self.names_by_id.get(pk) for pk in product_ids}
+            latencies.sort()
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            self.stdout.write(
+                f'{mode:>6}: recall@{top_k} {hits / len(corpus):.1%} over {len(corpus)} queries, '
+                f'latency p50 {statistics.median(latencies):.3f} ms, '
+                f'p95 {p95:.3f} ms, max {latencies[-1]:.3f} ms'
+            )
+
+    def _exact(self, query, top_k):
+        return search_products(query, limit=top_k)
+
+    def _fuzzy(self, query, top_k):
+        corrected = fuzzy_index.did_you_mean(query) or query
+        product_ids = search_products(corrected, limit=top_k)
+        if not product_ids:
+            product_ids = [match['id'] for match in fuzzy_index.lookup(query, top_k, kinds=('product',))]
+        return product_ids
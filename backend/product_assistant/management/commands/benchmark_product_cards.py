@@ -0,0 +1,76 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+
+from rest_framework.renderers import JSONRenderer
+
+from product_assistant import fragments
+from product_assistant.models import Category, Product
+from product_assistant.search import product_index
+from product_assistant.serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare list endpoint throughput with pre-rendered product cards and with the serializer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and mode')
+        parser.add_argument('--page-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        urls = [
+            f'/api/products/?page_size={page_size}',
+            f'/api/products/?page_size={page_size}&sort=rating&min_rating=1',
+        ]
+        category = Category.objects.filter(in_stock_count__gt=0).order_by('-in_stock_count').first()
+        if category is None:
+            self.stdout.write(self.style.WARNING('No products in the catalog to benchmark against.'))
+            return
+        urls.append(f'/api/products/category/{category.name}/?page_size={page_size}')
+        product_index.ensure_built()
+
+        hosts = [host for host in settings.ALLOWED_HOSTS if '*' not in host and not host.startswith('.')]
+        host = hosts[0] if hosts else 'localhost'
+        client = Client(HTTP_HOST=host)
+        # A TTL of 0 keeps the response cache from answering, so every
+        # request builds its body
+        with override_settings(CATALOG_CACHE_TTL=0):
+            for url in urls:
+                rates = {}
+                for mode, use_cards in (('serializer', False), ('cards', True)):
+                    with override_settings(PRODUCT_CARD_FRAGMENTS=use_cards):
+                        client.get(url)  # warm-up (and card cache fill)
+                        started = time.perf_counter()
+                        for _ in range(options['requests']):
+                            response = client.get(url)
+                        elapsed = time.perf_counter() - started
+                    if response.status_code != 200:
+                        raise CommandError(f'{url} returned {response.status_code}')
+                    rates[mode] = options['requests'] / elapsed
+                    size = len(response.content)
+                self.stdout.write(
+                    f'{url}\n'
+                    f'  serializer {rates["serializer"]:8.1f} req/s   cards {rates["cards"]:8.1f} req/s   '
+                    f'x{rates["cards"] / rates["serializer"]:.2f}   ({size / 1024:.1f} KiB)'
+                )
+
+        # The body alone, without the queries that select the page
+        products = list(Product.objects.select_related('category').filter(in_stock=True)[:page_size])
+        fragments.product_cards(products)
+        timings = {}
+        for mode, build in (
+            ('serializer', lambda: JSONRenderer().render({'results': ProductSerializer(products, many=True).data})),
+            ('cards', lambda: fragments.FragmentJSONRenderer().render({'results': fragments.product_cards(products)})),
+        ):
+            started = time.perf_counter()
+            for _ in range(options['requests']):
+                build()
+            timings[mode] = (time.perf_counter() - started) / options['requests'] * 1000
+        self.stdout.write(
+            f'Body of {len(products)} products: serializer {timings["serializer"]:.2f} ms, '
+            f'cards {timings["cards"]:.2f} ms (x{timings["serializer"] / timings["cards"]:.1f})'
+        )
@@ -0,0 +1,83 @@
+import resource
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from product_assistant import bought_together
+from product_assistant.models import BoughtTogether, Product
+
+
+class Command(BaseCommand):
+    help = 'Recompute the "bought together" recommendations from the order history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--score', choices=bought_together.SCORES, help='Default: BOUGHT_TOGETHER_SCORE')
+        parser.add_argument('--size', type=int, help='Products kept per product (default: BOUGHT_TOGETHER_SIZE)')
+        parser.add_argument('--min-orders', type=int,
+                            help='Orders a pair needs in common (default: BOUGHT_TOGETHER_MIN_ORDERS)')
+        parser.add_argument('--show', type=int, default=5, help='Products whose recommendations to print')
+        parser.add_argument('--synthetic', type=int, metavar='ORDERS',
+                            help='Benchmark on this many generated orders over the catalog (nothing is stored)')
+
+    def handle(self, *args, **options):
+        batches = None
+        if options['synthetic']:
+            product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+            if len(product_ids) < 2:
+                raise CommandError('The catalog needs at least two products.')
+            batches = synthetic_batches(np.array(product_ids, dtype=np.int64), options['synthetic'])
+
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                stats = bought_together.build(
+                    batches, size=options['size'], score=options['score'], minimum=options['min_orders'],
+                )
+                if options['synthetic']:
+                    self._show(options['show'])
+                    transaction.set_rollback(True)
+        except ValueError as error:
+            raise CommandError(str(error))
+        elapsed = time.perf_counter() - started
+
+        if not options['synthetic']:
+            self._show(options['show'])
+        # ru_maxrss is in kilobytes on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(self.style.SUCCESS(
+            f'{stats["orders"]} orders: {stats["pairs"]} recommendations for {stats["products"]} products '
+            f'in {elapsed:.1f} s (peak memory {peak:.0f} MB)'
+        ))
+
+    def _show(self, count):
+        product_ids = list(
+            BoughtTogether.objects.filter(rank=1).order_by('-score').values_list('product_id', flat=True)[:count]
+        )
+        rows = BoughtTogether.objects.filter(product_id__in=product_ids).select_related('product', 'related')
+        for product_id in product_ids:
+            related = [row for row in rows if row.product_id == product_id][:3]
+            self.stdout.write(f'{related[0].product.name}:')
+            for row in related:
+                self.stdout.write(f'  {row.related.name} ({row.score:.3f})')
+
+
+def synthetic_batches(product_ids, orders, batch_orders=100000, seed=0):
+    """
+    ``orders`` generated orders of 1-6 items in batches, drawn with a skewed
+    product popularity; every product has a partner (the next id) that is
+    added to a third of the orders containing it
+    """
+    rng = np.random.default_rng(seed)
+    popularity = 1 / np.arange(1, len(product_ids) + 1) ** 0.8
+    popularity = rng.permutation(popularity / popularity.sum())
+    for first in range(0, orders, batch_orders):
+        count = min(batch_orders, orders - first)
+        sizes = rng.integers(1, 7, count)
+        order_ids = np.repeat(np.arange(first, first + count), sizes)
+        columns = rng.choice(len(product_ids), len(order_ids), p=popularity)
+        paired = rng.random(len(columns)) < 1 / 3
+        order_ids = np.concatenate([order_ids, order_ids[paired]])
+        columns = np.concatenate([columns, (columns[paired] + 1) % len(product_ids)])
+        yield order_ids, product_ids[columns]
@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from product_assistant.facets import facet_index
+from product_assistant.fuzzy import fuzzy_index
+from product_assistant.search import product_index
+from product_assistant.snapshot import write_snapshot
+from product_assistant.suggest import suggest_index
+
+
+def memory_usage():
+    """Resident memory of this process in KiB, split into anonymous and file-backed"""
+    usage = {}
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'RssAnon', 'RssFile'):
+                    usage[key] = int(value.split()[0])
+    except OSError:
+        try:
+            import resource
+            usage['VmRSS'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        except ImportError:
+            pass
+    return usage
+
+
+class Command(BaseCommand):
+    help = 'Write the memory-mapped catalog snapshot that workers load on startup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.CATALOG_SNAPSHOT_PATH,
+                            help='Snapshot file to write (default: CATALOG_SNAPSHOT_PATH)')
+        parser.add_argument('--benchmark', action='store_true',
+                            help='Compare worker cold start and memory with and without the snapshot')
+        parser.add_argument('--measure-load', choices=['db', 'snapshot'], help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['measure_load']:
+            self._measure_load()
+            return
+
+        path = options['path']
+        if not path:
+            raise CommandError('No snapshot path configured (CATALOG_SNAPSHOT_PATH)')
+
+        started = time.perf_counter()
+        count = write_snapshot(path)
+        elapsed = time.perf_counter() - started
+        size = os.path.getsize(path)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {count} products to {path} ({size / 1024:.1f} KiB) in {elapsed:.2f}s'
+        ))
+
+        if options['benchmark']:
+            self._benchmark(path)
+
+    def _measure_load(self):
+        """Runs in a fresh process: build every catalog index the way a worker would"""
+        before = memory_usage()
+        started = time.perf_counter()
+        product_index.ensure_built()
+        fuzzy_index.ensure_built()
+        suggest_index.ensure_built()
+        facet_index.ensure_built()
+        elapsed = time.perf_counter() - started
+
+        query_started = time.perf_counter()
+        product_index.search('blood pressure monitor', in_stock=True, limit=10)
+        query_elapsed = time.perf_counter() - query_started
+
+        after = memory_usage()
+        self.stdout.write(json.dumps({
+            'startup_ms': elapsed * 1000,
+            'first_query_ms': query_elapsed * 1000,
+            'memory_before': before,
+            'memory_after': after,
+        }))
+
+    def _benchmark(self, path):
+        results = {}
+        for mode in ('db', 'snapshot'):
+            env = dict(os.environ)
+            env['CATALOG_SNAPSHOT_PATH'] = path if mode == 'snapshot' else ''
+            env.setdefault('DJANGO_SETTINGS_MODULE', os.environ.get('DJANGO_SETTINGS_MODULE', 'voicecart.settings'))
+            output = subprocess.run(
+                [sys.executable, '-m', 'django', 'build_catalog_snapshot', '--measure-load', mode],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+            ).stdout
+            results[mode] = json.loads(output.strip().splitlines()[-1])
+
+        for mode, label in (('db', 'from database'), ('snapshot', 'from snapshot')):
+            result = results[mode]
+            before, after = result['memory_before'], result['memory_after']
+            line = f'{label:>14}: cold start {result["startup_ms"]:.1f} ms, first query {result["first_query_ms"]:.2f} ms'
+            if 'VmRSS' in after and 'VmRSS' in before:
+                line += f', RSS +{after["VmRSS"] - before["VmRSS"]} KiB'
+            if 'RssAnon' in after and 'RssAnon' in before:
+                line += (
+                    f' (private +{after["RssAnon"] - before["RssAnon"]} KiB,'
+                    f' shared file pages +{after["RssFile"] - before["RssFile"]} KiB)'
+                )
+            self.stdout.write(line)
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from product_assistant import segments
+
+
+class Command(BaseCommand):
+    help = 'Rank the catalog for every shopper segment and store the personalized recommendation lists'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        lists = segments.rebuild()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Ranked {len(lists)} segments in {elapsed * 1000:.0f} ms'
+        ))
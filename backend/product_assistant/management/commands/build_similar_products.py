@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from product_assistant import similar
+from product_assistant.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the content-based similar products table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--show', type=int, default=5, help='Products whose neighbors to print')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        table, scores = similar.rebuild()
+        elapsed = time.perf_counter() - started
+
+        shown = [int(product_id) for product_id in table.ids[:options['show']]]
+        names = dict(Product.objects.filter(pk__in=[
+            *shown, *(int(neighbor) for row in table.neighbors[:len(shown), :3] for neighbor in row if neighbor)
+        ]).values_list('id', 'name'))
+        for row, product_id in enumerate(shown):
+            self.stdout.write(f'{names[product_id]}:')
+            for neighbor, score in zip(table.neighbors[row, :3], scores[row, :3]):
+                if neighbor:
+                    self.stdout.write(f'  {names[int(neighbor)]} ({score:.3f})')
+        self.stdout.write(self.style.SUCCESS(
+            f'Found neighbors of {len(table)} products in {elapsed:.1f} s'
+        ))
@@ -0,0 +1,266 @@
+from decimal import Decimal
+
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from accounts.models import Address, User, Wishlist
+from cart.models import Cart, CartItem
+from checkout import buy_again
+from checkout.models import DeliveryTracking, Order, OrderItem
+from payments.models import Payment
+from product_assistant import counters, index_sync, ranking, response_cache, similar, trending
+from product_assistant.facets import facet_index
+from product_assistant.fuzzy import fuzzy_index
+from product_assistant.models import BoughtTogether, Category, Product, ProductReview, UserPreference
+from product_assistant.search import product_index, search_products
+from product_assistant.snapshot import reset_snapshot
+from product_assistant.suggest import suggest_index
+from product_assistant.views import MAX_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        'Count the SQL queries of every API endpoint and admin changelist against '
+        'N and 10N seeded rows; fails if any count grows with N (an N+1 query)'
+    )
+
+    def add_arguments(self, parser):
+        # Small enough that list pages (20 rows) are not full in the small run
+        parser.add_argument('--rows', type=int, default=5, help='N: rows per seeded table in the small run')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        if rows < 2:
+            raise CommandError('--rows must be at least 2.')
+
+        # A throwaway database and a private cache: the real data is never
+        # touched, and every request is measured with cold caches
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                    'LOCATION': 'query-budget'}},
+                CATALOG_SNAPSHOT_PATH=None,
+                CATALOG_CHANGES_SETTLE_SECONDS=0,
+            ):
+                counts = [self._measure(rows), self._measure(rows * 10)]
+                self._check_index_rebuild()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            reset_snapshot()
+
+        grown = []
+        width = max(len(name) for name in counts[0])
+        self.stdout.write(f'{"endpoint":<{width}}  {"N=" + str(rows):>7}  {"N=" + str(rows * 10):>7}')
+        for name, small in counts[0].items():
+            large = counts[1][name]
+            line = f'{name:<{width}}  {small:>7}  {large:>7}'
+            if large > small:
+                grown.append(name)
+                self.stdout.write(self.style.ERROR(f'{line}  grows with N'))
+            else:
+                self.stdout.write(line)
+        if grown:
+            raise CommandError(f'Query count grows with the data for: {", ".join(grown)}')
+        self.stdout.write(self.style.SUCCESS(f'{len(counts[0])} endpoints within budget.'))
+
+    def _check_index_rebuild(self):
+        """
+        A worker that fell behind the index change log rebuilds its indexes
+        from the database (signals are bypassed to make them stale)
+        """
+        product = Product.objects.order_by('id').first()
+        Product.objects.filter(pk=product.pk).update(name='Zyzzogeton Rebuild Probe')
+        index_sync._rebuild(index_sync._applied or 0)
+        if product.pk not in search_products('zyzzogeton'):
+            raise CommandError('The in-memory indexes were not rebuilt from the change log')
+
+    def _measure(self, rows):
+        """``{endpoint: queries}`` for every endpoint against ``rows`` seeded rows"""
+        seeded = self._seed(rows)
+        clients = {'anonymous': Client(), 'shopper': Client(), 'staff': Client()}
+        clients['shopper'].force_login(seeded['shopper'])
+        clients['staff'].force_login(seeded['staff'])
+
+        counts = {}
+        for name, client, method, url, data in self._endpoints(seeded):
+            modes = [('', True)]
+            if url.startswith('/api/products/'):
+                # Also the serializer path that runs when cards are disabled
+                modes.append((' [serializer]', False))
+            for label, use_cards in modes:
+                with override_settings(PRODUCT_CARD_FRAGMENTS=use_cards):
+                    # The first request pays for one-off lookups (sessions,
+                    # content types, lazily built indexes)
+                    self._request(clients[client], method, url, data)
+                    with CaptureQueriesContext(connection) as queries:
+                        self._request(clients[client], method, url, data)
+                counts[name + label] = len(queries)
+        return counts
+
+    def _request(self, client, method, url, data):
+        cache.clear()
+        response_cache.invalidate()
+        # Rolled back, so requests that write (placing an order) leave the
+        # seeded data as it was
+        with transaction.atomic():
+            if method == 'POST':
+                response = client.post(url, data, content_type='application/json')
+            else:
+                response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            transaction.set_rollback(True)
+        # Recorded views go to the private cache's counters, not to Redis
+        trending.flush()
+        if response.status_code >= 400:
+            raise CommandError(f'{method} {url} returned {response.status_code}')
+
+    def _endpoints(self, seeded):
+        """``(name, client, method, url, data)`` of every endpoint measured"""
+        category = seeded['categories'][0].name
+        product_ids = [product.id for product in seeded['products']]
+        order = seeded['orders'][0]
+        endpoints = [
+            ('categories', 'anonymous', 'GET', '/api/products/categories/', None),
+            ('products', 'anonymous', 'GET', '/api/products/', None),
+            ('products by category', 'anonymous', 'GET', '/api/products/?' + urlencode({'category': category}), None),
+            ('products by price', 'anonymous', 'GET', '/api/products/?sort=price', None),
+            ('product search', 'anonymous', 'GET', '/api/products/?search=monitor', None),
+            ('product facets', 'anonymous', 'GET', '/api/products/?min_rating=1&facets=true', None),
+            ('product detail', 'anonymous', 'GET', f'/api/products/{product_ids[0]}/', None),
+            ('bought together', 'anonymous', 'GET', f'/api/products/{product_ids[0]}/bought-together/', None),
+            ('similar products', 'anonymous', 'GET', f'/api/products/{product_ids[0]}/similar/?limit=20', None),
+            ('product reviews', 'anonymous', 'GET', f'/api/products/{product_ids[0]}/reviews/', None),
+            ('submit review', 'shopper', 'POST', f'/api/products/{product_ids[0]}/reviews/',
+             {'rating': 4, 'comment': 'Reliable'}),
+            ('product batch', 'anonymous', 'GET',
+             '/api/products/batch/?ids=' + ','.join(str(pk) for pk in product_ids[:MAX_BATCH_SIZE]), None),
+            ('featured products', 'anonymous', 'GET', '/api/products/featured/', None),
+            ('recommendations', 'anonymous', 'GET', '/api/products/recommendations/', None),
+            ('personalized recommendations', 'shopper', 'GET', '/api/products/recommendations/', None),
+            ('trending products', 'anonymous', 'GET', f'/api/products/trending/?limit={len(product_ids)}', None),
+            ('catalog changes', 'anonymous', 'GET', '/api/products/changes/', None),
+            ('suggestions', 'anonymous', 'GET', '/api/products/suggest/?q=moni', None),
+            ('voice search', 'anonymous', 'POST', '/api/products/search/voice/', {'query': 'blood pressure monitor'}),
+            ('category products', 'anonymous', 'GET', f'/api/products/category/{category}/', None),
+            ('category stream', 'anonymous', 'GET', f'/api/products/category/{category}/?stream=true', None),
+            ('category facets', 'anonymous', 'GET',
+             f'/api/products/category/{category}/?' + urlencode({'facets': 'true', 'min_rating': 1}), None),
+            ('category stream filtered', 'anonymous', 'GET',
+             f'/api/products/category/{category}/?' + urlencode({'stream': 'true', 'min_rating': 1}), None),
+            ('cart', 'shopper', 'GET', '/api/cart/', None),
+            ('cart recommendations', 'shopper', 'GET', '/api/cart/recommendations/?limit=20', None),
+            ('wishlist', 'shopper', 'GET', '/api/accounts/wishlist/', None),
+            ('addresses', 'shopper', 'GET', '/api/accounts/addresses/', None),
+            ('orders', 'shopper', 'GET', '/api/checkout/orders/', None),
+            ('order detail', 'shopper', 'GET', f'/api/checkout/order/{order.order_id}/', None),
+            ('order tracking', 'shopper', 'GET', f'/api/checkout/track/{order.order_id}/', None),
+            ('buy again', 'shopper', 'GET', '/api/checkout/buy-again/', None),
+            ('reorder', 'shopper', 'POST', f'/api/checkout/order/{order.order_id}/reorder/', None),
+            ('payment status', 'shopper', 'GET', f'/api/payments/status/{order.payment.payment_id}/', None),
+            ('place order', 'shopper', 'POST', '/api/checkout/create/', {
+                'full_name': 'Budget Shopper', 'phone': '9999999999', 'address': '1 Query Lane',
+                'city': 'Pune', 'pincode': '411001', 'payment_method': 'cod',
+            }),
+        ]
+        for model in admin.site._registry:
+            opts = model._meta
+            endpoints.append((
+                f'admin {opts.app_label}.{opts.model_name}', 'staff', 'GET',
+                reverse(f'admin:{opts.app_label}_{opts.model_name}_changelist'), None,
+            ))
+        return endpoints
+
+    def _seed(self, rows):
+        """
+        A fresh catalog with ``rows`` categories, ``2 * rows`` products and
+        a shopper with ``rows`` wishlist items, cart items, addresses and
+        orders
+        """
+        call_command('flush', interactive=False, verbosity=0)
+        shopper = User.objects.create_user('budget-shopper', 'shopper@example.com', 'budget-password')
+        staff = User.objects.create_superuser('budget-admin', 'admin@example.com', 'budget-password')
+        reviewers = User.objects.bulk_create(
+            User(username=f'budget-reviewer-{i}', first_name=f'Reviewer {i}') for i in range(rows)
+        )
+
+        categories = Category.objects.bulk_create(
+            Category(name=f'Budget {i}', description='Seeded by check_query_budget') for i in range(rows)
+        )
+        # Half of the products share one category so that listings of it grow too
+        products = Product.objects.bulk_create(
+            Product(
+                name=f'Budget monitor {i}', description=f'Blood pressure monitor model {i}',
+                price=Decimal(100 + i), category=categories[0] if i < rows else categories[i - rows],
+                features=['digital display'], stock_quantity=10, rating=Decimal('4.5'),
+                review_count=rows if i == 0 else 1, is_featured=i % 2 == 0,
+            )
+            for i in range(2 * rows)
+        )
+        reviews = [ProductReview(product=products[0], user=user, rating=5, comment='Accurate') for user in reviewers]
+        reviews.extend(
+            ProductReview(product=product, user=reviewers[i % rows], rating=4, comment='Works')
+            for i, product in enumerate(products[1:], 1)
+        )
+        ProductReview.objects.bulk_create(reviews)
+        counters.recount()
+        BoughtTogether.objects.bulk_create(
+            BoughtTogether(product=products[i], related=products[rows + j], score=1 / (j + 1), rank=j + 1)
+            for i in range(rows) for j in range(rows)
+        )
+
+        for product in products:
+            trending.record('view', product.id)
+        trending.flush()
+
+        Wishlist.objects.bulk_create(Wishlist(user=shopper, product=product) for product in products[:rows])
+        preference = UserPreference.objects.create(user=shopper, age_group='60-70', health_conditions=['hypertension'])
+        preference.preferred_categories.set(categories)
+        Address.objects.bulk_create(
+            Address(user=shopper, full_name='Budget Shopper', phone='9999999999', address_line1=f'{i} Query Lane',
+                    city='Pune', state='Maharashtra', pincode='411001')
+            for i in range(rows)
+        )
+        cart = Cart.objects.create(user=shopper)
+        CartItem.objects.bulk_create(CartItem(cart=cart, product=product, quantity=2) for product in products[:rows])
+        orders = Order.objects.bulk_create(
+            Order(user=shopper, order_id=f'QB{i}', full_name='Budget Shopper', phone='9999999999',
+                  address='1 Query Lane', city='Pune', pincode='411001', payment_method='cod',
+                  total_amount=products[i].price)
+            for i in range(rows)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=products[i], product_name=products[i].name, product_price=products[i].price,
+                      quantity=1, subtotal=products[i].price)
+            for i, order in enumerate(orders)
+        )
+        buy_again.rebuild()
+        DeliveryTracking.objects.bulk_create(
+            DeliveryTracking(order=order, tracking_number=f'TRK{order.order_id}') for order in orders
+        )
+        Payment.objects.bulk_create(
+            Payment(order=order, payment_id=f'PAY{order.order_id}', gateway='stripe', amount=order.total_amount)
+            for order in orders
+        )
+
+        # bulk_create skips the signals that keep the in-memory indexes current
+        reset_snapshot()
+        product_index.build()
+        for index in (fuzzy_index, suggest_index, facet_index):
+            index.build()
+        # Precomputed on deploy; requests only read them
+        ranking.rebuild()
+        similar.rebuild()
+        return {'shopper': shopper, 'staff': staff, 'categories': categories, 'products': products,
+                'orders': orders}
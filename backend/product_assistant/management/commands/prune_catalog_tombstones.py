@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from product_assistant import changes
+
+
+class Command(BaseCommand):
+    help = 'Delete catalog deletion records older than CATALOG_TOMBSTONE_RETENTION_DAYS'
+
+    def handle(self, *args, **options):
+        pruned = changes.prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(f'Pruned {pruned} tombstone(s)'))
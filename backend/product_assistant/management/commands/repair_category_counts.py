@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from product_assistant import counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-category in-stock product counters'
+
+    def handle(self, *args, **options):
+        fixed = counters.recount()
+        for category, stored, actual in fixed:
+            self.stdout.write(f'{category.name}: {stored} -> {actual}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Repaired {len(fixed)} category counter(s)' if fixed else 'All category counters are correct'
+        ))
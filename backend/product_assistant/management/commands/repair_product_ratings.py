@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from product_assistant import ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute every product\'s rating, review count and star histogram from its reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only list the products that would change')
+
+    def handle(self, *args, **options):
+        fixed = ratings.recompute(dry_run=options['dry_run'])
+        for product, (stored_count, stored_rating), (count, rating) in fixed:
+            self.stdout.write(f'{product.name}: {stored_rating} ({stored_count}) -> {rating} ({count})')
+        verb = 'Would repair' if options['dry_run'] else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {len(fixed)} product rating(s)' if fixed else 'All product ratings are correct'
+        ))
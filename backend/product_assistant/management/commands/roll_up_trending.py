@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from product_assistant import trending
+from product_assistant.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Rank the recent product views, add-to-carts and orders into the trending products list'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--show', type=int, default=10, help='Trending products to print')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        top = trending.roll_up()
+        elapsed = time.perf_counter() - started
+
+        shown = top[:options['show']]
+        names = dict(Product.objects.filter(pk__in=[product_id for product_id, _ in shown]).values_list('id', 'name'))
+        for product_id, score in shown:
+            self.stdout.write(f'{names[product_id]} ({score:.1f})')
+        self.stdout.write(self.style.SUCCESS(
+            f'Ranked {len(top)} trending products in {elapsed * 1000:.0f} ms'
+        ))
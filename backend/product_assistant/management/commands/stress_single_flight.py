@@ -0,0 +1,86 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+
+from product_assistant import response_cache
+from product_assistant.models import Category
+from product_assistant.search import product_index
+
+
+class Command(BaseCommand):
+    help = 'Fire concurrent identical catalog reads right after an invalidation and count database queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=32, help='Concurrent requests per round')
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--url', action='append', help='Endpoint to hit (repeatable)')
+
+    def handle(self, *args, **options):
+        urls = options['url']
+        if not urls:
+            category = Category.objects.order_by('-in_stock_count').first()
+            if category is None:
+                raise CommandError('No categories in the catalog to read.')
+            urls = [f'/api/products/?category={category.name}', '/api/products/categories/']
+        product_index.ensure_built()
+
+        hosts = [host for host in settings.ALLOWED_HOSTS if '*' not in host and not host.startswith('.')]
+        self.host = hosts[0] if hosts else 'localhost'
+
+        for url in urls:
+            # Queries one uncontended miss needs (after a warm-up request)
+            for _ in range(2):
+                response_cache.invalidate()
+                single = self._round(url, 1)
+            self.stdout.write(f'{url}\n  one request: {single} queries')
+            for enabled in (False, True):
+                with override_settings(CATALOG_SINGLE_FLIGHT=enabled):
+                    counts = []
+                    started = time.perf_counter()
+                    for _ in range(options['rounds']):
+                        response_cache.invalidate()
+                        counts.append(self._round(url, options['threads']))
+                    elapsed = time.perf_counter() - started
+                label = 'single-flight' if enabled else 'uncoalesced  '
+                self.stdout.write(
+                    f'  {label} {options["threads"]} concurrent requests: '
+                    f'{min(counts)}-{max(counts)} queries per round '
+                    f'({max(counts) / single:.1f}x one request), {elapsed / options["rounds"] * 1000:.0f} ms per round'
+                )
+
+    def _round(self, url, threads):
+        """Fire ``threads`` simultaneous GETs; returns the total query count"""
+        barrier = threading.Barrier(threads)
+        lock = threading.Lock()
+        queries = []
+        failures = []
+
+        def count(execute, sql, params, many, context):
+            with lock:
+                queries.append(sql)
+            return execute(sql, params, many, context)
+
+        def request():
+            client = Client(HTTP_HOST=self.host)
+            try:
+                barrier.wait()
+                with connection.execute_wrapper(count):
+                    response = client.get(url)
+                if response.status_code != 200:
+                    failures.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=request) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        if failures:
+            raise CommandError(f'{url} returned {failures[0]}')
+        return len(queries)
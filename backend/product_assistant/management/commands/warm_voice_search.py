@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from product_assistant import query_cache
+from product_assistant.views import voice_search_results
+
+
+class Command(BaseCommand):
+    help = 'Pre-warm the voice search result cache with the most popular queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=100,
+                            help='Number of popular queries to warm (default 100)')
+        parser.add_argument('--query', action='append', default=[],
+                            help='Extra query to warm; may be repeated')
+
+    def handle(self, *args, **options):
+        queries = [phrase for phrase, _ in query_cache.popular_queries(options['top'])]
+        queries.extend(options['query'])
+
+        warmed = set()
+        started = time.perf_counter()
+        for query in queries:
+            phrase = query_cache.normalize_query(query)
+            if not phrase or phrase in warmed:
+                continue
+            query_cache.store_results(phrase, voice_search_results(phrase))
+            warmed.add(phrase)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Warmed {len(warmed)} voice search queries in {elapsed:.2f}s'
+        ))
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:43
+
+from django.db import migrations, models
+
+
+DEFAULT_SYNONYMS = [
+    ('bp machine', 'blood pressure monitor'),
+    ('bp monitor', 'blood pressure monitor'),
+    ('sugar test kit', 'glucose monitor kit'),
+    ('sugar machine', 'glucose monitor'),
+    ('sugar strips', 'glucose test strips'),
+    ('walker stick', 'walking stick'),
+    ('chashma', 'reading glasses'),
+    ('dawai', 'medicine'),
+    ('dawai box', 'pill organizer'),
+    ('goli', 'tablets'),
+    ('haldi', 'turmeric'),
+    ('machli ka tel', 'fish oil'),
+    ('bukhar meter', 'thermometer'),
+    ('sahara', 'support'),
+]
+
+
+def add_default_synonyms(apps, schema_editor):
+    SearchSynonym = apps.get_model('product_assistant', 'SearchSynonym')
+    for phrase, replacement in DEFAULT_SYNONYMS:
+        SearchSynonym.objects.get_or_create(phrase=phrase, defaults={'replacement': replacement})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_assistant', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchSynonym',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phrase', models.CharField(max_length=100, unique=True)),
+                ('replacement', models.CharField(max_length=200)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['phrase'],
+            },
+        ),
+        migrations.RunPython(add_default_synonyms, migrations.RunPython.noop),
+    ]
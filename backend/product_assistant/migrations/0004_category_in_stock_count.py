@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 08:03
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_in_stock_products(apps, schema_editor):
+    Category = apps.get_model('product_assistant', 'Category')
+    Product = apps.get_model('product_assistant', 'Product')
+    counts = Product.objects.filter(in_stock=True).values_list('category').annotate(count=Count('id'))
+    for category_id, count in counts:
+        Category.objects.filter(pk=category_id).update(in_stock_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_assistant', '0003_product_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='in_stock_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_in_stock_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 4.2.7 on 2026-10-18 08:30
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def seed_rating_aggregates(apps, schema_editor):
+    # Imported ratings carry forward as a star total; the histogram can
+    # only count the reviews on record
+    Product = apps.get_model('product_assistant', 'Product')
+    ProductReview = apps.get_model('product_assistant', 'ProductReview')
+    for product in Product.objects.filter(review_count__gt=0).only('id', 'rating', 'review_count'):
+        Product.objects.filter(pk=product.pk).update(rating_total=round(product.rating * product.review_count))
+    rows = ProductReview.objects.values_list('product', 'rating').annotate(count=Count('id')).order_by()
+    for product_id, stars, count in rows:
+        Product.objects.filter(pk=product_id).update(**{f'rating_{stars}_count': count})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_assistant', '0005_catalog_changes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='rating',
+            field=models.DecimalField(decimal_places=2, default=0.0, editable=False, max_digits=3),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='productreview',
+            index=models.Index(fields=['product', 'created_at', 'id'], name='review_product_created_idx'),
+        ),
+        migrations.RunPython(seed_rating_aggregates, migrations.RunPython.noop),
+    ]
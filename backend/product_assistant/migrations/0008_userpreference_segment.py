@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:08
+
+import hashlib
+import json
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def seed_segments(apps, schema_editor):
+    # Same key as segments.segment_key at the time of writing;
+    # build_segment_recommendations fixes any that drift later
+    UserPreference = apps.get_model('product_assistant', 'UserPreference')
+    categories = defaultdict(list)
+    for preference_id, category_id in UserPreference.preferred_categories.through.objects.values_list(
+        'userpreference_id', 'category_id'
+    ):
+        categories[preference_id].append(category_id)
+    for preference in UserPreference.objects.only('id', 'age_group', 'health_conditions'):
+        conditions = {' '.join(str(condition).lower().split()) for condition in preference.health_conditions or []}
+        conditions = sorted(conditions - {''})
+        canonical = json.dumps([preference.age_group or '', conditions, sorted(set(categories[preference.id]))])
+        UserPreference.objects.filter(pk=preference.pk).update(segment=hashlib.sha1(canonical.encode()).hexdigest())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_assistant', '0007_bought_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userpreference',
+            name='segment',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=40),
+        ),
+        migrations.RunPython(seed_segments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:23
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def seed_imported_rating(apps, schema_editor):
+    # Whatever the aggregates hold beyond the reviews on record was imported
+    Product = apps.get_model('product_assistant', 'Product')
+    ProductReview = apps.get_model('product_assistant', 'ProductReview')
+    recorded = {
+        product_id: (count, total)
+        for product_id, count, total in ProductReview.objects.values_list('product')
+        .annotate(count=Count('id'), total=Sum('rating')).order_by()
+    }
+    for product in Product.objects.filter(review_count__gt=0).only('id', 'review_count', 'rating_total'):
+        count, total = recorded.get(product.id, (0, 0))
+        if product.review_count > count:
+            Product.objects.filter(pk=product.pk).update(
+                imported_review_count=product.review_count - count,
+                imported_rating_total=max(product.rating_total - total, 0),
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_assistant', '0008_userpreference_segment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='imported_rating_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='imported_review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(seed_imported_rating, migrations.RunPython.noop),
+    ]
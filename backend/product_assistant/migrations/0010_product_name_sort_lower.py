@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:44
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_assistant', '0009_imported_rating'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_stock_name_idx',
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.db.models.functions.text.Lower('name'), models.F('id'), condition=models.Q(('in_stock', True)), name='product_stock_name_idx'),
+        ),
+    ]
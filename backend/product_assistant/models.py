@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Lower
 from django.conf import settings
 
 class Category(models.Model):
@@ -6,9 +8,15 @@ class Category(models.Model):
     description = models.TextField(blank=True)
     icon = models.CharField(max_length=10, default='📦')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by Product.save and the delete signal (see counters.py)
+    in_stock_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         verbose_name_plural = "Categories"
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='category_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -22,18 +30,63 @@ class Product(models.Model):
     features = models.JSONField(default=list)
     in_stock = models.BooleanField(default=True)
     stock_quantity = models.PositiveIntegerField(default=0)
-    rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.0)
-    review_count = models.PositiveIntegerField(default=0)
+    # Review aggregates, maintained by ProductReview.save and the delete
+    # signal (see ratings.py): rating is rating_total / review_count, both
+    # of which include the imported baseline below
+    rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.0, editable=False)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_total = models.PositiveIntegerField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+    # Rating imported with the product (catalog loaders), without review rows
+    imported_review_count = models.PositiveIntegerField(default=0, editable=False)
+    imported_rating_total = models.PositiveIntegerField(default=0, editable=False)
     is_featured = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        # Keyset pagination of listings, which only show in-stock products:
+        # one (sort key, id) index per sort order
+        indexes = [
+            models.Index(fields=['price', 'id'], condition=models.Q(in_stock=True), name='product_stock_price_idx'),
+            models.Index(fields=['rating', 'id'], condition=models.Q(in_stock=True), name='product_stock_rating_idx'),
+            # The name sort is case-insensitive (see pagination.SORT_EXPRESSIONS)
+            models.Index(Lower('name'), F('id'), condition=models.Q(in_stock=True), name='product_stock_name_idx'),
+            models.Index(fields=['created_at', 'id'], condition=models.Q(in_stock=True),
+                         name='product_stock_created_idx'),
+            # Delta sync (changes.py)
+            models.Index(fields=['updated_at', 'id'], name='product_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        from .counters import product_moved
+        from .ratings import import_rating
+        from .similar import CONTENT_FIELDS, content_changed
+
+        if self._state.adding:
+            import_rating(self)
+        # Move this product between the category in-stock counters in the
+        # same transaction as the row itself
+        with transaction.atomic():
+            before = None
+            if self.pk is not None:
+                before = Product.objects.select_for_update().filter(pk=self.pk).values(*CONTENT_FIELDS).first()
+            super().save(*args, **kwargs)
+            after = {field: getattr(self, field) for field in CONTENT_FIELDS}
+            product_moved(
+                (before['category_id'], before['in_stock']) if before is not None else None,
+                (self.category_id, self.in_stock),
+            )
+            content_changed(before, after)
+
 class ProductReview(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -43,10 +96,64 @@ class ProductReview(models.Model):
 
     class Meta:
         unique_together = ('product', 'user')
+        indexes = [
+            # Newest-first keyset pagination of a product's reviews
+            models.Index(fields=['product', 'created_at', 'id'], name='review_product_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.rating} stars"
 
+    def save(self, *args, **kwargs):
+        from .ratings import review_moved
+
+        # Move the stars between the products' aggregates in the same
+        # transaction as the review itself
+        with transaction.atomic():
+            before = None
+            if self.pk is not None:
+                before = ProductReview.objects.filter(pk=self.pk).values_list('product_id', 'rating').first()
+            super().save(*args, **kwargs)
+            review_moved(before, (self.product_id, self.rating))
+
+class CatalogTombstone(models.Model):
+    """
+    Deletion log for catalog delta sync: tells clients holding a local
+    copy which products and categories to drop. Pruned after
+    ``CATALOG_TOMBSTONE_RETENTION_DAYS`` (manage.py prune_catalog_tombstones).
+    """
+    PRODUCT = 'product'
+    CATEGORY = 'category'
+
+    kind = models.CharField(max_length=10, choices=[(PRODUCT, 'Product'), (CATEGORY, 'Category')])
+    object_id = models.PositiveIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} deleted"
+
+class BoughtTogether(models.Model):
+    """
+    A product frequently ordered together with ``product``, as of the last
+    ``manage.py build_bought_together`` run (see bought_together.py)
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='bought_together')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ('product', 'rank')
+        ordering = ['product', 'rank']
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} (#{self.rank})"
+
 class UserPreference(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     preferred_categories = models.ManyToManyField(Category, blank=True)
@@ -56,8 +163,45 @@ class UserPreference(models.Model):
         ('70+', '70+ years'),
     ], blank=True)
     health_conditions = models.JSONField(default=list)
+    # Key of the age group x health conditions x preferred categories
+    # combination, for personalized recommendations (see segments.py)
+    segment = models.CharField(max_length=40, blank=True, editable=False, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"{self.user.username} preferences"
\ No newline at end of file
+        return f"{self.user.username} preferences"
+
+    def save(self, *args, **kwargs):
+        from .segments import segment_key
+
+        category_ids = []
+        if self.pk is not None:
+            category_ids = list(self.preferred_categories.values_list('id', flat=True))
+        self.segment = segment_key(self.age_group, self.health_conditions, category_ids)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'segment' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'segment']
+        super().save(*args, **kwargs)
+
+class SearchSynonym(models.Model):
+    """
+    Phrase users say mapped to the catalog wording, e.g. "bp machine" ->
+    "blood pressure monitor" or Hinglish "dawai" -> "medicine".
+    """
+    phrase = models.CharField(max_length=100, unique=True)
+    replacement = models.CharField(max_length=200)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['phrase']
+
+    def __str__(self):
+        return f"{self.phrase} -> {self.replacement}"
+
+    def save(self, *args, **kwargs):
+        # Stored normalized so the automaton matches what the tokenizer sees
+        self.phrase = ' '.join(self.phrase.lower().split())
+        super().save(*args, **kwargs)
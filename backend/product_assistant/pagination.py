@@ -0,0 +1,213 @@
+"""
+Keyset (cursor) pagination for product listings and product reviews.
+
+Pages are addressed by an opaque cursor holding the sort value and id of
+the last product served, so the next page is a ``WHERE (value, id) > ...``
+range scan on the matching composite index instead of ``OFFSET`` plus a
+``COUNT(*)``: every page costs the same however deep the user scrolls, and
+products inserted meanwhile cannot shift items between pages.
+"""
+import base64
+import json
+from bisect import bisect_right
+from decimal import Decimal
+
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+# sort parameter -> (model field, descending); id breaks ties in the same direction
+ORDERINGS = {
+    'price_low': ('price', False),
+    'price_high': ('price', True),
+    'rating': ('rating', True),
+    'name': ('name_lower', False),
+    'newest': ('created_at', True),
+}
+DEFAULT_SORT = 'newest'
+
+# Sort values computed in the query. Names sort case-insensitively, like
+# the in-memory index does (search.SORT_KEYS), so a listing keeps its order
+# whether or not it is answered from the index
+SORT_EXPRESSIONS = {
+    'name_lower': Lower('name'),
+}
+
+# Search results ranked by relevance have no sort value to key on
+RELEVANCE = 'relevance'
+
+
+def order_by_key(queryset, field, descending):
+    """Order by ``field``, id breaking ties in the same direction"""
+    if field in SORT_EXPRESSIONS:
+        queryset = queryset.annotate(**{field: SORT_EXPRESSIONS[field]})
+    if descending:
+        return queryset.order_by(f'-{field}', '-id')
+    return queryset.order_by(field, 'id')
+
+
+def order_products(queryset, sort):
+    """Order a product queryset by a listing sort, id breaking ties"""
+    return order_by_key(queryset, *ORDERINGS.get(sort, ORDERINGS[DEFAULT_SORT]))
+
+
+def encode_cursor(position):
+    data = json.dumps(position, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        position = json.loads(data)
+    except (ValueError, TypeError):
+        raise NotFound('Invalid cursor')
+    if not isinstance(position, dict):
+        raise NotFound('Invalid cursor')
+    return position
+
+
+class ProductCursorPagination(BasePagination):
+    """
+    Cursor pagination over a queryset (``paginate_queryset``) or over an
+    already ordered list of product ids from the in-memory indexes
+    (``paginate_ids``). Responses have ``next`` and ``results`` only.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    orderings = ORDERINGS
+    default_sort = DEFAULT_SORT
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        page_size = api_settings.PAGE_SIZE or 20
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return page_size
+        return max(1, min(requested, self.max_page_size))
+
+    def get_sort(self, request):
+        sort = request.query_params.get('sort')
+        return sort if sort in self.orderings else self.default_sort
+
+    def _position(self, request, sort):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        position = decode_cursor(cursor)
+        if position.get('s') != sort:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        sort = self.get_sort(request)
+        field, descending = self.orderings[sort]
+        queryset = order_by_key(queryset, field, descending)
+
+        position = self._position(request, sort)
+        if position is not None:
+            try:
+                value = self._parse_value(field, position['v'])
+                last_id = int(position['id'])
+            except (KeyError, TypeError, ValueError, ArithmeticError):
+                raise NotFound(self.invalid_cursor_message)
+            # (value, id) past the cursor, written so that the leading range
+            # condition can drive an index range scan
+            beyond = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field}__{beyond}e': value}),
+                Q(**{f'{field}__{beyond}': value}) | Q(**{f'id__{beyond}': last_id}),
+            )
+
+        rows = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            self.next_position = {'s': sort, 'v': self._format_value(getattr(last, field)), 'id': last.id}
+        return rows
+
+    def paginate_ids(self, product_ids, request, sort_key=None):
+        """
+        Page through ids already ordered by ``sort_key`` (an increasing
+        key per id), or ranked by relevance when ``sort_key`` is None.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        if sort_key is None:
+            position = self._position(request, RELEVANCE)
+            try:
+                start = int(position['o']) if position else 0
+            except (KeyError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            page = product_ids[start:start + page_size]
+            self.next_position = None
+            if start + page_size < len(product_ids):
+                self.next_position = {'s': RELEVANCE, 'o': start + page_size}
+            return page
+
+        sort = self.get_sort(request)
+        position = self._position(request, sort)
+        start = 0
+        if position is not None:
+            try:
+                start = bisect_right(product_ids, tuple(position['k']), key=sort_key)
+            except (KeyError, TypeError):
+                raise NotFound(self.invalid_cursor_message)
+        page = product_ids[start:start + page_size]
+        self.next_position = None
+        if start + page_size < len(product_ids):
+            self.next_position = {'s': sort, 'k': list(sort_key(page[-1]))}
+        return page
+
+    def _parse_value(self, field, value):
+        if field in ('price', 'rating'):
+            return Decimal(value)
+        if field == 'created_at':
+            parsed = parse_datetime(value)
+            if parsed is None:
+                raise ValueError(value)
+            return parsed
+        return str(value)
+
+    def _format_value(self, value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return str(value)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ReviewCursorPagination(ProductCursorPagination):
+    """Newest-first keyset pagination of a product's reviews"""
+    orderings = {'newest': ('created_at', True)}
+    default_sort = 'newest'
@@ -0,0 +1,146 @@
+"""
+Result cache for voice search.
+
+A few phrasings ("blood pressure monitor", "vitamin d") make up most voice
+traffic, so whole voice_search responses are kept in the shared cache under
+a normalized form of the query: lowercased, filler ("please show me") and
+stopwords dropped. Word order is kept: synonym rewriting and prefix
+matching of the last word depend on it. Keys include a catalog version that is
+bumped whenever products, categories or synonyms change, so a catalog edit
+retires every cached result at once.
+
+Query frequencies are kept in a Redis sorted set so that the most popular
+queries can be pre-warmed after a deploy or catalog import
+(``manage.py warm_voice_search``).
+"""
+import hashlib
+import logging
+import re
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from redis.exceptions import RedisError
+
+from .cache_backend import redis_client
+from .search import STOPWORDS
+
+logger = logging.getLogger(__name__)
+
+NON_WORD_RE = re.compile(r'[^a-z0-9]+')
+
+VERSION_CACHE_KEY = 'voice_search:version'
+RESULT_KEY_PREFIX = 'voice_search:result'
+POPULAR_QUERIES_KEY = 'voice_search:popular'
+
+# Spoken filler around the actual product words
+FILLER_PHRASES = [
+    'i am looking for', 'im looking for', 'looking for', 'do you have',
+    'can you show me', 'could you show me', 'can you find', 'could you find',
+    'show me', 'find me', 'get me', 'give me', 'search for', 'i want', 'i need',
+    'i would like', 'id like',
+]
+FILLER_WORDS = frozenset([
+    'please', 'kindly', 'some', 'any', 'hey', 'hi', 'ok', 'okay', 'um', 'uh',
+    'buy', 'show', 'find', 'search',
+])
+_FILLER_RE = re.compile(
+    r'\b(?:' + '|'.join(re.escape(phrase) for phrase in
+                        sorted(FILLER_PHRASES, key=len, reverse=True)) + r')\b'
+)
+
+# Distinct queries kept in the popularity set
+MAX_TRACKED_QUERIES = 10000
+
+
+def cache_ttl():
+    return getattr(settings, 'VOICE_SEARCH_CACHE_TTL', 300)
+
+
+def normalize_query(query):
+    """
+    The product words of a spoken query, in the order spoken; searched for
+    and used as the cache key
+    """
+    text = NON_WORD_RE.sub(' ', query.lower()).strip()
+    stripped = _FILLER_RE.sub(' ', text)
+    words = [
+        word for word in stripped.split()
+        if word not in FILLER_WORDS and word not in STOPWORDS
+    ]
+    if not words:
+        # Nothing but filler ("show me some"): search for what was said
+        words = text.split()
+    return ' '.join(words)
+
+
+def _current_version():
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        version = time.time_ns()
+        cache.add(VERSION_CACHE_KEY, version, None)
+        version = cache.get(VERSION_CACHE_KEY, version)
+    return version
+
+
+def _result_key(key, version):
+    digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+    return f'{RESULT_KEY_PREFIX}:{version}:{digest}'
+
+
+def get_results(key):
+    """Cached voice search payload for a normalized query, or None"""
+    try:
+        return cache.get(_result_key(key, _current_version()))
+    except RedisError as error:
+        logger.warning('Voice search cache unavailable: %s', error)
+        return None
+
+
+def store_results(key, payload):
+    try:
+        cache.set(_result_key(key, _current_version()), payload, cache_ttl())
+    except RedisError as error:
+        logger.warning('Voice search cache unavailable: %s', error)
+
+
+def invalidate():
+    """Called when the catalog or synonyms change: bump the shared version"""
+    try:
+        cache.set(VERSION_CACHE_KEY, time.time_ns(), None)
+    except RedisError as error:
+        logger.warning('Could not invalidate voice search cache: %s', error)
+
+
+# Popularity
+
+_local_counts = Counter()
+
+
+def record_query(phrase):
+    """Count a voice query that returned results"""
+    if not phrase:
+        return
+    client = redis_client()
+    if client is None:
+        _local_counts[phrase] += 1
+        return
+    try:
+        with client.pipeline(transaction=False) as pipe:
+            pipe.zincrby(POPULAR_QUERIES_KEY, 1, phrase)
+            pipe.zremrangebyrank(POPULAR_QUERIES_KEY, 0, -MAX_TRACKED_QUERIES - 1)
+            pipe.execute()
+    except RedisError as error:
+        logger.warning('Could not record voice query: %s', error)
+
+
+def popular_queries(limit):
+    """Most frequent voice queries as ``[(phrase, count), ...]``"""
+    client = redis_client()
+    if client is None:
+        return _local_counts.most_common(limit)
+    return [
+        (phrase.decode('utf-8'), int(count))
+        for phrase, count in client.zrevrange(POPULAR_QUERIES_KEY, 0, limit - 1, withscores=True)
+    ]
@@ -0,0 +1,215 @@
+"""
+Precomputed top-rated product lists for recommendations.
+
+Products are ranked by Bayesian average rating: every product starts with
+``RANKING_PRIOR_REVIEWS`` virtual reviews at the catalog-wide mean, so a
+5.0 with two reviews no longer outranks a 4.6 with four hundred. The
+ranking is computed from one query over the in-stock products and the top
+``RANKED_LIST_SIZE`` ids are stored in the shared cache, overall and per
+category, under a build version; a recommendation request is then a
+cache lookup.
+
+Requests never compute the ranking. ``manage.py rank_products`` builds
+the lists (on deploy, and from cron if wanted). Catalog changes (product
+saves, including rating updates, and deletes) mark the lists as changed;
+the first request after ``RANKING_REBUILD_INTERVAL`` seconds starts a
+rebuild in a background thread (one worker at a time) and the current
+lists are served until it is stored, so bursts of edits cost one rebuild.
+Missing lists are rebuilt the same way, serving the worker's last build
+meanwhile, or a plain by-rating ordering (one LIMIT query) if it has none.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from redis.exceptions import RedisError
+
+from . import single_flight
+
+logger = logging.getLogger(__name__)
+
+STATE_KEY = 'ranking:state'
+CHANGED_KEY = 'ranking:changed'
+LOCK_KEY = 'ranking:lock'
+LIST_KEY_PREFIX = 'ranking:list'
+
+GLOBAL_SCOPE = 'all'
+
+# Products per recommendation response unless ?limit= says otherwise
+DEFAULT_LIMIT = 6
+
+# Seconds the lists of a build are kept (a later build replaces them)
+LIST_TTL = 86400
+
+
+def prior_reviews():
+    return getattr(settings, 'RANKING_PRIOR_REVIEWS', 25)
+
+
+def list_size():
+    return getattr(settings, 'RANKED_LIST_SIZE', 50)
+
+
+def rebuild_interval():
+    return getattr(settings, 'RANKING_REBUILD_INTERVAL', 60)
+
+
+def list_key(version, scope):
+    return f'{LIST_KEY_PREFIX}:{version}:{scope}'
+
+
+def bayesian_score(stars, reviews, mean, weight):
+    """Average of ``reviews`` ratings summing to ``stars`` plus ``weight`` ratings of ``mean``"""
+    return (weight * mean + stars) / (weight + reviews)
+
+
+def scored():
+    """``[(product id, category id, score, review count), ...]`` of the in-stock products, best first"""
+    from .models import Product
+
+    rows = [
+        (product_id, category_id, float(rating) * count, count)
+        for product_id, category_id, rating, count in
+        Product.objects.filter(in_stock=True).values_list('id', 'category_id', 'rating', 'review_count')
+    ]
+    reviews = sum(count for _, _, _, count in rows)
+    mean = sum(stars for _, _, stars, _ in rows) / reviews if reviews else 0.0
+    weight = prior_reviews()
+    rows = [
+        (product_id, category_id, bayesian_score(stars, count, mean, weight), count)
+        for product_id, category_id, stars, count in rows
+    ]
+    rows.sort(key=lambda row: (-row[2], -row[3], row[0]))
+    return rows
+
+
+def compute():
+    """``{GLOBAL_SCOPE or category id: [product id, ...]}``, best first"""
+    rows = scored()
+    size = list_size()
+    lists = {GLOBAL_SCOPE: [row[0] for row in rows[:size]]}
+    for product_id, category_id, _, _ in rows:
+        ids = lists.setdefault(category_id, [])
+        if len(ids) < size:
+            ids.append(product_id)
+    return lists
+
+
+_lists = None      # lists of this process's last build
+_refreshing = threading.Lock()
+_last_attempt = 0.0
+
+
+def rebuild():
+    """Compute and store the lists under a new version; returns the lists"""
+    global _lists, _last_attempt
+    started = _last_attempt = time.time()
+    lists = compute()
+    version = time.time_ns()
+    state = {
+        'version': version,
+        'built_at': started,
+        'categories': frozenset(scope for scope in lists if scope != GLOBAL_SCOPE),
+    }
+    try:
+        cache.set_many({list_key(version, scope): ids for scope, ids in lists.items()}, LIST_TTL)
+        cache.set(STATE_KEY, state, LIST_TTL)
+    except RedisError as error:
+        logger.warning('Could not store product ranking: %s', error)
+    _lists = lists
+    return lists
+
+
+def mark_changed():
+    """Called (on commit) when catalog data changes"""
+    try:
+        cache.set(CHANGED_KEY, time.time(), None)
+    except RedisError as error:
+        logger.warning('Could not mark product ranking as changed: %s', error)
+
+
+def _rebuild_once():
+    """Rebuild unless another worker is at it"""
+    token = single_flight.acquire(LOCK_KEY)
+    if token is None:
+        return
+    try:
+        rebuild()
+    finally:
+        single_flight.release(LOCK_KEY, token)
+
+
+def _rebuild_in_background():
+    global _last_attempt
+    # While another worker rebuilds, try again after an interval rather
+    # than on every request
+    if time.time() - _last_attempt < rebuild_interval() or not _refreshing.acquire(blocking=False):
+        return
+    _last_attempt = time.time()
+
+    def run():
+        try:
+            _rebuild_once()
+        except Exception:
+            logger.exception('Could not rebuild product ranking')
+        finally:
+            connection.close()
+            _refreshing.release()
+
+    threading.Thread(target=run, name='product-ranking', daemon=True).start()
+
+
+def by_rating(scope):
+    """Top in-stock products by plain rating, one LIMIT query: served until a ranking is built"""
+    from .models import Product
+
+    products = Product.objects.filter(in_stock=True)
+    if scope != GLOBAL_SCOPE:
+        products = products.filter(category_id=scope)
+    return list(
+        products.order_by('-rating', '-id').values_list('id', flat=True)[:list_size()]
+    )
+
+
+def _last_built(scope):
+    return _lists.get(scope, []) if _lists is not None else by_rating(scope)
+
+
+def ranked_ids(category_id=None):
+    """Ids of the top-ranked in-stock products, overall or in one category"""
+    scope = GLOBAL_SCOPE if category_id is None else category_id
+    try:
+        found = cache.get_many([STATE_KEY, CHANGED_KEY])
+    except RedisError as error:
+        logger.warning('Product ranking cache unavailable: %s', error)
+        if _lists is None:
+            _rebuild_in_background()
+        return _last_built(scope)
+
+    state = found.get(STATE_KEY)
+    changed = found.get(CHANGED_KEY)
+    due = state is None or (
+        changed is not None and changed > state['built_at']
+        and time.time() - state['built_at'] >= rebuild_interval()
+    )
+    if due:
+        # The current lists are served until the rebuild is stored
+        _rebuild_in_background()
+    if state is None:
+        return _last_built(scope)
+
+    if scope != GLOBAL_SCOPE and scope not in state['categories']:
+        return []
+    try:
+        ids = cache.get(list_key(state['version'], scope))
+    except RedisError as error:
+        logger.warning('Product ranking cache unavailable: %s', error)
+        ids = None
+    if ids is None:
+        # Evicted from the cache
+        _rebuild_in_background()
+        return _last_built(scope)
+    return ids
@@ -0,0 +1,139 @@
+"""
+Denormalized product review aggregates.
+
+``Product.review_count``, ``rating_total`` (the sum of all stars), the
+per-star histogram ``rating_1_count`` .. ``rating_5_count`` and the
+average ``rating`` are adjusted in the same transaction as the review
+change that moves them (see ``ProductReview.save`` and the delete signal):
+the product row is locked, the review's stars are added or taken away and
+the average is derived from the new total, so no AVG over a product's
+reviews ever runs.
+
+A rating given when a product is created (catalog loaders: an average and
+a count, no review rows) is kept as a baseline in ``imported_review_count``
+and ``imported_rating_total``; the count and total are that baseline plus
+the reviews on record. The histogram columns count the reviews on record,
+and ``histogram`` spreads the imported reviews over the two star values
+nearest their average so that it sums to ``review_count``.
+``manage.py repair_product_ratings`` recomputes every aggregate from the
+baseline and the reviews with a single GROUP BY.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import index_sync, response_cache
+
+STARS = range(1, 6)
+
+AGGREGATE_FIELDS = ['review_count', 'rating_total', 'rating'] + [f'rating_{stars}_count' for stars in STARS]
+BASELINE_FIELDS = ['imported_review_count', 'imported_rating_total']
+
+
+def average(total, count):
+    """Average rating for a sum of stars, as stored in ``Product.rating``"""
+    if not count:
+        return Decimal('0.00')
+    return (Decimal(total) / count).quantize(Decimal('0.01'))
+
+
+def import_rating(product):
+    """Take the rating a new product was created with as its baseline"""
+    if product.review_count and not product.imported_review_count:
+        product.imported_review_count = product.review_count
+        product.imported_rating_total = round(Decimal(product.rating) * product.review_count)
+        product.rating_total = product.imported_rating_total
+        product.rating = average(product.rating_total, product.review_count)
+
+
+def imported_stars(count, total):
+    """
+    ``{stars: count}`` of ``count`` imported reviews totalling ``total``
+    stars, whose own stars are unknown: split between the two star values
+    nearest their average
+    """
+    if not count:
+        return {}
+    low = min(max(total // count, 1), 5)
+    high = min(max(total - low * count, 0), count) if low < 5 else 0
+    return {low: count - high, low + 1: high}
+
+
+def histogram(product):
+    """``{'1': count, ..., '5': count}`` of a product's reviews, imported ones included"""
+    imported = imported_stars(product.imported_review_count, product.imported_rating_total)
+    return {
+        str(stars): getattr(product, f'rating_{stars}_count') + imported.get(stars, 0)
+        for stars in STARS
+    }
+
+
+def review_moved(before, after):
+    """
+    Apply a review's change of ``(product_id, rating)`` to the aggregates.
+    ``before`` is None for a new review, ``after`` None for a deleted one.
+    """
+    from .models import Product
+
+    if before == after:
+        return
+    deltas = defaultdict(list)
+    if before is not None:
+        deltas[before[0]].append((before[1], -1))
+    if after is not None:
+        deltas[after[0]].append((after[1], 1))
+
+    for product_id, changes in sorted(deltas.items()):
+        product = (
+            Product.objects.select_for_update(of=('self',)).select_related('category')
+            .filter(pk=product_id).first()
+        )
+        if product is None:
+            continue
+        for stars, delta in changes:
+            field = f'rating_{stars}_count'
+            product.review_count = max(product.review_count + delta, 0)
+            product.rating_total = max(product.rating_total + delta * stars, 0)
+            setattr(product, field, max(getattr(product, field) + delta, 0))
+        product.rating = average(product.rating_total, product.review_count)
+        # A product save, so the search indexes, cards and cached responses
+        # pick up the new rating
+        product.save(update_fields=AGGREGATE_FIELDS + ['updated_at'])
+
+
+def recompute(dry_run=False):
+    """
+    Recompute every product's aggregates from its imported baseline and
+    reviews with one GROUP BY and fix the ones that drifted (only report them with ``dry_run``).
+    Returns ``[(product, (stored count, stored rating), (count, rating)), ...]``.
+    """
+    from .models import Product, ProductReview
+
+    counts = defaultdict(dict)
+    rows = ProductReview.objects.values_list('product', 'rating').annotate(count=Count('id')).order_by()
+    for product_id, stars, count in rows:
+        counts[product_id][stars] = count
+
+    fixed = []
+    with transaction.atomic():
+        for product in Product.objects.select_for_update().only('id', 'name', *AGGREGATE_FIELDS, *BASELINE_FIELDS):
+            stars_counts = counts.get(product.id, {})
+            actual = {f'rating_{stars}_count': stars_counts.get(stars, 0) for stars in STARS}
+            actual['review_count'] = product.imported_review_count + sum(stars_counts.values())
+            actual['rating_total'] = product.imported_rating_total + sum(
+                stars * count for stars, count in stars_counts.items()
+            )
+            actual['rating'] = average(actual['rating_total'], actual['review_count'])
+            if any(getattr(product, field) != value for field, value in actual.items()):
+                fixed.append((
+                    product, (product.review_count, product.rating), (actual['review_count'], actual['rating'])
+                ))
+                if not dry_run:
+                    Product.objects.filter(pk=product.id).update(**actual, updated_at=timezone.now())
+                    index_sync.product_changed(product.id)
+        if fixed and not dry_run:
+            transaction.on_commit(response_cache.invalidate)
+    return fixed
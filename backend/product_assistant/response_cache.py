@@ -0,0 +1,358 @@
+"""
+Read-through cache for catalog API responses.
+
+Response bodies of the catalog endpoints are stored in the default cache,
+together with their ETag and Last-Modified validators, under
+``catalog:response:<endpoint>:<version>:<hash of normalized params>``. The
+catalog version is bumped (after commit) by the Product, Category and
+ProductReview signals, which retires every cached response at once without
+scanning keys; stale entries simply age out by TTL.
+
+Misses are coalesced (``load_once``): one request per process and one
+worker at a time builds a response, the rest reuse it. Every entry is also
+kept under an unversioned ``catalog:stale:`` key, served to other workers
+while one of them rebuilds the current version (stale-while-revalidate).
+
+Hits and misses are counted per endpoint in a Redis hash so the cache can
+be sized (``GET /api/products/cache-stats/``). Near-static endpoints also
+keep responses in the worker's L1 cache (see ``local_cache``).
+"""
+import hashlib
+import logging
+import os
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+from redis.exceptions import RedisError
+
+from . import local_cache, single_flight
+from .cache_backend import redis_client
+from .conditional import not_modified, queryset_validators, set_validators
+
+logger = logging.getLogger(__name__)
+
+VERSION_CACHE_KEY = 'catalog:version'
+STATS_KEY = 'catalog:stats'
+LOCAL_NAMESPACE = 'catalog'
+
+_local_stats = Counter()
+
+
+# Seconds between checks for a response another worker is building
+WAIT_INTERVAL = 0.05
+
+
+def cache_ttl():
+    return getattr(settings, 'CATALOG_CACHE_TTL', 300)
+
+
+def stale_ttl():
+    return getattr(settings, 'CATALOG_STALE_TTL', 3600)
+
+
+def coalescing_enabled():
+    return getattr(settings, 'CATALOG_SINGLE_FLIGHT', True)
+
+
+def catalog_version():
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        version = time.time_ns()
+        cache.add(VERSION_CACHE_KEY, version, None)
+        version = cache.get(VERSION_CACHE_KEY, version)
+    return version
+
+
+def invalidate():
+    """
+    Called (on commit) when catalog data changes: bump the version, then
+    clear the workers' L1 copies, which reload from the new version
+    """
+    try:
+        cache.set(VERSION_CACHE_KEY, time.time_ns(), None)
+    except RedisError as error:
+        logger.warning('Could not invalidate catalog cache: %s', error)
+    local_cache.invalidate(LOCAL_NAMESPACE)
+
+
+def normalized_params(request, view_kwargs=None):
+    """Query parameters and URL arguments in a canonical order, blanks dropped"""
+    items = [
+        (name, value)
+        for name in sorted(request.query_params)
+        for value in sorted(request.query_params.getlist(name))
+        if value != ''
+    ]
+    items.extend(sorted((name, str(value)) for name, value in (view_kwargs or {}).items()))
+    return '&'.join(f'{name}={value}' for name, value in items)
+
+
+def cache_key(endpoint, params, version):
+    digest = hashlib.md5(params.encode('utf-8')).hexdigest()
+    return f'catalog:response:{endpoint}:{version}:{digest}'
+
+
+def stale_key(endpoint, params):
+    digest = hashlib.md5(params.encode('utf-8')).hexdigest()
+    return f'catalog:stale:{endpoint}:{digest}'
+
+
+def _count(endpoint, outcome, amount=1):
+    if not amount:
+        return
+    client = redis_client()
+    if client is None:
+        _local_stats[f'{endpoint}:{outcome}'] += amount
+        return
+    try:
+        client.hincrby(STATS_KEY, f'{endpoint}:{outcome}', amount)
+    except RedisError as error:
+        logger.warning('Could not count catalog cache %s: %s', outcome, error)
+
+
+def current_version():
+    """Catalog version, or None while the cache is unavailable"""
+    try:
+        return catalog_version()
+    except RedisError as error:
+        logger.warning('Catalog cache unavailable: %s', error)
+        return None
+
+
+def fetch(endpoint, params, version):
+    """Cached ``(body, etag, last_modified)`` of a catalog version, or None on a miss"""
+    if version is None:
+        return None
+    try:
+        entry = cache.get(cache_key(endpoint, params, version))
+    except RedisError as error:
+        logger.warning('Catalog cache unavailable: %s', error)
+        return None
+    _count(endpoint, 'hit' if entry is not None else 'miss')
+    return entry
+
+
+def store(endpoint, params, entry, version):
+    """
+    Store an entry under the version read before its data was, so a change
+    committed meanwhile is not cached under the new version
+    """
+    if version is None:
+        return
+    try:
+        cache.set(cache_key(endpoint, params, version), entry, cache_ttl())
+        cache.set(stale_key(endpoint, params), entry, stale_ttl())
+    except RedisError as error:
+        logger.warning('Catalog cache unavailable: %s', error)
+
+
+def load_once(endpoint, params, build, version):
+    """
+    ``(entry, stale)`` for a response missed at ``version``. ``build()``
+    makes and stores the entry (None for responses that are not cached);
+    callers in this process share one build, and while another worker holds
+    the build lock this one serves the stale entry or waits for the new one.
+    """
+    if not coalescing_enabled():
+        return build(), False
+
+    def load():
+        if version is None:
+            # No shared cache to coordinate through: just build
+            return build(), False
+        lock_key = f'{cache_key(endpoint, params, version)}:lock'
+        token = single_flight.acquire(lock_key)
+        if token is None:
+            try:
+                entry = cache.get(stale_key(endpoint, params))
+                if entry is not None:
+                    return entry, True
+                waited = 0
+                while entry is None and waited < single_flight.WAIT_TIMEOUT:
+                    time.sleep(WAIT_INTERVAL)
+                    waited += WAIT_INTERVAL
+                    entry = cache.get(cache_key(endpoint, params, version))
+            except RedisError as error:
+                logger.warning('Catalog cache unavailable: %s', error)
+                entry = None
+            if entry is not None:
+                return entry, False
+        try:
+            return build(), False
+        finally:
+            if token is not None:
+                single_flight.release(lock_key, token)
+
+    return single_flight.flight.do((endpoint, params, version), load)
+
+
+def fetch_many(endpoint, params_list, version):
+    """Cached entries of several responses as ``{params: entry}``, hits only"""
+    if version is None:
+        return {}
+    try:
+        keys = {cache_key(endpoint, params, version): params for params in params_list}
+        found = cache.get_many(keys)
+    except RedisError as error:
+        logger.warning('Catalog cache unavailable: %s', error)
+        return {}
+    _count(endpoint, 'hit', len(found))
+    _count(endpoint, 'miss', len(keys) - len(found))
+    return {keys[key]: entry for key, entry in found.items()}
+
+
+def store_many(endpoint, entries, version):
+    """Store ``{params: entry}`` under the version read before the data, in one round trip"""
+    if version is None:
+        return
+    try:
+        cache.set_many(
+            {cache_key(endpoint, params, version): entry for params, entry in entries.items()}, cache_ttl()
+        )
+        cache.set_many({stale_key(endpoint, params): entry for params, entry in entries.items()}, stale_ttl())
+    except RedisError as error:
+        logger.warning('Catalog cache unavailable: %s', error)
+
+
+def validator_version():
+    """Catalog version for ETags, or '' while the cache is unavailable"""
+    version = current_version()
+    return '' if version is None else version
+
+
+def stats():
+    """Hit/miss counts per endpoint plus Redis memory use"""
+    client = redis_client()
+    raw = dict(_local_stats)
+    memory = None
+    if client is not None:
+        try:
+            raw = {field.decode(): int(value) for field, value in client.hgetall(STATS_KEY).items()}
+            info = client.info('memory')
+        except RedisError as error:
+            logger.warning('Catalog cache unavailable: %s', error)
+        else:
+            memory = {
+                'used_memory': info.get('used_memory'),
+                'used_memory_peak': info.get('used_memory_peak'),
+                'maxmemory': info.get('maxmemory'),
+            }
+
+    endpoints = {}
+    for field, value in raw.items():
+        endpoint, outcome = field.rsplit(':', 1)
+        endpoints.setdefault(endpoint, {'hit': 0, 'miss': 0})[outcome] = value
+    for counts in endpoints.values():
+        total = counts['hit'] + counts['miss']
+        counts['hit_rate'] = round(counts['hit'] / total, 3) if total else None
+    return {
+        'version': validator_version(),
+        'endpoints': endpoints,
+        'redis': memory,
+        # L1 hits never reach Redis, so they are only known per worker
+        'local': {
+            'pid': os.getpid(),
+            'entries': len(local_cache.reference_cache),
+            'hit': local_cache.reference_cache.stats['hit'],
+            'miss': local_cache.reference_cache.stats['miss'],
+        },
+    }
+
+
+class CachedResponseMixin:
+    """
+    Serve GET responses of a generic view from the catalog cache. Only
+    200 responses are stored; ``cache_endpoint`` names the key space.
+    Views over near-static data set ``local_cache`` to also keep responses
+    in the worker's L1 cache.
+
+    Responses carry ETag and Last-Modified validators. Cached entries keep
+    theirs, and on a miss ``get_validators`` computes them with one
+    aggregate query, so a matching ``If-None-Match`` is answered with a 304
+    before the body is serialized. Concurrent misses go through
+    ``load_once``.
+    """
+    cache_endpoint = None
+    local_cache = False
+
+    def get(self, request, *args, **kwargs):
+        # Paginated bodies contain absolute links, so the host is part of the key
+        params = f'{request.get_host()}?{normalized_params(request, kwargs)}'
+        local_key = (LOCAL_NAMESPACE, self.cache_endpoint, params)
+        if self.local_cache:
+            local_cache.ensure_listener()
+            entry = local_cache.reference_cache.get(local_key)
+            if entry is not None:
+                return self.cached_response(request, entry)
+            generation = local_cache.reference_cache.generation(LOCAL_NAMESPACE)
+
+        # Read before the data, so that a response built from data that
+        # changed meanwhile is stored under the version it belongs to
+        version = current_version()
+        entry = fetch(self.cache_endpoint, params, version)
+        if entry is not None:
+            response = self.cached_response(request, entry)
+        else:
+            validators = None
+            if 'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers:
+                validators = self.get_validators(params)
+                response = not_modified(request, *validators)
+                if response is not None:
+                    return response
+
+            # Concurrent misses for the same response share one build; the
+            # request that ran it answers with its own response
+            built = []
+
+            def build():
+                etag, last_modified = validators or self.get_validators(params)
+                response = super(CachedResponseMixin, self).get(request, *args, **kwargs)
+                built.append(response)
+                if response.status_code != 200:
+                    return None
+                set_validators(response, etag, last_modified)
+                entry = (response.data, etag, last_modified)
+                store(self.cache_endpoint, params, entry, version)
+                return entry
+
+            entry, stale = load_once(self.cache_endpoint, params, build, version)
+            if built:
+                response = built[0]
+            elif entry is not None:
+                response = self.cached_response(request, entry)
+            else:
+                # The shared build did not produce a cacheable response
+                return super().get(request, *args, **kwargs)
+            if entry is None or stale:
+                return response
+
+        if self.local_cache:
+            local_cache.reference_cache.set(local_key, entry, generation)
+        return response
+
+    def cached_response(self, request, entry):
+        data, etag, last_modified = entry
+        self.cache_hit(request, data)
+        return not_modified(request, etag, last_modified) or set_validators(
+            Response(data), etag, last_modified
+        )
+
+    def get_validators(self, params):
+        """
+        ``(etag, last_modified)`` of the response for ``params``. The
+        catalog version is part of the ETag so that changes without an
+        ``updated_at`` of their own (reviews, category edits) still count.
+        """
+        return queryset_validators(
+            self.validator_queryset(), self.cache_endpoint, params, validator_version()
+        )
+
+    def validator_queryset(self):
+        """Rows whose ``updated_at`` and count the response depends on"""
+        return self.filter_queryset(self.get_queryset())
+
+    def cache_hit(self, request, data):
+        """Hook for side effects the view would have had on a miss"""
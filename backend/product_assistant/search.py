@@ -0,0 +1,461 @@
+"""
+In-memory inverted index over the product catalog.
+
+Product name, category, features and description are tokenized into a
+term -> {product_id: weighted term frequency} map and ranked with BM25.
+The index is built lazily on first use, either from the database or from
+the memory-mapped catalog snapshot (see ``product_assistant.snapshot``),
+and kept up to date by the signal handlers in ``product_assistant.signals``.
+"""
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+from . import index_sync
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'the', 'to', 'with',
+])
+
+# Field weights (BM25F style): a match in the product name counts for more
+# than a match buried in the description.
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'category': 2.0,
+    'features': 1.5,
+    'description': 1.0,
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Upper bound on how many vocabulary terms a trailing partial word may
+# expand to ("gluc" -> "glucose", "glucometer", ...).
+MAX_PREFIX_EXPANSIONS = 50
+
+# Per-product data used for filtering and sorting search hits
+DocInfo = namedtuple('DocInfo', [
+    'in_stock', 'category_id', 'price', 'rating', 'review_count',
+    'name', 'created_at', 'is_featured',
+])
+
+# Listing sort orders over DocInfo; every key ends with the product id
+SORT_KEYS = {
+    'price_low': lambda doc, pk: (doc.price, pk),
+    'price_high': lambda doc, pk: (-doc.price, -pk),
+    'rating': lambda doc, pk: (-doc.rating, -pk),
+    'name': lambda doc, pk: (doc.name.lower(), pk),
+    'newest': lambda doc, pk: (-doc.created_at, -pk),
+}
+
+
+
+def stem(token):
+    """Very light plural stripping so 'monitors' matches 'monitor'"""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Split text into normalized search terms"""
+    if not text:
+        return []
+    return [
+        stem(token) for token in TOKEN_RE.findall(str(text).lower())
+        if token not in STOPWORDS
+    ]
+
+
+def doc_info(product):
+    return DocInfo(
+        in_stock=product.in_stock,
+        category_id=product.category_id,
+        price=float(product.price),
+        rating=float(product.rating),
+        review_count=product.review_count,
+        name=product.name,
+        created_at=product.created_at.timestamp() if product.created_at else 0.0,
+        is_featured=product.is_featured,
+    )
+
+
+class ProductSearchIndex:
+    """
+    Inverted index with BM25 ranking and in-memory filters.
+
+    When loaded from a snapshot, the snapshot is a read-only base segment
+    shared between processes; products changed afterwards are "shadowed"
+    in the base and indexed again in the in-memory postings.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._reset()
+
+    def _reset(self):
+        self.base = None         # read-only snapshot segment, if any
+        self.shadowed = set()    # base product ids that no longer apply
+        self.postings = {}       # term -> {product_id: weighted tf}
+        self.doc_terms = {}      # product_id -> {term: weighted tf}
+        self.doc_lengths = {}    # product_id -> weighted document length
+        self.docs = {}           # product_id -> DocInfo
+        self.categories = {}     # category_id -> category name
+        self.vocabulary = []     # sorted terms, for prefix expansion
+        self.total_length = 0.0
+        self.doc_count = 0
+
+    @property
+    def is_built(self):
+        return self._built
+
+    # Building and incremental maintenance
+
+    def build(self, products=None, use_snapshot=True):
+        """(Re)build the whole index from the snapshot or the database"""
+        from .models import Category, Product
+        from .snapshot import get_snapshot
+
+        index_sync.start()
+        snapshot = get_snapshot() if products is None and use_snapshot else None
+
+        with self._lock:
+            self._reset()
+            if snapshot is not None:
+                self._load_snapshot(snapshot)
+                return
+
+            if products is None:
+                products = Product.objects.select_related('category').iterator(chunk_size=2000)
+            for category in Category.objects.all():
+                self.categories[category.id] = category.name
+            for product in products:
+                self._add(product)
+            self.vocabulary = sorted(self.postings)
+            self._built = True
+
+    def _load_snapshot(self, snapshot):
+        from .models import Category
+
+        segment = snapshot.search_segment()
+        self.base = segment
+        self.total_length = segment.total_length
+        self.doc_count = segment.doc_count
+        self.categories = dict(snapshot.categories)
+        self._built = True
+
+        # Catch up with edits made since the snapshot was written
+        changed, removed = snapshot.catalog_changes()
+        for product_id in removed:
+            self._remove(product_id)
+        for product in changed:
+            self._index(product)
+        for category in Category.objects.all():
+            if self.categories.get(category.id) != category.name:
+                self.update_category(category)
+
+    def ensure_built(self):
+        # Changes committed elsewhere since this process last looked
+        index_sync.catch_up()
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self.build()
+        return self
+
+    def add_product(self, product):
+        """Index a new product or re-index a changed one"""
+        if not self._built:
+            return
+        with self._lock:
+            self._index(product)
+
+    def _index(self, product):
+        self._remove(product.id)
+        self.categories[product.category_id] = product.category.name
+        for term in self._add(product):
+            index = bisect_left(self.vocabulary, term)
+            if index == len(self.vocabulary) or self.vocabulary[index] != term:
+                insort(self.vocabulary, term)
+
+    def remove_product(self, product_id):
+        if not self._built:
+            return
+        with self._lock:
+            self._remove(product_id)
+
+    def update_category(self, category):
+        """Re-index every product of a renamed category"""
+        if not self._built:
+            return
+        with self._lock:
+            self.categories[category.id] = category.name
+            for product in category.products.select_related('category'):
+                self._index(product)
+
+    def remove_category(self, category_id):
+        if not self._built:
+            return
+        with self._lock:
+            self.categories.pop(category_id, None)
+
+    def _document_fields(self, product):
+        features = product.features or []
+        if isinstance(features, dict):
+            features = list(features.values())
+        return {
+            'name': product.name,
+            'category': product.category.name,
+            'features': ' '.join(str(feature) for feature in features),
+            'description': product.description,
+        }
+
+    def document_weights(self, product):
+        """Weighted term frequencies of a product across all fields"""
+        weights = {}
+        for field, text in self._document_fields(product).items():
+            field_weight = FIELD_WEIGHTS[field]
+            for term in tokenize(text):
+                weights[term] = weights.get(term, 0.0) + field_weight
+        return weights
+
+    def _add(self, product):
+        """Add a product's postings; returns terms that are new to the index"""
+        weights = self.document_weights(product)
+
+        new_terms = []
+        for term, weight in weights.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                new_terms.append(term)
+            postings[product.id] = weight
+
+        length = sum(weights.values())
+        self.doc_terms[product.id] = weights
+        self.doc_lengths[product.id] = length
+        self.docs[product.id] = doc_info(product)
+        self.total_length += length
+        self.doc_count += 1
+        return new_terms
+
+    def _remove(self, product_id):
+        weights = self.doc_terms.pop(product_id, None)
+        if weights is None:
+            if self.base is not None and product_id not in self.shadowed:
+                length = self.base.doc_length(product_id)
+                if length is not None:
+                    self.shadowed.add(product_id)
+                    self.total_length -= length
+                    self.doc_count -= 1
+            return
+        for term in weights:
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self.postings[term]
+                index = bisect_left(self.vocabulary, term)
+                if index < len(self.vocabulary) and self.vocabulary[index] == term:
+                    del self.vocabulary[index]
+        self.total_length -= self.doc_lengths.pop(product_id, 0.0)
+        self.docs.pop(product_id, None)
+        self.doc_count -= 1
+
+    # Lookups shared by the in-memory postings and the snapshot segment
+
+    def has_term(self, term):
+        return term in self.postings or (self.base is not None and self.base.has_term(term))
+
+    def term_postings(self, term):
+        """``{product_id: weight}`` for a term across base and in-memory postings"""
+        postings = self.postings.get(term)
+        if self.base is None:
+            return postings or {}
+        merged = self.base.postings(term, self.shadowed)
+        if postings:
+            merged.update(postings)
+        return merged
+
+    def doc(self, product_id):
+        doc = self.docs.get(product_id)
+        if doc is None and self.base is not None and product_id not in self.shadowed:
+            doc = self.base.doc(product_id)
+        return doc
+
+    def doc_length(self, product_id):
+        length = self.doc_lengths.get(product_id)
+        if length is None and self.base is not None and product_id not in self.shadowed:
+            length = self.base.doc_length(product_id)
+        return length or 0.0
+
+    def doc_stats(self, product_id):
+        """``(length, in_stock, category_id, price)`` needed to score and filter a hit"""
+        doc = self.docs.get(product_id)
+        if doc is not None:
+            return self.doc_lengths[product_id], doc.in_stock, doc.category_id, doc.price
+        if self.base is not None and product_id not in self.shadowed:
+            return self.base.doc_stats(product_id)
+        return None
+
+    # Querying
+
+    def _expand_prefix(self, prefix):
+        start = bisect_left(self.vocabulary, prefix)
+        terms = []
+        for term in self.vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        if self.base is not None:
+            terms = sorted(set(terms).union(self.base.terms_with_prefix(prefix, MAX_PREFIX_EXPANSIONS)))
+        return terms[:MAX_PREFIX_EXPANSIONS]
+
+    def _query_groups(self, query, prefix_last):
+        """
+        Turn a query into groups of alternative terms. A document has to
+        match at least one term of every group to satisfy the query.
+        """
+        tokens = tokenize(query)
+        groups = []
+        for position, token in enumerate(tokens):
+            terms = [token] if self.has_term(token) else []
+            if prefix_last and position == len(tokens) - 1:
+                terms.extend(term for term in self._expand_prefix(token) if term != token)
+            groups.append(terms)
+        return groups
+
+    def _matches_filters(self, stats, in_stock, category_id, max_price):
+        _, doc_in_stock, doc_category_id, price = stats
+        if in_stock is not None and doc_in_stock != in_stock:
+            return False
+        if category_id is not None and doc_category_id != category_id:
+            return False
+        if max_price is not None and price > max_price:
+            return False
+        return True
+
+    def category_id_for(self, name):
+        """Resolve a category name case-insensitively"""
+        name = name.lower()
+        for category_id, category_name in self.categories.items():
+            if category_name.lower() == name:
+                return category_id
+        return None
+
+    def search(self, query, in_stock=None, category=None, max_price=None,
+               limit=None, prefix_last=True):
+        """
+        Return ``[(product_id, score), ...]`` ordered by relevance.
+
+        Documents matching every query term are preferred; if no document
+        does, any-term matches are returned instead.
+        """
+        self.ensure_built()
+        with self._lock:
+            category_id = None
+            if category:
+                category_id = self.category_id_for(category)
+                if category_id is None:
+                    return []
+
+            groups = self._query_groups(query, prefix_last)
+            if not groups or not any(groups):
+                return []
+
+            postings = {term: self.term_postings(term) for group in groups for term in group}
+            candidates = self._conjunctive_candidates(groups, postings)
+            if not candidates:
+                candidates = set()
+                for term_postings in postings.values():
+                    candidates.update(term_postings)
+
+            doc_count = self.doc_count or 1
+            average_length = (self.total_length / doc_count) or 1.0
+            idf = {}
+            for term, term_postings in postings.items():
+                frequency = len(term_postings)
+                idf[term] = math.log(1 + (doc_count - frequency + 0.5) / (frequency + 0.5))
+
+            results = []
+            for product_id in candidates:
+                stats = self.doc_stats(product_id)
+                if stats is None or not self._matches_filters(stats, in_stock, category_id, max_price):
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * stats[0] / average_length)
+                score = 0.0
+                for term, term_idf in idf.items():
+                    tf = postings[term].get(product_id)
+                    if tf:
+                        score += term_idf * tf * (BM25_K1 + 1) / (tf + norm)
+                results.append((product_id, score))
+
+        results.sort(key=lambda item: (-item[1], item[0]))
+        if limit is not None:
+            results = results[:limit]
+        return results
+
+    def _conjunctive_candidates(self, groups, postings):
+        if not all(groups):
+            return set()
+        group_docs = []
+        for group in groups:
+            docs = set()
+            for term in group:
+                docs.update(postings[term])
+            group_docs.append(docs)
+        group_docs.sort(key=len)
+        candidates = group_docs[0]
+        for docs in group_docs[1:]:
+            candidates = candidates & docs
+            if not candidates:
+                break
+        return candidates
+
+    def sort_key(self, sort_by):
+        """
+        Key function ordering product ids for a listing sort, with the id as
+        tiebreaker so the order is total (used by keyset pagination).
+        None for unknown sorts.
+        """
+        key = SORT_KEYS.get(sort_by)
+        if key is None:
+            return None
+        return lambda pk: key(self.doc(pk), pk)
+
+    def sort_ids(self, product_ids, sort_by):
+        """Order search hits by one of the listing sort keys"""
+        self.ensure_built()
+        key = SORT_KEYS.get(sort_by)
+        if key is None:
+            return product_ids
+        docs = {pk: self.doc(pk) for pk in product_ids}
+        product_ids = [pk for pk in product_ids if docs[pk] is not None]
+        return sorted(product_ids, key=lambda pk: key(docs[pk], pk))
+
+
+product_index = ProductSearchIndex()
+
+
+def search_products(query, **filters):
+    """Ranked product ids for a free-text query"""
+    return [product_id for product_id, _ in product_index.search(query, **filters)]
+
+
+def fetch_in_order(product_ids, queryset=None):
+    """Load products for ``product_ids`` in one query, keeping the given order"""
+    from .models import Product
+
+    if queryset is None:
+        queryset = Product.objects.all()
+    products = queryset.select_related('category').in_bulk(product_ids)
+    return [products[pk] for pk in product_ids if pk in products]
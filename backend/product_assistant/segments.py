@@ -0,0 +1,248 @@
+"""
+Personalized recommendations per shopper segment.
+
+A segment is one combination of ``UserPreference`` age group, health
+conditions and preferred categories; ``UserPreference.segment`` holds its
+key, kept current when the preference or its categories change.
+``manage.py build_segment_recommendations`` (cron) ranks the catalog once
+for every segment that has shoppers and stores the lists in the cache.
+A product's score is its Bayesian rating score (ranking.py) out of 5 plus
+boosts for:
+
+* being in one of the segment's preferred categories,
+* matching a health condition in the search index (search synonyms apply,
+  so "diabetes" can be mapped to "glucose monitor"),
+* having been ordered or wishlisted by shoppers of the same age group.
+
+Serving a signed-in shopper is one cache lookup for the segment's list
+(and their age group's, the fallback for segments the job has not seen
+yet) plus one query for the products they ordered or wishlisted, which
+are filtered out. Without any list the overall ranking is used.
+"""
+import hashlib
+import json
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from redis.exceptions import RedisError
+
+from . import ranking
+
+logger = logging.getLogger(__name__)
+
+LIST_KEY_PREFIX = 'segments:list'
+
+# Seconds a list is kept; segments without shoppers left drop out
+LIST_TTL = 7 * 86400
+
+# Boosts added to the rating score (0-1)
+CATEGORY_BOOST = 0.5
+CONDITION_BOOST = 1.0
+PEER_BOOST = 1.0
+
+# Search matches considered per health condition, and products most
+# popular with an age group considered per segment
+CONDITION_MATCHES = 200
+PEER_PRODUCTS = 200
+
+# Segment rows updated at a time when stored keys drifted
+UPDATE_BATCH = 1000
+
+
+def list_size():
+    return getattr(settings, 'SEGMENT_LIST_SIZE', 100)
+
+
+def list_key(segment):
+    return f'{LIST_KEY_PREFIX}:{segment}'
+
+
+def normalize_condition(condition):
+    return ' '.join(str(condition).lower().split())
+
+
+def segment_key(age_group, health_conditions, category_ids):
+    """Stable key of a preference combination (order and case do not matter)"""
+    conditions = sorted({normalize_condition(condition) for condition in health_conditions or []} - {''})
+    canonical = json.dumps([age_group or '', conditions, sorted(set(category_ids))])
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+def refresh_keys(preference_ids):
+    """Recompute the stored keys of preferences whose categories changed"""
+    from .models import UserPreference
+
+    for preference in UserPreference.objects.filter(pk__in=preference_ids).prefetch_related('preferred_categories'):
+        key = segment_key(
+            preference.age_group, preference.health_conditions,
+            [category.id for category in preference.preferred_categories.all()],
+        )
+        if key != preference.segment:
+            UserPreference.objects.filter(pk=preference.pk).update(segment=key)
+
+
+def collect_segments():
+    """
+    ``{key: (age group, conditions, category ids)}`` of every segment with
+    shoppers and of every age group on its own; fixes stored keys that
+    drifted (categories deleted, rows written with ``update()``)
+    """
+    from .models import UserPreference
+
+    categories = defaultdict(list)
+    through = UserPreference.preferred_categories.through
+    for preference_id, category_id in through.objects.values_list('userpreference_id', 'category_id').iterator():
+        categories[preference_id].append(category_id)
+
+    segments = {}
+    drifted = defaultdict(list)
+    rows = UserPreference.objects.values_list('id', 'segment', 'age_group', 'health_conditions').iterator()
+    for preference_id, stored, age_group, conditions in rows:
+        key = segment_key(age_group, conditions, categories[preference_id])
+        if key != stored:
+            drifted[key].append(preference_id)
+        if key not in segments:
+            segments[key] = (
+                age_group, sorted({normalize_condition(condition) for condition in conditions or []} - {''}),
+                sorted(set(categories[preference_id])),
+            )
+        segments.setdefault(segment_key(age_group, [], []), (age_group, [], []))
+
+    for key, preference_ids in drifted.items():
+        for start in range(0, len(preference_ids), UPDATE_BATCH):
+            UserPreference.objects.filter(pk__in=preference_ids[start:start + UPDATE_BATCH]).update(segment=key)
+    return segments
+
+
+def condition_matches(conditions):
+    """``{condition: {product id: relevance 0-1}}`` of in-stock products from the search index"""
+    from .search import product_index
+    from .synonyms import expand_query
+
+    matches = {}
+    for condition in conditions:
+        results = product_index.search(
+            expand_query(condition), in_stock=True, limit=CONDITION_MATCHES, prefix_last=False
+        )
+        best = results[0][1] if results else 0
+        matches[condition] = {product_id: score / best for product_id, score in results if best > 0}
+    return matches
+
+
+def peer_popularity():
+    """``{age group: {product id: share of the age group's shoppers who ordered or wishlisted it}}``"""
+    from accounts.models import Wishlist
+    from checkout.models import OrderItem
+    from .models import UserPreference
+
+    shoppers = dict(UserPreference.objects.values_list('age_group').annotate(count=Count('id')).order_by())
+    counts = defaultdict(lambda: defaultdict(int))
+    ordered = (
+        OrderItem.objects.filter(product__isnull=False, order__user__userpreference__isnull=False)
+        .values_list('order__user__userpreference__age_group', 'product_id')
+        .annotate(shoppers=Count('order__user', distinct=True)).order_by()
+    )
+    wishlisted = (
+        Wishlist.objects.filter(user__userpreference__isnull=False)
+        .values_list('user__userpreference__age_group', 'product_id')
+        .annotate(shoppers=Count('user', distinct=True)).order_by()
+    )
+    for rows in (ordered, wishlisted):
+        for age_group, product_id, count in rows:
+            counts[age_group][product_id] += count
+
+    popularity = {}
+    for age_group, products in counts.items():
+        top = sorted(products.items(), key=lambda item: (-item[1], item[0]))[:PEER_PRODUCTS]
+        popularity[age_group] = {
+            product_id: min(count / shoppers[age_group], 1.0) for product_id, count in top
+        }
+    return popularity
+
+
+def rank(segment, rated, top, by_category, matches, popularity, size):
+    """
+    Best ``size`` product ids for one segment; ``rated`` maps in-stock
+    product ids to ``(category id, rating score 0-1)``, ``top`` is the
+    overall ranking and ``by_category`` the per-category ones
+    """
+    age_group, conditions, category_ids = segment
+    peers = popularity.get(age_group, {})
+    candidates = set(top)
+    for category_id in category_ids:
+        candidates.update(by_category.get(category_id, ()))
+    for condition in conditions:
+        candidates.update(matches[condition])
+    candidates.update(peers)
+
+    preferred = set(category_ids)
+    scores = []
+    for product_id in candidates:
+        product = rated.get(product_id)
+        if product is None:
+            # Out of stock (peer popularity covers every product)
+            continue
+        category_id, base = product
+        score = base + PEER_BOOST * peers.get(product_id, 0.0)
+        if category_id in preferred:
+            score += CATEGORY_BOOST
+        if conditions:
+            score += CONDITION_BOOST * max(matches[condition].get(product_id, 0.0) for condition in conditions)
+        scores.append((score, product_id))
+    scores.sort(key=lambda item: (-item[0], item[1]))
+    return [product_id for _, product_id in scores[:size]]
+
+
+def rebuild():
+    """Rank the catalog for every segment and store the lists; returns ``{key: [product id, ...]}``"""
+    size = list_size()
+    segments = collect_segments()
+    rows = ranking.scored()
+    rated = {product_id: (category_id, score / 5) for product_id, category_id, score, _ in rows}
+    top = [row[0] for row in rows[:size]]
+    by_category = defaultdict(list)
+    for product_id, category_id, _, _ in rows:
+        if len(by_category[category_id]) < size:
+            by_category[category_id].append(product_id)
+    matches = condition_matches({condition for _, conditions, _ in segments.values() for condition in conditions})
+    popularity = peer_popularity()
+
+    lists = {
+        key: rank(segment, rated, top, by_category, matches, popularity, size)
+        for key, segment in segments.items()
+    }
+    try:
+        cache.set_many({list_key(key): ids for key, ids in lists.items()}, LIST_TTL)
+    except RedisError as error:
+        logger.warning('Could not store segment recommendations: %s', error)
+    return lists
+
+
+def recommended_ids(user, limit):
+    """Ids of the products recommended to a signed-in shopper, best first"""
+    from accounts.models import Wishlist
+    from checkout.models import OrderItem
+    from .models import UserPreference
+
+    ids = None
+    preference = UserPreference.objects.filter(user=user).values_list('segment', 'age_group').first()
+    if preference is not None:
+        keys = [list_key(preference[0]), list_key(segment_key(preference[1], [], []))]
+        try:
+            found = cache.get_many(keys)
+        except RedisError as error:
+            logger.warning('Segment recommendations unavailable: %s', error)
+            found = {}
+        ids = next((found[key] for key in keys if key in found), None)
+    if ids is None:
+        ids = ranking.ranked_ids()
+
+    owned = set(
+        Wishlist.objects.filter(user=user).order_by().values_list('product_id', flat=True).union(
+            OrderItem.objects.filter(order__user=user, product__isnull=False).values_list('product_id', flat=True)
+        )
+    )
+    return [product_id for product_id in ids if product_id not in owned][:limit]
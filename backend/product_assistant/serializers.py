@@ -1,16 +1,29 @@
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
 from rest_framework import serializers
 from .models import Category, Product, ProductReview, UserPreference
+from .ratings import histogram
+
+# Reviews embedded in product details, newest first
+RECENT_REVIEWS = 5
+
+def recent_reviews_prefetch():
+    """
+    Prefetch of the ``RECENT_REVIEWS`` newest reviews of each product into
+    ``recent_reviews``, one query for any number of products
+    """
+    reviews = ProductReview.objects.select_related('user').annotate(
+        position=Window(RowNumber(), partition_by=F('product_id'), order_by=F('created_at').desc())
+    ).filter(position__lte=RECENT_REVIEWS).order_by('-created_at')
+    return Prefetch('reviews', queryset=reviews, to_attr='recent_reviews')
 
 class CategorySerializer(serializers.ModelSerializer):
-    product_count = serializers.SerializerMethodField()
+    product_count = serializers.IntegerField(source='in_stock_count', read_only=True)
 
     class Meta:
         model = Category
         fields = ['id', 'name', 'description', 'icon', 'product_count']
 
-    def get_product_count(self, obj):
-        return obj.products.filter(in_stock=True).count()
-
 class ProductSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     
@@ -23,15 +36,33 @@ class ProductSerializer(serializers.ModelSerializer):
         ]
 
 class ProductDetailSerializer(ProductSerializer):
+    rating_histogram = serializers.SerializerMethodField()
     reviews = serializers.SerializerMethodField()
     
     class Meta(ProductSerializer.Meta):
-        fields = ProductSerializer.Meta.fields + ['reviews']
+        fields = ProductSerializer.Meta.fields + ['rating_histogram', 'reviews']
+    
+    def get_rating_histogram(self, obj):
+        return histogram(obj)
     
     def get_reviews(self, obj):
-        recent_reviews = obj.reviews.order_by('-created_at')[:5]
+        # Batch reads prefetch the latest reviews (see recent_reviews_prefetch)
+        recent_reviews = getattr(obj, 'recent_reviews', None)
+        if recent_reviews is None:
+            recent_reviews = obj.reviews.select_related('user').order_by('-created_at')[:RECENT_REVIEWS]
         return ProductReviewSerializer(recent_reviews, many=True).data
 
+class ProductRatingSerializer(serializers.ModelSerializer):
+    """A product's review aggregates, returned after a review is submitted"""
+    rating_histogram = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Product
+        fields = ['id', 'rating', 'review_count', 'rating_histogram']
+    
+    def get_rating_histogram(self, obj):
+        return histogram(obj)
+
 class ProductReviewSerializer(serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.first_name', read_only=True)
     
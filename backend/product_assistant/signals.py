@@ -0,0 +1,100 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import CatalogTombstone, Category, Product, ProductReview, SearchSynonym, UserPreference
+from . import (
+    changes, counters, fragments, index_sync, query_cache, ranking, ratings, response_cache, segments, similar,
+    synonyms,
+)
+
+
+def catalog_changed():
+    """
+    Retire cached catalog responses and voice search results once the
+    change is committed, so no request can re-cache the old data; the
+    recommendation ranking is rebuilt on a later request (similar products
+    only follow content changes, see ``Product.save``)
+    """
+    transaction.on_commit(response_cache.invalidate)
+    transaction.on_commit(query_cache.invalidate)
+    transaction.on_commit(ranking.mark_changed)
+
+
+# The in-memory indexes are updated once the change is committed, here
+# and in every other process (see index_sync.py); that is registered
+# before catalog_changed() so no worker builds responses for the new
+# catalog version from an index without the change
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    index_sync.product_changed(instance.id)
+    fragments.store_card(instance)
+    catalog_changed()
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    # Runs inside the delete's transaction, cascades included
+    counters.product_moved((instance.category_id, instance.in_stock), None)
+    index_sync.product_changed(instance.id)
+    changes.record_deletion(CatalogTombstone.PRODUCT, instance.id)
+    transaction.on_commit(similar.mark_changed)
+    catalog_changed()
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    if not created:
+        # Products embed the category name; resend them to syncing clients
+        Product.objects.filter(category=instance).update(updated_at=timezone.now())
+    index_sync.category_changed(instance.id)
+    catalog_changed()
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    index_sync.category_changed(instance.id)
+    changes.record_deletion(CatalogTombstone.CATEGORY, instance.id)
+    catalog_changed()
+
+
+@receiver(post_save, sender=SearchSynonym)
+@receiver(post_delete, sender=SearchSynonym)
+def synonym_changed(sender, instance, **kwargs):
+    """Recompile the query rewriting automaton on dictionary edits"""
+    transaction.on_commit(synonyms.invalidate)
+    transaction.on_commit(query_cache.invalidate)
+    # Cached ?search= listings were expanded with the old dictionary
+    transaction.on_commit(response_cache.invalidate)
+
+
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+def review_changed(sender, instance, **kwargs):
+    # Product detail responses embed the latest reviews
+    transaction.on_commit(response_cache.invalidate)
+
+
+@receiver(post_delete, sender=ProductReview)
+def review_deleted(sender, instance, origin=None, **kwargs):
+    # Runs inside the delete's transaction; reviews deleted along with
+    # their product leave no aggregates to maintain
+    if isinstance(origin, Product) or getattr(origin, 'model', None) is Product:
+        return
+    ratings.review_moved((instance.product_id, instance.rating), None)
+
+
+@receiver(m2m_changed, sender=UserPreference.preferred_categories.through)
+def preferred_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep ``UserPreference.segment`` in step with the preferred categories"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            segments.refresh_keys([instance.pk])
+    elif action == 'pre_clear':
+        # Only the category is known after a clear from its side
+        instance._cleared_preferences = list(instance.userpreference_set.values_list('id', flat=True))
+    elif action == 'post_clear':
+        segments.refresh_keys(getattr(instance, '_cleared_preferences', []))
+    elif action in ('post_add', 'post_remove'):
+        segments.refresh_keys(pk_set)
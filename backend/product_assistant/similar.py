@@ -0,0 +1,321 @@
+"""
+Content-based "similar products".
+
+Every product is turned into a hashed TF-IDF vector of its name (counted
+twice), description, features and category: words and word pairs are
+hashed into ``SIMILAR_VECTOR_DIMENSIONS`` signed buckets, weighted by
+sublinear term frequency and inverse document frequency, and the rows of
+the resulting dense float32 matrix are L2-normalized, so a dot product is
+the cosine similarity. The top ``SIMILAR_PRODUCTS_SIZE`` in-stock
+neighbors of every product are found with one matrix multiply per batch
+of rows and stored in the shared cache as two NumPy arrays (sorted product
+ids and their neighbor ids) under a build version. Workers keep the
+current version in memory, so a request is a binary search and an array
+slice.
+
+Requests never compute the table. ``manage.py build_similar_products``
+precomputes it (run it on deploy). Products added or deleted, or saved
+with a new name, description, features, category or stock status, mark the
+table as changed (price and rating edits do not); the first request after ``SIMILAR_REBUILD_INTERVAL`` seconds
+starts a rebuild in a background thread (one worker at a time) and the old
+table is served until it is done. A missing table is built the same way,
+with empty responses until then. While the cache is unavailable each
+worker serves the table it has in memory.
+"""
+import logging
+import math
+import re
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from redis.exceptions import RedisError
+
+from . import single_flight
+
+logger = logging.getLogger(__name__)
+
+STATE_KEY = 'similar:state'
+CHANGED_KEY = 'similar:changed'
+LOCK_KEY = 'similar:lock'
+TABLE_KEY_PREFIX = 'similar:table'
+
+# Products per response unless ?limit= says otherwise
+DEFAULT_LIMIT = 6
+
+# Seconds a replaced table is kept for workers that read the old state
+REPLACED_TABLE_TTL = 300
+
+# Seconds the cross-worker rebuild lock is held at most
+REBUILD_LOCK_TIMEOUT = 900
+
+# Rows multiplied against the catalog at a time (bounds the score matrix)
+BATCH_ROWS = 128
+
+# Name words count this many times as much as description words
+NAME_WEIGHT = 2
+
+# Product fields the table is computed from (vectors and in-stock neighbors)
+CONTENT_FIELDS = ('name', 'description', 'features', 'category_id', 'in_stock')
+
+WORD = re.compile(r'[a-z0-9]+')
+
+
+def list_size():
+    return getattr(settings, 'SIMILAR_PRODUCTS_SIZE', 20)
+
+
+def dimensions():
+    return getattr(settings, 'SIMILAR_VECTOR_DIMENSIONS', 512)
+
+
+def rebuild_interval():
+    return getattr(settings, 'SIMILAR_REBUILD_INTERVAL', 300)
+
+
+def table_key(version):
+    return f'{TABLE_KEY_PREFIX}:{version}'
+
+
+class NeighborTable:
+    """Neighbor ids (0 = none) of every product, row by sorted product id"""
+
+    def __init__(self, ids, neighbors):
+        self.ids = ids
+        self.neighbors = neighbors
+
+    def __len__(self):
+        return len(self.ids)
+
+    def lookup(self, product_id, limit):
+        row = np.searchsorted(self.ids, product_id)
+        if row == len(self.ids) or self.ids[row] != product_id:
+            return []
+        return [int(neighbor) for neighbor in self.neighbors[row, :limit] if neighbor]
+
+
+def terms(text):
+    """Words and adjacent word pairs of a text"""
+    words = WORD.findall(text.lower())
+    return words + [f'{first} {second}' for first, second in zip(words, words[1:])]
+
+
+def vectorize(products, size):
+    """
+    ``(ids, matrix)``: L2-normalized hashed TF-IDF rows of ``products``,
+    ``(id, name, description, features, category id)`` tuples
+    """
+    buckets = {}
+    # Typed arrays: a catalog has millions of (product, term) entries
+    ids, rows, columns, values = array('q'), array('i'), array('i'), array('f')
+    for row, (product_id, name, description, features, category_id) in enumerate(products):
+        ids.append(product_id)
+        counts = Counter(terms(name) * NAME_WEIGHT)
+        counts.update(terms(description))
+        for feature in features or []:
+            counts.update(terms(str(feature)))
+        counts[f'category:{category_id}'] += 1
+        for term, count in counts.items():
+            bucket = buckets.get(term)
+            if bucket is None:
+                # Stable across processes, unlike hash(); the top bit picks
+                # the sign so that colliding terms tend to cancel out
+                digest = zlib.crc32(term.encode())
+                bucket = buckets[term] = (digest % size, 1.0 if digest & 0x80000000 else -1.0)
+            rows.append(row)
+            columns.append(bucket[0])
+            values.append(bucket[1] * (1 + math.log(count)))
+
+    matrix = np.zeros((len(ids), size), dtype=np.float32)
+    # Colliding terms of a product add up
+    np.add.at(
+        matrix, (np.frombuffer(rows, dtype=np.int32), np.frombuffer(columns, dtype=np.int32)),
+        np.frombuffer(values, dtype=np.float32),
+    )
+    documents = np.count_nonzero(matrix, axis=0)
+    matrix *= (np.log((1 + len(ids)) / (1 + documents)) + 1).astype(np.float32)
+    # Row norms without a squared copy of the matrix
+    norms = np.sqrt(np.einsum('ij,ij->i', matrix, matrix))
+    norms[norms == 0] = 1
+    matrix /= norms[:, None]
+    return np.frombuffer(ids, dtype=np.int64), matrix
+
+
+def nearest(ids, matrix, candidates, size):
+    """
+    ``(neighbors, scores)``: the ``size`` most similar ``candidates`` (a
+    boolean mask over the rows) of every row, best first, as product ids
+    (0 where there are fewer with a positive similarity)
+    """
+    candidate_rows = np.flatnonzero(candidates)
+    candidate_ids = ids[candidate_rows]
+    # Only the candidates' columns are computed
+    candidate_vectors = np.ascontiguousarray(matrix[candidate_rows].T)
+    neighbors = np.zeros((len(ids), size), dtype=np.int32)
+    scores = np.zeros((len(ids), size), dtype=np.float32)
+    keep = min(size, len(candidate_rows))
+    if not keep:
+        return neighbors, scores
+
+    for start in range(0, len(ids), BATCH_ROWS):
+        end = min(start + BATCH_ROWS, len(ids))
+        similarity = matrix[start:end] @ candidate_vectors
+        # A product is not similar to itself
+        rows = np.arange(start, end)
+        own = np.minimum(np.searchsorted(candidate_rows, rows), len(candidate_rows) - 1)
+        is_candidate = candidate_rows[own] == rows
+        similarity[np.flatnonzero(is_candidate), own[is_candidate]] = -np.inf
+
+        kth = similarity.shape[1] - keep
+        top = np.argpartition(similarity, kth, axis=1)[:, kth:]
+        top_scores = np.take_along_axis(similarity, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        batch = candidate_ids[top]
+        batch[top_scores <= 0] = 0
+        neighbors[start:end, :keep] = batch
+        scores[start:end, :keep] = np.maximum(top_scores, 0)
+    return neighbors, scores
+
+
+def compute():
+    """``(table, scores)`` computed from the catalog"""
+    from .models import Product
+
+    rows = list(
+        Product.objects.order_by('id')
+        .values_list('id', 'name', 'description', 'features', 'category_id', 'in_stock')
+    )
+    ids, matrix = vectorize((row[:5] for row in rows), dimensions())
+    in_stock = np.array([row[5] for row in rows], dtype=bool)
+    neighbors, scores = nearest(ids, matrix, in_stock, list_size())
+    return NeighborTable(ids, neighbors), scores
+
+
+_current = (None, None)      # (version, NeighborTable) of this process
+_refreshing = threading.Lock()
+_last_attempt = 0.0
+
+
+def rebuild():
+    """Compute and store the table under a new version; returns ``(table, scores)``"""
+    global _current, _last_attempt
+    started = _last_attempt = time.time()
+    table, scores = compute()
+    version = time.time_ns()
+    try:
+        # The current table never expires, so there is always one to serve
+        # while the next is computed
+        previous = cache.get(STATE_KEY)
+        cache.set(table_key(version), (table.ids, table.neighbors), None)
+        cache.set(STATE_KEY, {'version': version, 'built_at': started}, None)
+        if previous is not None:
+            cache.touch(table_key(previous['version']), REPLACED_TABLE_TTL)
+    except RedisError as error:
+        logger.warning('Could not store similar products: %s', error)
+    _current = (version, table)
+    return table, scores
+
+
+def content_changed(before, after):
+    """
+    Called by ``Product.save`` with the ``CONTENT_FIELDS`` of a product
+    before (None for a new one) and after the save; price and rating
+    changes do not move any neighbors
+    """
+    if before != after:
+        transaction.on_commit(mark_changed)
+
+
+def mark_changed():
+    """Called (on commit) when products are added, deleted or change content"""
+    try:
+        cache.set(CHANGED_KEY, time.time(), None)
+    except RedisError as error:
+        logger.warning('Could not mark similar products as changed: %s', error)
+
+
+def _rebuild_once():
+    """Rebuild unless another worker is at it; returns the table or None"""
+    token = single_flight.acquire(LOCK_KEY, REBUILD_LOCK_TIMEOUT)
+    if token is None:
+        return None
+    try:
+        return rebuild()[0]
+    finally:
+        single_flight.release(LOCK_KEY, token)
+
+
+def _rebuild_in_background():
+    global _last_attempt
+    # While another worker rebuilds, try again after an interval rather
+    # than on every request
+    if time.time() - _last_attempt < rebuild_interval() or not _refreshing.acquire(blocking=False):
+        return
+    _last_attempt = time.time()
+
+    def run():
+        try:
+            _rebuild_once()
+        except Exception:
+            logger.exception('Could not rebuild similar products')
+        finally:
+            connection.close()
+            _refreshing.release()
+
+    threading.Thread(target=run, name='similar-products', daemon=True).start()
+
+
+def _table(version):
+    """This process's table of a build version, loaded from the cache if newer"""
+    global _current
+    if _current[0] == version:
+        return _current[1]
+    try:
+        arrays = cache.get(table_key(version))
+    except RedisError as error:
+        logger.warning('Similar products cache unavailable: %s', error)
+        arrays = None
+    if arrays is None:
+        # Evicted from the cache: keep what this process has meanwhile
+        _rebuild_in_background()
+        return _current[1]
+    _current = (version, NeighborTable(*arrays))
+    return _current[1]
+
+
+def similar_ids(product_id, limit=DEFAULT_LIMIT):
+    """Ids of the in-stock products most similar to a product, best first"""
+    try:
+        found = cache.get_many([STATE_KEY, CHANGED_KEY])
+    except RedisError as error:
+        logger.warning('Similar products cache unavailable: %s', error)
+        # Serve this process's table, building one in the background if
+        # there is none (changes are only seen once the cache is back)
+        if _current[1] is None:
+            _rebuild_in_background()
+        table = _current[1]
+        return table.lookup(product_id, limit) if table is not None else []
+
+    state = found.get(STATE_KEY)
+    changed = found.get(CHANGED_KEY)
+    if state is None:
+        # Never built (or evicted): build in the background and serve
+        # this process's table, if any, meanwhile
+        _rebuild_in_background()
+        table = _current[1]
+    else:
+        if (changed is not None and changed > state['built_at']
+                and time.time() - state['built_at'] >= rebuild_interval()):
+            _rebuild_in_background()
+        table = _table(state['version'])
+    if table is None:
+        return []
+    return table.lookup(product_id, limit)
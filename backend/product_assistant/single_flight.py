@@ -0,0 +1,109 @@
+"""
+Request coalescing for cache misses.
+
+When a cached response expires or the catalog version is bumped at peak,
+every request for a popular page misses at the same moment. ``flight.do``
+runs the loader for a key once per process: concurrent callers for the
+same key wait for the first one and reuse its result. Across workers a
+short Redis lock (``acquire``/``release``) elects a single loader; see
+``response_cache.load_once`` for what the other workers do meanwhile.
+"""
+import logging
+import threading
+import uuid
+
+from redis.exceptions import RedisError
+
+from .cache_backend import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Seconds the cross-worker lock is held at most (a crashed loader's lock expires)
+LOCK_TIMEOUT = 10
+
+# Seconds a caller waits for another loader before loading itself
+WAIT_TIMEOUT = 5
+
+# Delete the lock only if it is still ours (it may have expired and been retaken)
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+        self.value = None
+
+
+class SingleFlight:
+    """Per-process map of in-flight loads, keyed by what they load"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, load):
+        """
+        ``load()``, unless a call for ``key`` is already running in this
+        process, in which case its result is returned instead
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(WAIT_TIMEOUT) and call.ok:
+                return call.value
+            # The leader failed or is stuck: load independently
+            return load()
+
+        try:
+            call.value = load()
+            call.ok = True
+            return call.value
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def __len__(self):
+        return len(self._calls)
+
+
+flight = SingleFlight()
+
+
+def acquire(lock_key, timeout=LOCK_TIMEOUT):
+    """
+    Take the cross-worker lock for at most ``timeout`` seconds: a token if
+    this worker may load, None if another worker holds it. Without Redis
+    the process is alone and always gets a token.
+    """
+    token = uuid.uuid4().hex
+    client = redis_client()
+    if client is None:
+        return token
+    try:
+        if client.set(lock_key, token, nx=True, ex=timeout):
+            return token
+        return None
+    except RedisError as error:
+        logger.warning('Could not take load lock %s: %s', lock_key, error)
+        return token
+
+
+def release(lock_key, token):
+    client = redis_client()
+    if client is None:
+        return
+    try:
+        client.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+    except RedisError as error:
+        logger.warning('Could not release load lock %s: %s', lock_key, error)
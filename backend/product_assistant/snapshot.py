@@ -0,0 +1,386 @@
+"""
+Memory-mapped catalog snapshot.
+
+``manage.py build_catalog_snapshot`` serializes the search postings and the
+per-product catalog data into one versioned binary file. Workers map that
+file read-only instead of rebuilding their indexes from the database, so
+every worker on a node shares the same physical pages, and only catch up
+on products edited after the snapshot was written.
+
+File layout (little endian)::
+
+    magic (8 bytes) | format version (u32) | section count (u32)
+    section table: name (16 bytes) | offset (u64) | length (u64)
+    sections, each 8-byte aligned
+
+Sections hold packed arrays (doc ids, prices, postings, ...) and a small
+JSON ``meta`` section with catalog totals and category names.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left
+from types import SimpleNamespace
+
+from django.conf import settings
+
+from .search import DocInfo, ProductSearchIndex
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'VCSNAP\x00\x00'
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct('<8sII')
+SECTION = struct.Struct('<16sQQ')
+
+FLAG_IN_STOCK = 1
+FLAG_FEATURED = 2
+
+# Section name -> memoryview format of its items
+ARRAY_SECTIONS = {
+    'doc_ids': 'q',
+    'doc_length': 'f',
+    'doc_price': 'd',
+    'doc_rating': 'f',
+    'doc_reviews': 'I',
+    'doc_created': 'd',
+    'doc_category': 'q',
+    'doc_flags': 'B',
+    'doc_name_off': 'I',
+    'term_off': 'I',
+    'post_off': 'I',
+    'post_ids': 'q',
+    'post_weight': 'f',
+}
+BLOB_SECTIONS = ('meta', 'doc_names', 'terms')
+
+
+def snapshot_path():
+    return getattr(settings, 'CATALOG_SNAPSHOT_PATH', None)
+
+
+def _pack(fmt, values):
+    return struct.pack(f'<{len(values)}{fmt}', *values)
+
+
+def write_snapshot(path, index=None):
+    """
+    Write ``index`` (by default a fresh index built from the database) to
+    ``path`` atomically. Returns the number of products written.
+    """
+    from .models import Product
+    from django.db.models import Max
+
+    if index is None:
+        index = ProductSearchIndex()
+        index.build(use_snapshot=False)
+    if index.base is not None:
+        raise ValueError('Cannot snapshot an index that is itself loaded from a snapshot')
+
+    doc_ids = sorted(index.docs)
+    docs = [index.docs[pk] for pk in doc_ids]
+
+    names = bytearray()
+    name_offsets = [0]
+    for doc in docs:
+        names += doc.name.encode('utf-8')
+        name_offsets.append(len(names))
+
+    terms = sorted(index.postings)
+    term_blob = bytearray()
+    term_offsets = [0]
+    post_offsets = [0]
+    post_ids = []
+    post_weights = []
+    for term in terms:
+        term_blob += term.encode('utf-8')
+        term_offsets.append(len(term_blob))
+        for pk, weight in sorted(index.postings[term].items()):
+            post_ids.append(pk)
+            post_weights.append(weight)
+        post_offsets.append(len(post_ids))
+
+    max_updated = Product.objects.aggregate(latest=Max('updated_at'))['latest']
+    meta = {
+        'doc_count': len(doc_ids),
+        'total_length': index.total_length,
+        'max_updated_at': max_updated.isoformat() if max_updated else None,
+        'categories': {str(pk): name for pk, name in index.categories.items()},
+    }
+
+    sections = {
+        'meta': json.dumps(meta).encode('utf-8'),
+        'doc_ids': _pack('q', doc_ids),
+        'doc_length': _pack('f', [index.doc_lengths[pk] for pk in doc_ids]),
+        'doc_price': _pack('d', [doc.price for doc in docs]),
+        'doc_rating': _pack('f', [doc.rating for doc in docs]),
+        'doc_reviews': _pack('I', [doc.review_count for doc in docs]),
+        'doc_created': _pack('d', [doc.created_at for doc in docs]),
+        'doc_category': _pack('q', [doc.category_id for doc in docs]),
+        'doc_flags': _pack('B', [
+            (FLAG_IN_STOCK if doc.in_stock else 0) | (FLAG_FEATURED if doc.is_featured else 0)
+            for doc in docs
+        ]),
+        'doc_names': bytes(names),
+        'doc_name_off': _pack('I', name_offsets),
+        'terms': bytes(term_blob),
+        'term_off': _pack('I', term_offsets),
+        'post_off': _pack('I', post_offsets),
+        'post_ids': _pack('q', post_ids),
+        'post_weight': _pack('f', post_weights),
+    }
+
+    offset = HEADER.size + SECTION.size * len(sections)
+    table = []
+    for name, data in sections.items():
+        offset += -offset % 8
+        table.append((name, offset, len(data)))
+        offset += len(data)
+
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as output:
+        output.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(sections)))
+        for name, section_offset, length in table:
+            output.write(SECTION.pack(name.encode('ascii'), section_offset, length))
+        for name, section_offset, _ in table:
+            output.write(b'\0' * (section_offset - output.tell()))
+            output.write(sections[name])
+    os.replace(temp_path, path)
+    return len(doc_ids)
+
+
+class SnapshotSegment:
+    """Read-only search postings and doc data backed by the mapped file"""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        views = snapshot.views
+        self.doc_ids = views['doc_ids']
+        self.doc_lengths = views['doc_length']
+        self.term_offsets = views['term_off']
+        self.terms = views['terms']
+        self.post_offsets = views['post_off']
+        self.post_ids = views['post_ids']
+        self.post_weights = views['post_weight']
+        self.term_count = len(self.term_offsets) - 1
+        self.doc_count = snapshot.meta['doc_count']
+        self.total_length = snapshot.meta['total_length']
+
+    def _term(self, position):
+        return bytes(self.terms[self.term_offsets[position]:self.term_offsets[position + 1]])
+
+    def _find_term(self, encoded):
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def has_term(self, term):
+        encoded = term.encode('utf-8')
+        position = self._find_term(encoded)
+        return position < self.term_count and self._term(position) == encoded
+
+    def terms_with_prefix(self, prefix, limit):
+        encoded = prefix.encode('utf-8')
+        position = self._find_term(encoded)
+        terms = []
+        while position < self.term_count and len(terms) < limit:
+            term = self._term(position)
+            if not term.startswith(encoded):
+                break
+            terms.append(term.decode('utf-8'))
+            position += 1
+        return terms
+
+    def postings(self, term, shadowed=()):
+        encoded = term.encode('utf-8')
+        position = self._find_term(encoded)
+        if position >= self.term_count or self._term(position) != encoded:
+            return {}
+        start, end = self.post_offsets[position], self.post_offsets[position + 1]
+        postings = dict(zip(self.post_ids[start:end], self.post_weights[start:end]))
+        if shadowed:
+            for product_id in shadowed.intersection(postings):
+                del postings[product_id]
+        return postings
+
+    def _row(self, product_id):
+        row = bisect_left(self.doc_ids, product_id)
+        if row < self.doc_count and self.doc_ids[row] == product_id:
+            return row
+        return None
+
+    def doc_length(self, product_id):
+        row = self._row(product_id)
+        return None if row is None else self.doc_lengths[row]
+
+    def doc(self, product_id):
+        row = self._row(product_id)
+        return None if row is None else self.snapshot.doc_at(row)
+
+    def doc_stats(self, product_id):
+        row = self._row(product_id)
+        if row is None:
+            return None
+        views = self.snapshot.views
+        return (
+            self.doc_lengths[row], bool(views['doc_flags'][row] & FLAG_IN_STOCK),
+            views['doc_category'][row], views['doc_price'][row],
+        )
+
+
+class CatalogSnapshot:
+    """A mapped snapshot file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as source:
+            self._mmap = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+
+        magic, version, section_count = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f'{path} is not a version {FORMAT_VERSION} catalog snapshot')
+
+        self.views = {}
+        for position in range(section_count):
+            raw_name, offset, length = SECTION.unpack_from(buffer, HEADER.size + position * SECTION.size)
+            name = raw_name.rstrip(b'\0').decode('ascii')
+            view = buffer[offset:offset + length]
+            if name in ARRAY_SECTIONS:
+                view = view.cast(ARRAY_SECTIONS[name])
+            self.views[name] = view
+
+        self.meta = json.loads(bytes(self.views['meta']))
+        self.categories = {int(pk): name for pk, name in self.meta['categories'].items()}
+        self._segment = None
+
+    @property
+    def size(self):
+        return len(self._mmap)
+
+    def search_segment(self):
+        if self._segment is None:
+            self._segment = SnapshotSegment(self)
+        return self._segment
+
+    def name_at(self, row):
+        offsets = self.views['doc_name_off']
+        return bytes(self.views['doc_names'][offsets[row]:offsets[row + 1]]).decode('utf-8')
+
+    def doc_at(self, row):
+        views = self.views
+        flags = views['doc_flags'][row]
+        return DocInfo(
+            in_stock=bool(flags & FLAG_IN_STOCK),
+            category_id=views['doc_category'][row],
+            price=views['doc_price'][row],
+            rating=views['doc_rating'][row],
+            review_count=views['doc_reviews'][row],
+            name=self.name_at(row),
+            created_at=views['doc_created'][row],
+            is_featured=bool(flags & FLAG_FEATURED),
+        )
+
+    def products(self, categories=None):
+        """
+        Lightweight product records (id, name, category, price, rating, ...)
+        for building the smaller catalog indexes without touching the DB
+        """
+        categories = categories or {}
+        for row, product_id in enumerate(self.views['doc_ids']):
+            doc = self.doc_at(row)
+            category = categories.get(doc.category_id) or SimpleNamespace(
+                id=doc.category_id, name=self.categories.get(doc.category_id, '')
+            )
+            yield SimpleNamespace(
+                id=product_id,
+                name=doc.name,
+                category_id=doc.category_id,
+                category=category,
+                price=doc.price,
+                rating=doc.rating,
+                review_count=doc.review_count,
+                in_stock=doc.in_stock,
+                is_featured=doc.is_featured,
+            )
+
+    def catalog_changes(self):
+        """
+        Products changed since the snapshot was written, and ids of products
+        deleted since, so indexes loaded from it can catch up.
+        """
+        from django.utils.dateparse import parse_datetime
+        from .models import Product
+
+        products = Product.objects.select_related('category')
+        max_updated = self.meta['max_updated_at']
+        if max_updated:
+            products = products.filter(updated_at__gt=parse_datetime(max_updated))
+        changed = list(products)
+
+        current = set(Product.objects.values_list('id', flat=True))
+        removed = [pk for pk in self.views['doc_ids'] if pk not in current]
+        return changed, removed
+
+
+def catalog_products():
+    """
+    Current catalog for building the in-memory indexes: snapshot records
+    plus products changed since the snapshot, or the database when no
+    snapshot is available.
+    """
+    from .models import Category, Product
+
+    snapshot = get_snapshot()
+    if snapshot is None:
+        yield from Product.objects.select_related('category').defer(
+            'description', 'features'
+        ).iterator(chunk_size=2000)
+        return
+
+    categories = {category.id: category for category in Category.objects.all()}
+    changed, removed = snapshot.catalog_changes()
+    skip = set(removed) | {product.id for product in changed}
+    for product in snapshot.products(categories):
+        if product.id not in skip:
+            yield product
+    yield from changed
+
+
+_snapshot = None
+_snapshot_loaded = False
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """The mapped snapshot for this process, or None if there is none"""
+    global _snapshot, _snapshot_loaded
+    if _snapshot_loaded:
+        return _snapshot
+    with _snapshot_lock:
+        if not _snapshot_loaded:
+            path = snapshot_path()
+            if path and os.path.exists(path):
+                try:
+                    _snapshot = CatalogSnapshot(path)
+                except (OSError, ValueError, KeyError) as error:
+                    logger.warning('Ignoring catalog snapshot %s: %s', path, error)
+            _snapshot_loaded = True
+    return _snapshot
+
+
+def reset_snapshot():
+    """Forget the mapped snapshot so the next index build maps the file again"""
+    global _snapshot, _snapshot_loaded
+    with _snapshot_lock:
+        _snapshot = None
+        _snapshot_loaded = False
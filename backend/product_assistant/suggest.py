@@ -0,0 +1,229 @@
+"""
+Typeahead suggestions from an in-memory prefix index.
+
+Every word position of product names, category names and popular search
+queries is stored in one sorted array, so the completions for a prefix are
+a contiguous slice found by binary search. Products are weighted by rating
+and review count; completions for one- and two-letter prefixes, whose
+slices are large, are memoized until the index changes.
+"""
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+
+from . import index_sync
+
+NON_WORD_RE = re.compile(r'[^a-z0-9]+')
+
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+
+# Memoize results for prefixes up to this length
+SHORT_PREFIX_LENGTH = 2
+
+# Categories are broad matches and should come before individual products
+CATEGORY_WEIGHT = 50.0
+
+# A search query becomes a suggestion once it has been run this many times
+POPULAR_QUERY_MIN_COUNT = 3
+MAX_POPULAR_QUERIES = 5000
+QUERY_WEIGHT_PER_HIT = 0.5
+MAX_QUERY_WEIGHT = 40.0
+
+
+def normalize(text):
+    return NON_WORD_RE.sub(' ', text.lower()).strip()
+
+
+def product_weight(product):
+    return float(product.rating) * math.log1p(product.review_count) + 1.0
+
+
+class SuggestIndex:
+    """Sorted-array prefix index over names and popular queries"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self.query_counts = Counter()
+        self._reset()
+
+    def _reset(self):
+        self.keys = []           # sorted (suffix text, entry key)
+        self.entries = {}        # entry key -> suggestion dict
+        self.weights = {}        # entry key -> weight
+        self.entry_keys = {}     # entry key -> suffixes stored in self.keys
+        self._short_cache = {}
+
+    def build(self):
+        index_sync.start()
+        from .models import Category
+        from .snapshot import catalog_products
+
+        with self._lock:
+            self._reset()
+            for category in Category.objects.only('id', 'name'):
+                self._add(('category', category.id), category.name, CATEGORY_WEIGHT,
+                          {'type': 'category', 'id': category.id, 'text': category.name})
+            for product in catalog_products():
+                if product.in_stock:
+                    self._add_product(product)
+            for query, count in self.query_counts.items():
+                if count >= POPULAR_QUERY_MIN_COUNT:
+                    self._add_query(query, count)
+            self.keys.sort()
+            self._built = True
+
+    @property
+    def is_built(self):
+        return self._built
+
+    def ensure_built(self):
+        # Changes committed elsewhere since this process last looked
+        index_sync.catch_up()
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self.build()
+        return self
+
+    def _suffixes(self, text):
+        text = normalize(text)
+        suffixes = [text] if text else []
+        for match in re.finditer(r' ', text):
+            suffixes.append(text[match.end():])
+        return suffixes
+
+    def _add(self, entry_key, text, weight, entry, sort=False):
+        suffixes = self._suffixes(text)
+        self.entries[entry_key] = entry
+        self.weights[entry_key] = weight
+        self.entry_keys[entry_key] = suffixes
+        for suffix in suffixes:
+            if sort:
+                insort(self.keys, (suffix, entry_key))
+            else:
+                self.keys.append((suffix, entry_key))
+
+    def _remove(self, entry_key):
+        suffixes = self.entry_keys.pop(entry_key, None)
+        if suffixes is None:
+            return
+        for suffix in suffixes:
+            index = bisect_left(self.keys, (suffix, entry_key))
+            if index < len(self.keys) and self.keys[index] == (suffix, entry_key):
+                del self.keys[index]
+        self.entries.pop(entry_key, None)
+        self.weights.pop(entry_key, None)
+
+    def _add_product(self, product, sort=False):
+        self._add(('product', product.id), product.name, product_weight(product), {
+            'type': 'product',
+            'id': product.id,
+            'text': product.name,
+            'category': product.category.name,
+        }, sort=sort)
+
+    def _add_query(self, query, count, sort=False):
+        weight = min(count * QUERY_WEIGHT_PER_HIT, MAX_QUERY_WEIGHT)
+        self._add(('query', query), query, weight, {'type': 'query', 'text': query}, sort=sort)
+
+    # Incremental maintenance
+
+    def add_product(self, product):
+        if not self._built:
+            return
+        with self._lock:
+            self._remove(('product', product.id))
+            if product.in_stock:
+                self._add_product(product, sort=True)
+            self._short_cache = {}
+
+    def remove_product(self, product_id):
+        if not self._built:
+            return
+        with self._lock:
+            self._remove(('product', product_id))
+            self._short_cache = {}
+
+    def add_category(self, category):
+        if not self._built:
+            return
+        with self._lock:
+            self._remove(('category', category.id))
+            self._add(('category', category.id), category.name, CATEGORY_WEIGHT,
+                      {'type': 'category', 'id': category.id, 'text': category.name}, sort=True)
+            for product in category.products.filter(in_stock=True).select_related('category'):
+                self.add_product(product)
+            self._short_cache = {}
+
+    def remove_category(self, category_id):
+        if not self._built:
+            return
+        with self._lock:
+            self._remove(('category', category_id))
+            self._short_cache = {}
+
+    def record_query(self, query):
+        """Count a search that returned results; frequent ones become suggestions"""
+        query = normalize(query)
+        if not query:
+            return
+        with self._lock:
+            if query not in self.query_counts and len(self.query_counts) >= MAX_POPULAR_QUERIES:
+                return
+            self.query_counts[query] += 1
+            count = self.query_counts[query]
+            if not self._built or count < POPULAR_QUERY_MIN_COUNT:
+                return
+            weight = min(count * QUERY_WEIGHT_PER_HIT, MAX_QUERY_WEIGHT)
+            entry_key = ('query', query)
+            if entry_key in self.weights:
+                if self.weights[entry_key] != weight:
+                    self.weights[entry_key] = weight
+                    self._short_cache = {}
+                return
+            self._add_query(query, count, sort=True)
+            self._short_cache = {}
+
+    # Lookup
+
+    def suggest(self, prefix, limit=DEFAULT_LIMIT):
+        """Best ``limit`` completions for a typed prefix"""
+        self.ensure_built()
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        with self._lock:
+            short = len(prefix) <= SHORT_PREFIX_LENGTH
+            if short and prefix in self._short_cache:
+                ranked = self._short_cache[prefix]
+            else:
+                start = bisect_left(self.keys, (prefix,))
+                end = bisect_left(self.keys, (prefix + '\uffff',), start)
+                matched = {entry_key for _, entry_key in self.keys[start:end]}
+                ranked = heapq.nlargest(
+                    MAX_LIMIT, matched,
+                    key=lambda entry_key: (self.weights[entry_key], entry_key[0] != 'query'),
+                )
+                if short:
+                    self._short_cache[prefix] = ranked
+
+        suggestions = []
+        seen = set()
+        for entry_key in ranked:
+            entry = self.entries.get(entry_key)
+            if entry is None or entry['text'].lower() in seen:
+                continue
+            seen.add(entry['text'].lower())
+            suggestions.append(entry)
+            if len(suggestions) == limit:
+                break
+        return suggestions
+
+
+suggest_index = SuggestIndex()
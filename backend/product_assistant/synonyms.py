@@ -0,0 +1,129 @@
+"""
+Synonym and transliteration rewriting for search queries.
+
+Admin-edited ``SearchSynonym`` rows are compiled into an Aho-Corasick
+automaton, so a query is rewritten in a single pass over its characters no
+matter how many phrases the dictionary holds. The compiled automaton is
+kept in each worker's L1 cache without a TTL and rebuilt only when an edit
+is broadcast.
+"""
+import re
+from collections import deque
+
+from . import local_cache
+
+NON_WORD_RE = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(text):
+    """Lowercase and collapse everything but letters and digits to single spaces"""
+    return NON_WORD_RE.sub(' ', text.lower()).strip()
+
+
+class SynonymAutomaton:
+    """Aho-Corasick automaton replacing whole-word phrases"""
+
+    def __init__(self, mapping):
+        self.goto = [{}]
+        self.fail = [0]
+        # Phrases ending at each state (longest first): (length, replacement)
+        self.outputs = [[]]
+        for phrase, replacement in mapping.items():
+            phrase = normalize(phrase)
+            if phrase:
+                self._insert(phrase, normalize(replacement))
+        self._link()
+
+    def __len__(self):
+        return len(self.goto)
+
+    def _insert(self, phrase, replacement):
+        state = 0
+        for ch in phrase:
+            next_state = self.goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][ch] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+            state = next_state
+        self.outputs[state] = [(len(phrase), replacement)]
+
+    def _link(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(ch, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fail[next_state]]
+
+    def rewrite(self, text):
+        """
+        Replace every dictionary phrase found on word boundaries. Overlaps are
+        resolved leftmost-longest. Returns the normalized, rewritten text.
+        """
+        text = normalize(text)
+        if len(self.goto) == 1 or not text:
+            return text
+
+        matches = []
+        state = 0
+        last = len(text) - 1
+        for end, ch in enumerate(text):
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            if not self.outputs[state] or (end != last and text[end + 1] != ' '):
+                continue
+            for length, replacement in self.outputs[state]:
+                start = end - length + 1
+                if start == 0 or text[start - 1] == ' ':
+                    matches.append((start, end + 1, replacement))
+
+        if not matches:
+            return text
+
+        matches.sort(key=lambda match: (match[0], match[0] - match[1]))
+        parts = []
+        position = 0
+        for start, end, replacement in matches:
+            if start < position:
+                continue
+            parts.append(text[position:start])
+            parts.append(replacement)
+            position = end
+        parts.append(text[position:])
+        return ' '.join(''.join(parts).split())
+
+
+AUTOMATON_KEY = ('synonyms', 'automaton')
+
+
+def _compile():
+    from .models import SearchSynonym
+
+    mapping = dict(
+        SearchSynonym.objects.filter(is_active=True).values_list('phrase', 'replacement')
+    )
+    return SynonymAutomaton(mapping)
+
+
+def get_automaton():
+    """Compiled automaton for the active dictionary, rebuilt only on change"""
+    return local_cache.cached(AUTOMATON_KEY, _compile, ttl=None)
+
+
+def invalidate():
+    """Called when the dictionary changes: recompile in every worker"""
+    local_cache.invalidate(AUTOMATON_KEY[0])
+
+
+def expand_query(query):
+    """Rewrite colloquial and transliterated phrases into catalog wording"""
+    return get_automaton().rewrite(query)
@@ -0,0 +1,225 @@
+"""
+Trending products from sliding-window activity counters.
+
+Product views, add-to-carts and ordered items are counted per product in
+hourly buckets. Recording only increments a counter in the worker's
+memory; the buffer is written to Redis as one pipelined batch of HINCRBYs
+(a hash per event and hour, expiring when it leaves the window) every
+``TRENDING_FLUSH_SECONDS`` or ``FLUSH_SIZE`` counters, so a page view never
+writes to the database or waits for Redis.
+
+``roll_up()`` sums the buckets of the last ``TRENDING_WINDOW_HOURS``, with
+an order weighing more than an add-to-cart and an add-to-cart more than a
+view, and a bucket's weight halving every ``TRENDING_HALF_LIFE_HOURS``. It
+stores the top ``TRENDING_LIST_SIZE`` in-stock products in the cache.
+``trending_ids()`` rolls up again once the list is
+``TRENDING_ROLLUP_INTERVAL`` seconds old (one worker at a time), and
+``manage.py roll_up_trending`` does it on demand. Without Redis (tests,
+locmem cache) the counters stay in the process.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from redis.exceptions import RedisError
+
+from . import single_flight
+from .cache_backend import redis_client
+
+logger = logging.getLogger(__name__)
+
+BUCKET_KEY_PREFIX = 'trending:counts'
+LIST_KEY = 'trending:list'
+LOCK_KEY = 'trending:lock'
+
+# Event -> weight in the trending score
+EVENTS = {'view': 1, 'cart': 5, 'order': 10}
+
+BUCKET_SECONDS = 3600
+
+# Distinct buffered counters that force a flush
+FLUSH_SIZE = 1000
+
+# Seconds the rolled-up list is kept (it is replaced much sooner)
+LIST_TTL = 86400
+
+# Products per response unless ?limit= says otherwise
+DEFAULT_LIMIT = 10
+
+
+def window_hours():
+    return getattr(settings, 'TRENDING_WINDOW_HOURS', 24)
+
+
+def half_life_hours():
+    return getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 6)
+
+
+def list_size():
+    return getattr(settings, 'TRENDING_LIST_SIZE', 50)
+
+
+def flush_seconds():
+    return getattr(settings, 'TRENDING_FLUSH_SECONDS', 5)
+
+
+def rollup_interval():
+    return getattr(settings, 'TRENDING_ROLLUP_INTERVAL', 60)
+
+
+def featured_enabled():
+    return getattr(settings, 'FEATURED_FROM_TRENDING', False)
+
+
+def current_bucket(now=None):
+    return int((time.time() if now is None else now) // BUCKET_SECONDS)
+
+
+def bucket_key(event, bucket):
+    return f'{BUCKET_KEY_PREFIX}:{event}:{bucket}'
+
+
+# Recording
+
+_buffer = Counter()          # (event, bucket, product id) -> count
+_buffer_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+# Counters of the buckets in the window when there is no Redis
+_local_counts = defaultdict(Counter)
+
+
+def record(event, product_id, amount=1):
+    """Count a view, add-to-cart or ordered item of a product"""
+    global _flushed_at
+    with _buffer_lock:
+        _buffer[(event, current_bucket(), product_id)] += amount
+        if len(_buffer) < FLUSH_SIZE and time.monotonic() - _flushed_at < flush_seconds():
+            return
+        pending = dict(_buffer)
+        _buffer.clear()
+        _flushed_at = time.monotonic()
+    _write(pending)
+
+
+def flush():
+    """Write this process's buffered counters now"""
+    global _flushed_at
+    with _buffer_lock:
+        pending = dict(_buffer)
+        _buffer.clear()
+        _flushed_at = time.monotonic()
+    if pending:
+        _write(pending)
+
+
+atexit.register(flush)
+
+
+def _write(pending):
+    oldest = current_bucket() - window_hours() + 1
+    client = redis_client()
+    if client is None:
+        for (event, bucket, product_id), count in pending.items():
+            _local_counts[(event, bucket)][product_id] += count
+        for key in [key for key in _local_counts if key[1] < oldest]:
+            del _local_counts[key]
+        return
+    try:
+        with client.pipeline(transaction=False) as pipe:
+            for (event, bucket, product_id), count in pending.items():
+                pipe.hincrby(bucket_key(event, bucket), product_id, count)
+            for event, bucket in {(event, bucket) for event, bucket, _ in pending}:
+                # Dropped once the bucket has left the window
+                pipe.expireat(bucket_key(event, bucket), (bucket + 1 + window_hours()) * BUCKET_SECONDS)
+            pipe.execute()
+    except RedisError as error:
+        logger.warning('Could not record trending counters: %s', error)
+
+
+# Roll-up
+
+def window_counts(now=None):
+    """``{(event, age in hours): {product id: count}}`` of the window"""
+    current = current_bucket(now)
+    keys = [(event, bucket) for event in EVENTS for bucket in range(current - window_hours() + 1, current + 1)]
+    client = redis_client()
+    if client is None:
+        return {(event, current - bucket): dict(_local_counts.get((event, bucket), {})) for event, bucket in keys}
+    with client.pipeline(transaction=False) as pipe:
+        for event, bucket in keys:
+            pipe.hgetall(bucket_key(event, bucket))
+        results = pipe.execute()
+    return {
+        (event, current - bucket): {int(product_id): int(count) for product_id, count in counts.items()}
+        for (event, bucket), counts in zip(keys, results)
+    }
+
+
+def scores(now=None):
+    """``{product id: trending score}`` of the products with activity in the window"""
+    totals = defaultdict(float)
+    half_life = half_life_hours()
+    for (event, age), counts in window_counts(now).items():
+        weight = EVENTS[event] * 0.5 ** (age / half_life)
+        for product_id, count in counts.items():
+            totals[product_id] += weight * count
+    return totals
+
+
+def roll_up():
+    """Rank the window's activity and store the list; returns ``[(product id, score), ...]``"""
+    from .models import Product
+
+    flush()
+    totals = scores()
+    ranked = sorted(totals, key=lambda product_id: (-totals[product_id], product_id))
+    size = list_size()
+    top = []
+    # In-stock check a few candidates at a time, best first
+    for start in range(0, len(ranked), size * 4):
+        candidates = ranked[start:start + size * 4]
+        in_stock = set(Product.objects.filter(pk__in=candidates, in_stock=True).values_list('id', flat=True))
+        top.extend((product_id, totals[product_id]) for product_id in candidates if product_id in in_stock)
+        if len(top) >= size:
+            break
+    top = top[:size]
+    try:
+        cache.set(LIST_KEY, {'ids': [product_id for product_id, _ in top], 'built_at': time.time()}, LIST_TTL)
+    except RedisError as error:
+        logger.warning('Could not store trending products: %s', error)
+    return top
+
+
+def _refresh(state):
+    """Roll up unless another worker is at it and there is a list to serve"""
+    token = single_flight.acquire(LOCK_KEY)
+    if token is None and state is not None:
+        return None
+    try:
+        return [product_id for product_id, _ in roll_up()]
+    finally:
+        if token is not None:
+            single_flight.release(LOCK_KEY, token)
+
+
+def trending_ids():
+    """Ids of the trending in-stock products, best first"""
+    try:
+        state = cache.get(LIST_KEY)
+    except RedisError as error:
+        logger.warning('Trending products cache unavailable: %s', error)
+        return []
+    if state is None or time.time() - state['built_at'] >= rollup_interval():
+        try:
+            ids = single_flight.flight.do(LIST_KEY, lambda: _refresh(state))
+        except RedisError as error:
+            logger.warning('Could not roll up trending products: %s', error)
+            ids = None
+        if ids is not None:
+            return ids
+    return state['ids'] if state is not None else []
@@ -5,8 +5,16 @@ urlpatterns = [
     path('categories/', views.CategoryListView.as_view(), name='category-list'),
     path('', views.ProductListView.as_view(), name='product-list'),
     path('<int:pk>/', views.ProductDetailView.as_view(), name='product-detail'),
+    path('<int:pk>/reviews/', views.product_reviews, name='product-reviews'),
+    path('<int:pk>/bought-together/', views.product_bought_together, name='product-bought-together'),
+    path('<int:pk>/similar/', views.similar_products, name='similar-products'),
+    path('batch/', views.product_batch, name='product-batch'),
+    path('suggest/', views.product_suggestions, name='product-suggestions'),
+    path('changes/', views.catalog_changes, name='catalog-changes'),
+    path('cache-stats/', views.catalog_cache_stats, name='catalog-cache-stats'),
     path('featured/', views.FeaturedProductsView.as_view(), name='featured-products'),
     path('recommendations/', views.product_recommendations, name='product-recommendations'),
+    path('trending/', views.trending_products, name='trending-products'),
     path('search/voice/', views.voice_search, name='voice-search'),
     path('category/<str:category_name>/', views.category_products, name='category-products'),
 ]
\ No newline at end of file
@@ -1,22 +1,67 @@
+from itertools import islice
+
+from django.db import IntegrityError
+from django.db.models import Count, Max
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from rest_framework import generics, status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
-from django.db.models import Q
+from rest_framework.utils.encoders import JSONEncoder
 from .models import Category, Product, ProductReview
 from .serializers import (
     CategorySerializer, ProductSerializer, ProductDetailSerializer,
-    ProductReviewSerializer
+    ProductRatingSerializer, ProductReviewSerializer, recent_reviews_prefetch
 )
+from .search import product_index, search_products
+from .fuzzy import fuzzy_index
+from .synonyms import expand_query
+from .suggest import suggest_index, DEFAULT_LIMIT, MAX_LIMIT
+from .facets import facet_index, filters_from_params, parse_bool
+from .pagination import ProductCursorPagination, ReviewCursorPagination, order_products
+from .conditional import make_etag, timestamp
+from .fragments import JSONFragments, product_cards, product_cards_for_ids
+from .ratings import AGGREGATE_FIELDS, BASELINE_FIELDS
+from .response_cache import CachedResponseMixin
+from . import bought_together, changes, query_cache, ranking, response_cache, segments, similar, trending
+
+# Filters only the facet index can answer; category and max_price alone
+# still go through the ORM
+INDEXED_FILTERS = ('price', 'min_rating', 'in_stock', 'featured')
+
+# Products per /api/products/batch/ request
+MAX_BATCH_SIZE = 100
+
+# Rows fetched and serialized at a time by streamed category listings
+STREAM_CHUNK_SIZE = 200
 
-class CategoryListView(generics.ListAPIView):
+class CategoryListView(CachedResponseMixin, generics.ListAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    cache_endpoint = 'categories'
+    local_cache = True
+    # Validated by the category rows: edits and in-stock count changes
+    # (counters.py) both bump Category.updated_at
 
-class ProductListView(generics.ListAPIView):
+class ProductCardListMixin:
+    """List products as pre-rendered cards instead of serializing each row"""
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(product_cards(page))
+        return Response(product_cards(queryset))
+
+class ProductListView(CachedResponseMixin, ProductCardListMixin, generics.ListAPIView):
     serializer_class = ProductSerializer
+    cache_endpoint = 'products'
+    # Keyset pagination: the paginator applies the ?sort= order (plus id)
+    pagination_class = ProductCursorPagination
     
     def get_queryset(self):
-        queryset = Product.objects.filter(in_stock=True)
+        queryset = Product.objects.select_related('category').filter(in_stock=True)
         
         # Filter by category
         category = self.request.query_params.get('category')
@@ -31,49 +76,328 @@ class ProductListView(generics.ListAPIView):
             except ValueError:
                 pass
         
-        # Search functionality
-        search = self.request.query_params.get('search')
+        return queryset
+    
+    def uses_index(self, params):
+        return bool(
+            params.get('search') or parse_bool(params.get('facets'))
+            or any(params.get(name) for name in INDEXED_FILTERS)
+        )
+    
+    def validator_queryset(self):
+        if self.uses_index(self.request.query_params):
+            return Product.objects.all()
+        return super().validator_queryset()
+    
+    def cache_hit(self, request, data):
+        search = request.query_params.get('search')
+        if search and data.get('results'):
+            suggest_index.record_query(search)
+    
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        if not self.uses_index(params):
+            return super().list(request, *args, **kwargs)
+        search = params.get('search')
+        want_facets = parse_bool(params.get('facets'))
+        
+        # Search and facet filters are answered from the in-memory indexes;
+        # only the products on the requested page are loaded from the database.
+        product_ids = None
         if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) | 
-                Q(description__icontains=search)
-            )
+            product_ids = search_products(expand_query(search))
+        product_ids, facets = facet_index.select(
+            filters_from_params(params), product_ids, with_counts=bool(want_facets)
+        )
         
-        # Sort functionality
-        sort_by = self.request.query_params.get('sort')
-        if sort_by == 'price_low':
-            queryset = queryset.order_by('price')
-        elif sort_by == 'price_high':
-            queryset = queryset.order_by('-price')
-        elif sort_by == 'rating':
-            queryset = queryset.order_by('-rating')
-        elif sort_by == 'name':
-            queryset = queryset.order_by('name')
+        # Search hits stay in relevance order unless a sort is requested
+        sort_key = None
+        if not search or params.get('sort'):
+            sort_by = self.paginator.get_sort(request)
+            product_ids = product_index.sort_ids(product_ids, sort_by)
+            sort_key = product_index.sort_key(sort_by)
         
-        return queryset
+        if search and product_ids:
+            suggest_index.record_query(search)
+        
+        page = self.paginator.paginate_ids(product_ids, request, sort_key)
+        response = self.get_paginated_response(product_cards_for_ids(page))
+        if facets is not None:
+            response.data['facets'] = facets
+        return response
 
-class ProductDetailView(generics.RetrieveAPIView):
-    queryset = Product.objects.all()
+class ProductDetailView(CachedResponseMixin, generics.RetrieveAPIView):
+    queryset = Product.objects.select_related('category')
     serializer_class = ProductDetailSerializer
+    cache_endpoint = 'product'
+    
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            trending.record('view', self.kwargs['pk'])
+        return response
+    
+    def get_validators(self, params):
+        row = Product.objects.filter(pk=self.kwargs['pk']).aggregate(
+            updated_at=Max('updated_at'),
+            review_count=Count('reviews'),
+            reviewed_at=Max('reviews__created_at'),
+        )
+        if row['updated_at'] is None:
+            return None, None
+        return product_validators(params, row['updated_at'], row['review_count'], row['reviewed_at'])
+
+def product_validators(params, updated_at, review_count, reviewed_at):
+    """
+    ETag and Last-Modified of a product detail response. The body embeds
+    the latest reviews, which only have created_at.
+    """
+    last_modified = max(filter(None, (updated_at, reviewed_at)))
+    etag = make_etag(
+        ProductDetailView.cache_endpoint, params, response_cache.validator_version(),
+        last_modified.isoformat(), review_count,
+    )
+    return etag, timestamp(last_modified)
 
-class FeaturedProductsView(generics.ListAPIView):
-    queryset = Product.objects.filter(is_featured=True, in_stock=True)
+class FeaturedProductsView(CachedResponseMixin, ProductCardListMixin, generics.ListAPIView):
+    queryset = Product.objects.select_related('category').filter(is_featured=True, in_stock=True)
     serializer_class = ProductSerializer
+    cache_endpoint = 'featured'
+    local_cache = True
+    
+    def get(self, request, *args, **kwargs):
+        # With FEATURED_FROM_TRENDING the trending list replaces the
+        # hand-picked products (it changes with every roll-up, so it is
+        # not kept in the response cache)
+        if trending.featured_enabled():
+            product_ids = trending.trending_ids()
+            if product_ids:
+                page = self.paginate_queryset(product_ids)
+                return self.get_paginated_response(product_cards_for_ids(page))
+        return super().get(request, *args, **kwargs)
+
+@api_view(['GET'])
+def product_batch(request):
+    """
+    Product details for ``?ids=3,1,2`` in one round trip, in the order
+    requested; unknown ids are listed under ``not_found``
+    """
+    try:
+        product_ids = list(dict.fromkeys(
+            int(value) for value in request.query_params.get('ids', '').split(',') if value.strip()
+        ))
+    except ValueError:
+        return Response({'error': 'ids must be a comma-separated list of product ids'},
+                       status=status.HTTP_400_BAD_REQUEST)
+    if len(product_ids) > MAX_BATCH_SIZE:
+        return Response({'error': f'At most {MAX_BATCH_SIZE} ids per request'},
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    # Shares cache entries with the detail endpoint (same params per id)
+    host = request.get_host()
+    params = {product_id: f'{host}?pk={product_id}' for product_id in product_ids}
+    version = response_cache.current_version()
+    cached = response_cache.fetch_many(ProductDetailView.cache_endpoint, params.values(), version)
+    details = {product_id: cached[params[product_id]][0]
+               for product_id in product_ids if params[product_id] in cached}
+    
+    missing = [product_id for product_id in product_ids if product_id not in details]
+    if missing:
+        products = (
+            Product.objects.filter(id__in=missing)
+            .select_related('category')
+            .annotate(review_total=Count('reviews'), reviewed_at=Max('reviews__created_at'))
+            .prefetch_related(recent_reviews_prefetch())
+        )
+        entries = {}
+        for product in products:
+            data = ProductDetailSerializer(product).data
+            details[product.id] = data
+            entries[params[product.id]] = (data, *product_validators(
+                params[product.id], product.updated_at, product.review_total, product.reviewed_at
+            ))
+        response_cache.store_many(ProductDetailView.cache_endpoint, entries, version)
+    
+    return Response({
+        'results': [details[product_id] for product_id in product_ids if product_id in details],
+        'not_found': [product_id for product_id in product_ids if product_id not in details],
+    })
+
+@api_view(['GET', 'POST'])
+def product_reviews(request, pk):
+    """
+    A product's reviews, newest first and cursor paginated; POST submits
+    the signed-in user's review (or replaces their earlier one)
+    """
+    product = get_object_or_404(Product.objects.only('id'), pk=pk)
+    
+    if request.method == 'GET':
+        paginator = ReviewCursorPagination()
+        page = paginator.paginate_queryset(product.reviews.select_related('user'), request)
+        return paginator.get_paginated_response(ProductReviewSerializer(page, many=True).data)
+    
+    if not request.user.is_authenticated:
+        return Response({
+            'error': 'Authentication required'
+        }, status=status.HTTP_401_UNAUTHORIZED)
+    
+    review = ProductReview.objects.filter(product=product, user=request.user).first()
+    serializer = ProductReviewSerializer(review, data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        # Updates the product's rating aggregates in the same transaction
+        serializer.save(product=product, user=request.user)
+    except IntegrityError:
+        return Response({
+            'error': 'Review already submitted'
+        }, status=status.HTTP_409_CONFLICT)
+    
+    product.refresh_from_db(fields=AGGREGATE_FIELDS + BASELINE_FIELDS)
+    return Response({
+        'review': serializer.data,
+        'product': ProductRatingSerializer(product).data
+    }, status=status.HTTP_200_OK if review else status.HTTP_201_CREATED)
 
 @api_view(['GET'])
 def product_recommendations(request):
     """
-    Get personalized product recommendations based on user preferences
+    Top-rated products, overall or in ``?category=``, from the precomputed
+    Bayesian-average ranking (see ranking.py); signed-in shoppers get their
+    segment's list without products they ordered or wishlisted (see
+    segments.py). ``?limit=`` sets how many
+    """
+    try:
+        limit = min(int(request.query_params.get('limit', ranking.DEFAULT_LIMIT)), ranking.list_size())
+    except ValueError:
+        limit = ranking.DEFAULT_LIMIT
+    
+    category_id = None
+    category_name = request.query_params.get('category')
+    if category_name:
+        category = Category.objects.filter(name__iexact=category_name).only('id').first()
+        if category is None:
+            return Response({'error': 'Category not found'}, 
+                           status=status.HTTP_404_NOT_FOUND)
+        category_id = category.id
+    elif request.user.is_authenticated:
+        return Response(product_cards_for_ids(segments.recommended_ids(request.user, max(limit, 1))))
+    
+    return Response(product_cards_for_ids(ranking.ranked_ids(category_id)[:max(limit, 1)]))
+
+@api_view(['GET'])
+def product_bought_together(request, pk):
+    """
+    In-stock products most often ordered together with this one (see
+    bought_together.py); ``?limit=`` sets how many
+    """
+    try:
+        limit = min(int(request.query_params.get('limit', bought_together.DEFAULT_LIMIT)),
+                    bought_together.list_size())
+    except ValueError:
+        limit = bought_together.DEFAULT_LIMIT
+    
+    product_ids = bought_together.related_ids(pk, max(limit, 1))
+    if not product_ids and not Product.objects.filter(pk=pk).exists():
+        return Response({'error': 'Product not found'}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    return Response(product_cards_for_ids(product_ids))
+
+@api_view(['GET'])
+def trending_products(request):
+    """
+    Products with the most views, add-to-carts and orders lately (see
+    trending.py); ``?limit=`` sets how many
+    """
+    try:
+        limit = min(int(request.query_params.get('limit', trending.DEFAULT_LIMIT)), trending.list_size())
+    except ValueError:
+        limit = trending.DEFAULT_LIMIT
+    
+    return Response(product_cards_for_ids(trending.trending_ids()[:max(limit, 1)]))
+
+@api_view(['GET'])
+def similar_products(request, pk):
+    """
+    In-stock products most similar to this one by name, description,
+    features and category (see similar.py); ``?limit=`` sets how many
+    """
+    try:
+        limit = min(int(request.query_params.get('limit', similar.DEFAULT_LIMIT)), similar.list_size())
+    except ValueError:
+        limit = similar.DEFAULT_LIMIT
+    
+    product_ids = similar.similar_ids(pk, max(limit, 1))
+    if not product_ids and not Product.objects.filter(pk=pk).exists():
+        return Response({'error': 'Product not found'}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    return Response(product_cards_for_ids(product_ids))
+
+@api_view(['GET'])
+def catalog_changes(request):
+    """
+    Products and categories changed since ``?since=<cursor>`` plus the ids
+    of deleted ones, for clients that keep a local copy of the catalog
+    """
+    try:
+        limit = min(int(request.query_params.get('limit', changes.DEFAULT_LIMIT)), changes.MAX_LIMIT)
+    except ValueError:
+        limit = changes.DEFAULT_LIMIT
+    
+    try:
+        return Response(changes.changes_since(request.query_params.get('since'), max(limit, 1)))
+    except changes.CursorExpired:
+        return Response({
+            'error': 'Cursor expired, sync the full catalog again'
+        }, status=status.HTTP_410_GONE)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def catalog_cache_stats(request):
+    """
+    Catalog response cache hit/miss counts and Redis memory use
+    """
+    return Response(response_cache.stats())
+
+@api_view(['GET'])
+def product_suggestions(request):
     """
-    # For now, return popular products
-    # In production, this would use ML algorithms
-    recommended_products = Product.objects.filter(
-        in_stock=True,
-        rating__gte=4.0
-    ).order_by('-rating', '-review_count')[:6]
+    Typeahead completions for a partial query or interim speech result
+    """
+    query = request.query_params.get('q', '')
+    try:
+        limit = min(int(request.query_params.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        limit = DEFAULT_LIMIT
     
-    serializer = ProductSerializer(recommended_products, many=True)
-    return Response(serializer.data)
+    return Response({
+        'query': query,
+        'suggestions': suggest_index.suggest(query, limit=max(limit, 1))
+    })
+
+def voice_search_results(phrase):
+    """
+    Voice search response body (without the echoed query) for a
+    normalized spoken phrase
+    """
+    # Colloquial and Hinglish phrases ("bp machine", "dawai") are rewritten
+    # into catalog wording first
+    expanded = expand_query(phrase)
+    
+    # Speech recognition often mishears words ("blood presure"), so unknown
+    # words are then mapped to the closest words in the catalog
+    did_you_mean = fuzzy_index.did_you_mean(expanded)
+    
+    # Ranked lookup in the in-memory index instead of a LIKE scan
+    product_ids = search_products(did_you_mean or expanded, in_stock=True, limit=10)
+    results = product_cards_for_ids(product_ids)
+    
+    return {
+        'did_you_mean': did_you_mean,
+        'suggestions': fuzzy_index.lookup(did_you_mean or expanded),
+        'results': results,
+        'count': len(results)
+    }
 
 @api_view(['POST'])
 def voice_search(request):
@@ -86,56 +410,114 @@ def voice_search(request):
         return Response({'error': 'No search query provided'}, 
                        status=status.HTTP_400_BAD_REQUEST)
     
-    # Simple keyword matching - in production, use NLP
-    products = Product.objects.filter(
-        Q(name__icontains=query) | 
-        Q(description__icontains=query) |
-        Q(category__name__icontains=query),
-        in_stock=True
-    )[:10]
+    # Popular phrasings are served from the shared result cache
+    phrase = query_cache.normalize_query(query)
+    results = query_cache.get_results(phrase)
+    if results is None:
+        results = voice_search_results(phrase)
+        query_cache.store_results(phrase, results)
     
-    serializer = ProductSerializer(products, many=True)
+    if results['count']:
+        query_cache.record_query(phrase)
+        suggest_index.record_query(results['did_you_mean'] or query)
     
-    return Response({
-        'query': query,
-        'results': serializer.data,
-        'count': len(serializer.data)
-    })
+    return Response({'query': query, **results})
+
+def queryset_card_chunks(products):
+    """Cards of a queryset, ``STREAM_CHUNK_SIZE`` rows read at a time"""
+    rows = products.select_related('category').iterator(chunk_size=STREAM_CHUNK_SIZE)
+    while True:
+        chunk = list(islice(rows, STREAM_CHUNK_SIZE))
+        if not chunk:
+            break
+        yield product_cards(chunk)
+
+def id_card_chunks(product_ids):
+    """Cards of products by id, ``STREAM_CHUNK_SIZE`` ids (query parameters) at a time"""
+    for start in range(0, len(product_ids), STREAM_CHUNK_SIZE):
+        yield product_cards_for_ids(product_ids[start:start + STREAM_CHUNK_SIZE])
+
+def stream_category_products(category, chunks):
+    """
+    Write a category listing out as it is read, one chunk of cards
+    at a time, so memory stays bounded however large the category is
+    """
+    # Same compact output as DRF's JSONRenderer
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    yield '{"category":%s,"products":[' % encoder.encode(category.name)
+    separator = ''
+    for cards in chunks:
+        if not cards:
+            continue
+        if not isinstance(cards, JSONFragments):
+            cards = [encoder.encode(item) for item in cards]
+        yield separator + ','.join(cards)
+        separator = ','
+    yield ']}'
 
 @api_view(['GET'])
 def category_products(request, category_name):
     """
-    Get products by category name
+    Get products by category name, cursor paginated like the product list,
+    or the whole category as a streamed JSON document with ``?stream=true``.
+    Takes the product list's facet filters, and ``facets=true`` for counts.
     """
     try:
         category = Category.objects.get(name__iexact=category_name)
-        products = Product.objects.filter(category=category, in_stock=True)
-        
-        # Apply filters
-        max_price = request.query_params.get('max_price')
-        if max_price:
-            try:
-                products = products.filter(price__lte=float(max_price))
-            except ValueError:
-                pass
-        
-        # Apply sorting
-        sort_by = request.query_params.get('sort')
-        if sort_by == 'price_low':
-            products = products.order_by('price')
-        elif sort_by == 'price_high':
-            products = products.order_by('-price')
-        elif sort_by == 'rating':
-            products = products.order_by('-rating')
-        elif sort_by == 'name':
-            products = products.order_by('name')
-        
-        serializer = ProductSerializer(products, many=True)
-        return Response({
-            'category': category.name,
-            'products': serializer.data
-        })
-        
     except Category.DoesNotExist:
         return Response({'error': 'Category not found'}, 
-                       status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+                       status=status.HTTP_404_NOT_FOUND)
+    
+    params = request.query_params
+    want_facets = parse_bool(params.get('facets'))
+    stream = parse_bool(params.get('stream'))
+    paginator = ProductCursorPagination()
+    if want_facets or any(params.get(name) for name in INDEXED_FILTERS):
+        # Facet filters are answered from the in-memory index, as in the
+        # product list
+        filters = filters_from_params(params)
+        filters['category'] = [category.name]
+        product_ids, facets = facet_index.select(filters, with_counts=bool(want_facets and not stream))
+        sort_by = paginator.get_sort(request)
+        product_ids = product_index.sort_ids(product_ids, sort_by)
+        if stream:
+            # Read in chunks: the whole category may exceed the database's
+            # limit on query parameters
+            return StreamingHttpResponse(
+                stream_category_products(category, id_card_chunks(product_ids)),
+                content_type='application/json'
+            )
+        page = paginator.paginate_ids(product_ids, request, product_index.sort_key(sort_by))
+        data = {
+            'category': category.name,
+            'next': paginator.get_next_link(),
+            'products': product_cards_for_ids(page)
+        }
+        if facets is not None:
+            data['facets'] = facets
+        return Response(data)
+    
+    products = Product.objects.filter(category=category, in_stock=True)
+    
+    # Apply filters
+    max_price = params.get('max_price')
+    if max_price:
+        try:
+            products = products.filter(price__lte=float(max_price))
+        except ValueError:
+            pass
+    
+    if stream:
+        sort_by = params.get('sort')
+        return StreamingHttpResponse(
+            stream_category_products(category, queryset_card_chunks(order_products(products, sort_by))),
+            content_type='application/json'
+        )
+    
+    # The paginator applies ?sort= (plus id) and reads one page
+    page = paginator.paginate_queryset(products.select_related('category'), request)
+    return Response({
+        'category': category.name,
+        'next': paginator.get_next_link(),
+        'products': product_cards(page)
+    })
@@ -128,7 +128,12 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 20
+    'PAGE_SIZE': 20,
+    # JSONRenderer that splices pre-rendered product cards into list bodies
+    'DEFAULT_RENDERER_CLASSES': [
+        'product_assistant.fragments.FragmentJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 # CORS settings for React frontend
@@ -149,6 +154,68 @@ RAZORPAY_KEY_SECRET = config('RAZORPAY_KEY_SECRET', default='')
 # Voice processing settings
 VOICE_PROCESSING_ENABLED = config('VOICE_PROCESSING_ENABLED', default=True, cast=bool)
 
+# Memory-mapped catalog snapshot shared by all workers (manage.py build_catalog_snapshot)
+CATALOG_SNAPSHOT_PATH = config('CATALOG_SNAPSHOT_PATH', default=str(BASE_DIR / 'catalog_snapshot.bin'))
+
+# Seconds a cached voice search response is served (also invalidated on catalog changes)
+VOICE_SEARCH_CACHE_TTL = config('VOICE_SEARCH_CACHE_TTL', default=300, cast=int)
+
+# Seconds a cached catalog API response is served (also invalidated on catalog changes)
+CATALOG_CACHE_TTL = config('CATALOG_CACHE_TTL', default=300, cast=int)
+
+# Concurrent misses of the same catalog response are built once; other
+# workers serve the previous response (kept this many seconds) meanwhile
+CATALOG_SINGLE_FLIGHT = config('CATALOG_SINGLE_FLIGHT', default=True, cast=bool)
+CATALOG_STALE_TTL = config('CATALOG_STALE_TTL', default=3600, cast=int)
+
+# In-process L1 cache for near-static reference data (entries, seconds)
+REFERENCE_CACHE_SIZE = config('REFERENCE_CACHE_SIZE', default=512, cast=int)
+REFERENCE_CACHE_TTL = config('REFERENCE_CACHE_TTL', default=300, cast=int)
+
+# Pre-rendered product cards for list responses (seconds kept in the cache)
+PRODUCT_CARD_FRAGMENTS = config('PRODUCT_CARD_FRAGMENTS', default=True, cast=bool)
+PRODUCT_CARD_TTL = config('PRODUCT_CARD_TTL', default=86400, cast=int)
+
+# Recommendations: virtual reviews at the catalog mean added to every
+# product's rating, products kept per ranked list, and seconds between
+# rebuilds after catalog changes
+RANKING_PRIOR_REVIEWS = config('RANKING_PRIOR_REVIEWS', default=25, cast=int)
+RANKED_LIST_SIZE = config('RANKED_LIST_SIZE', default=50, cast=int)
+RANKING_REBUILD_INTERVAL = config('RANKING_REBUILD_INTERVAL', default=60, cast=int)
+
+# Personalized recommendations: products kept per shopper segment
+# (manage.py build_segment_recommendations)
+SEGMENT_LIST_SIZE = config('SEGMENT_LIST_SIZE', default=100, cast=int)
+
+# Bought-together recommendations (manage.py build_bought_together):
+# products kept per product, 'cosine' or 'lift' scoring, and orders a pair
+# needs in common to count
+BOUGHT_TOGETHER_SIZE = config('BOUGHT_TOGETHER_SIZE', default=20, cast=int)
+BOUGHT_TOGETHER_SCORE = config('BOUGHT_TOGETHER_SCORE', default='cosine')
+BOUGHT_TOGETHER_MIN_ORDERS = config('BOUGHT_TOGETHER_MIN_ORDERS', default=2, cast=int)
+
+# Similar products: neighbors kept per product, hashed text vector size, and
+# seconds between background rebuilds after catalog changes
+SIMILAR_PRODUCTS_SIZE = config('SIMILAR_PRODUCTS_SIZE', default=20, cast=int)
+SIMILAR_VECTOR_DIMENSIONS = config('SIMILAR_VECTOR_DIMENSIONS', default=512, cast=int)
+SIMILAR_REBUILD_INTERVAL = config('SIMILAR_REBUILD_INTERVAL', default=300, cast=int)
+
+# Trending products: hours of activity counted, hours over which a count's
+# weight halves, products kept, seconds between counter flushes and
+# between roll-ups; FEATURED_FROM_TRENDING serves the trending list from
+# the featured endpoint instead of the hand-picked products
+TRENDING_WINDOW_HOURS = config('TRENDING_WINDOW_HOURS', default=24, cast=int)
+TRENDING_HALF_LIFE_HOURS = config('TRENDING_HALF_LIFE_HOURS', default=6, cast=float)
+TRENDING_LIST_SIZE = config('TRENDING_LIST_SIZE', default=50, cast=int)
+TRENDING_FLUSH_SECONDS = config('TRENDING_FLUSH_SECONDS', default=5, cast=int)
+TRENDING_ROLLUP_INTERVAL = config('TRENDING_ROLLUP_INTERVAL', default=60, cast=int)
+FEATURED_FROM_TRENDING = config('FEATURED_FROM_TRENDING', default=False, cast=bool)
+
+# Catalog delta sync: seconds a change must be old before it is served (so
+# slow transactions can commit), and days deletions are remembered
+CATALOG_CHANGES_SETTLE_SECONDS = config('CATALOG_CHANGES_SETTLE_SECONDS', default=2, cast=int)
+CATALOG_TOMBSTONE_RETENTION_DAYS = config('CATALOG_TOMBSTONE_RETENTION_DAYS', default=30, cast=int)
+
 # Cache configuration
 CACHES = {
     'default': {